@@ -1,77 +1,128 @@
-import io
+import hashlib
+import os
+import threading
 import typing
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 import earthkit.data as ekd
 import numpy as np
 import rasterio
-import rioxarray
-import scipy.interpolate
+import scipy.sparse
 from anemoi.inference.context import Context
 from anemoi.inference.inputs.mars import MarsInput
 from anemoi.inference.processor import Processor
 from anemoi.inference.types import Date
 from earthkit.data.sources.array_list import ArrayField
+from earthkit.data.utils.dates import to_datetime
+from rasterio.windows import Window
 from scipy.spatial import Delaunay
 
-from .interpolate import interpolate_to_grid
+from bris_adapt.orography.mosaic import (
+    Bounds,
+    OrographySource,
+    bounds_window,
+    open_orography,
+)
+
+from .grib_cache import DEFAULT_GRIB_CACHE, DEFAULT_GRIB_CACHE_SIZE, GribCache
+from .resample import RESAMPLINGS, resample_to_axes, resample_to_points
+
+DEFAULT_WEIGHTS_CACHE = os.path.join(
+    os.path.expanduser("~"), ".cache", "bris-adapt", "downscale"
+)
+INTERPOLATIONS = ("linear", "cubic")
 
 
 @dataclass
 class Topography:
-    """A simple holder for output topography data"""
+    """A simple holder for output topography data.
 
-    x_values: np.ndarray  # longitudes in a two-dimensional array
-    y_values: np.ndarray  # latitudes in a two-dimensional array
-    elevation: np.ndarray | None  # elevation in a two-dimensional array
+    For a regular raster, x_values and y_values are only the 1D axes of the grid, and
+    coordinates() gives 2D views of them. Otherwise they have the same shape as elevation.
+    """
+
+    x_values: np.ndarray  # longitudes, the x axis if regular, otherwise per point
+    y_values: np.ndarray  # latitudes, the y axis if regular, otherwise per point
+    elevation: np.ndarray | None  # elevation in the native dtype of its source
     spatial_ref: typing.Any  # rasterio.crs.CRS
+    regular: bool = False  # whether x_values and y_values are the axes of a grid
 
     @classmethod
     def from_topography_file(
-        cls, topography_file: str | io.BufferedIOBase
+        cls, topography_file: OrographySource, bounds: Bounds | None = None
     ) -> "Topography":
-        file_handle = topography_file
-        if hasattr(topography_file, "read"):
-            file_handle = rasterio.MemoryFile(topography_file)
-        topography = rioxarray.open_rasterio(file_handle)
+        """Read a topography file, directory or list of tiles.
 
-        x_values, y_values = make_two_dimensional(
-            topography["x"].values,  # type: ignore
-            topography["y"].values,  # type: ignore
-        )
-
-        if (
-            x_values.shape != y_values.shape
-            or y_values.shape != topography.values[0].shape
-        ):
-            raise ValueError("topography x, y, and elevation must have the same shape")
+        With bounds (west, south, east, north), only the window of the raster that covers
+        them is read.
+        """
+        with open_orography(topography_file, bounds) as src:
+            window = (
+                bounds_window(src, bounds)
+                if bounds is not None
+                else Window(0, 0, src.width, src.height)
+            )
+            elevation = src.read(1, window=window)
+            transform = src.window_transform(window)
+            spatial_ref = src.crs
+
+        # Coordinates of the pixel centres
+        x_values = transform.c + transform.a * (np.arange(elevation.shape[1]) + 0.5)
+        y_values = transform.f + transform.e * (np.arange(elevation.shape[0]) + 0.5)
 
         return Topography(
             x_values=x_values,
             y_values=y_values,
-            elevation=topography.values[0],  # type: ignore
-            spatial_ref=topography.spatial_ref,  # type: ignore
+            elevation=elevation,
+            spatial_ref=spatial_ref,
+            regular=True,
         )
 
     @classmethod
     def from_topography_file_to_grid(
         cls,
-        topography_file: str | io.BufferedIOBase,
+        topography_file: OrographySource,
         latitudes: np.ndarray,
         longitudes: np.ndarray,
+        resampling: str = "nearest",
     ) -> "Topography":
-        topo = cls.from_topography_file(topography_file)
+        """Resample a topography file to the points of a model grid.
 
-        assert topo.elevation is not None
-
-        values = interpolate_to_grid(
-            topo.y_values, topo.x_values, topo.elevation, latitudes, longitudes
+        If latitudes and longitudes are a regular 2D grid, the raster is resampled with GDAL,
+        using its affine transform, with one of RESAMPLINGS. Otherwise each point gets the
+        nearest raster pixel. Only the part of the topography around the grid is read.
+        """
+        if resampling not in RESAMPLINGS:
+            raise ValueError(f"resampling must be one of {', '.join(RESAMPLINGS)}")
+        axes = regular_axes(longitudes, latitudes) if latitudes.ndim == 2 else None
+        if axes is None and resampling != "nearest":
+            raise ValueError(
+                f"{resampling} resampling is only supported to regular grids"
+            )
+
+        # Pad the grid by a cell, so that the cells at its edges are completely covered
+        pad_x, pad_y = (
+            (abs(float(a[1] - a[0])) for a in axes) if axes is not None else (0.0, 0.0)
+        )
+        bounds = (
+            float(np.min(longitudes)) - pad_x,
+            float(np.min(latitudes)) - pad_y,
+            float(np.max(longitudes)) + pad_x,
+            float(np.max(latitudes)) + pad_y,
         )
+        with open_orography(topography_file, bounds) as src:
+            if axes is not None:
+                values = resample_to_axes(src, *axes, resampling)
+            else:
+                values = resample_to_points(src, latitudes, longitudes)
+            spatial_ref = src.crs
+
         return Topography(
             x_values=longitudes,
             y_values=latitudes,
             elevation=values,
-            spatial_ref=topo.spatial_ref,  # This is not very useful without the original grid
+            spatial_ref=spatial_ref,  # This is not very useful without the original grid
         )
 
     @classmethod
@@ -91,35 +142,470 @@ class Topography:
             spatial_ref=None,  # type: ignore
         )
 
+    @property
+    def transform(self) -> typing.Any:
+        """The affine transform (rasterio.Affine) of a regular grid, from pixel corners to coordinates"""
+        if not self.regular:
+            raise ValueError("only regular topography has an affine transform")
+        dx = self.x_values[1] - self.x_values[0]
+        dy = self.y_values[1] - self.y_values[0]
+        return rasterio.Affine(
+            dx, 0, self.x_values[0] - dx / 2, 0, dy, self.y_values[0] - dy / 2
+        )
+
+    def coordinates(self) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """x and y coordinates of each point, as read-only views for a regular grid"""
+        if self.regular:
+            return make_two_dimensional(self.x_values, self.y_values)
+        return self.x_values, self.y_values
+
+
+@dataclass
+class DownscaleWeights:
+    """Linear interpolation from one grid to another, as a sparse matrix of barycentric weights"""
+
+    matrix: scipy.sparse.csr_matrix  # (output points, input points)
+    outside: np.ndarray  # output points outside the input grid, which get NaN
+    shape: tuple[int, ...]  # shape of the output grid
+
+    @classmethod
+    def from_points(
+        cls, ipoints: np.ndarray, opoints: np.ndarray, shape: tuple[int, ...]
+    ) -> "DownscaleWeights":
+        """Compute weights from (n, 2) arrays of input and output points.
+
+        This gives the same values as scipy.interpolate.LinearNDInterpolator on the Delaunay
+        triangulation of the input points, but the triangulation is only needed once.
+        """
+        matrix, inside = _barycentric_weights(Delaunay(ipoints), opoints)
+        return DownscaleWeights(matrix=matrix, outside=~inside, shape=shape)
+
+    @classmethod
+    def from_grids(
+        cls,
+        ix: np.ndarray,
+        iy: np.ndarray,
+        ox: np.ndarray,
+        oy: np.ndarray,
+        workers: int | None = None,
+        max_memory: int | None = None,
+    ) -> "DownscaleWeights":
+        """Compute weights from 2D arrays of input and output coordinates.
+
+        The output points are located in the triangulation a block of rows at a time,
+        on a thread pool, so that the working memory stays below max_memory bytes.
+        """
+        triangulation = Delaunay(np.column_stack((iy.ravel(), ix.ravel())))
+        columns = int(np.prod(ox.shape[1:]))
+
+        def block_weights(rows: slice) -> tuple[scipy.sparse.csr_matrix, np.ndarray]:
+            opoints = np.column_stack((oy[rows].ravel(), ox[rows].ravel()))
+            return _barycentric_weights(triangulation, opoints)
+
+        blocks = row_blocks(
+            ox.shape[0], columns * _WEIGHTS_BYTES_PER_POINT, workers, max_memory
+        )
+        with ThreadPoolExecutor(max_workers=_worker_count(workers)) as executor:
+            results = list(executor.map(block_weights, blocks))
+
+        matrix = scipy.sparse.vstack([m for m, _ in results], format="csr")
+        inside = np.concatenate([i for _, i in results])
+        return DownscaleWeights(matrix=matrix, outside=~inside, shape=ox.shape)
+
+    @classmethod
+    def load(cls, path: str) -> "DownscaleWeights":
+        with np.load(path) as f:
+            matrix = scipy.sparse.csr_matrix(
+                (f["data"], f["indices"], f["indptr"]), shape=tuple(f["matrix_shape"])
+            )
+            return DownscaleWeights(
+                matrix=matrix, outside=f["outside"], shape=tuple(f["shape"])
+            )
+
+    def save(self, path: str) -> None:
+        # Write to a temporary file first, so that concurrent readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                data=self.matrix.data,
+                indices=self.matrix.indices,
+                indptr=self.matrix.indptr,
+                matrix_shape=self.matrix.shape,
+                outside=self.outside,
+                shape=self.shape,
+            )
+        os.replace(tmp_path, path)
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        return self.apply_many(values[np.newaxis])[0]
+
+    def apply_many(
+        self, values: np.ndarray, workers: int | None = 1, max_memory: int | None = None
+    ) -> np.ndarray:
+        """Interpolate a stack of fields, with shape (fields, ...), with one matrix product per block.
+
+        Returns an array with shape (fields, *self.shape), where each field is contiguous.
+        """
+        return apply_in_blocks(self, values, workers, max_memory)
+
+    def apply_rows(self, values: np.ndarray, rows: slice, out: np.ndarray) -> None:
+        """Interpolate a stack of fields to a block of rows of the output grid, into out"""
+        columns = int(np.prod(self.shape[1:]))
+        points = slice(rows.start * columns, rows.stop * columns)
+        stacked = values.reshape(len(values), -1)
+        result = self.matrix[points] @ stacked.T
+        result[self.outside[points]] = np.nan
+        out[...] = result.T.reshape(out.shape)
+
+
+@dataclass
+class RegularDownscaleWeights:
+    """Separable interpolation between two regular grids, with weights along each axis.
+
+    Linear interpolation is bilinear on the grid cells, and cubic interpolation is bicubic
+    convolution. Cubic interpolation reproduces quadratic fields exactly, also in the cells at
+    the edges of the input grid, where the values beyond the edge are extrapolated. Each axis
+    has a sparse matrix with a few weights for each output row or column. Output points
+    outside the input grid have NaN weights, and so get NaN.
+    """
+
+    x_matrix: scipy.sparse.csr_matrix  # (output columns, input columns)
+    y_matrix: scipy.sparse.csr_matrix  # (output rows, input rows)
+
+    @classmethod
+    def from_axes(
+        cls,
+        ix: np.ndarray,
+        iy: np.ndarray,
+        ox: np.ndarray,
+        oy: np.ndarray,
+        interpolation: str = "linear",
+    ) -> "RegularDownscaleWeights":
+        return RegularDownscaleWeights(
+            x_matrix=_axis_matrix(ix, ox, interpolation),
+            y_matrix=_axis_matrix(iy, oy, interpolation),
+        )
+
+    @property
+    def input_shape(self) -> tuple[int, int]:
+        return (self.y_matrix.shape[1], self.x_matrix.shape[1])
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (self.y_matrix.shape[0], self.x_matrix.shape[0])
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        return self.apply_many(values[np.newaxis])[0]
+
+    def apply_many(
+        self, values: np.ndarray, workers: int | None = 1, max_memory: int | None = None
+    ) -> np.ndarray:
+        """Interpolate a stack of fields, with shape (fields, ...), one axis at a time.
+
+        Returns an array with shape (fields, *self.shape).
+        """
+        return apply_in_blocks(self, values, workers, max_memory)
+
+    def apply_rows(self, values: np.ndarray, rows: slice, out: np.ndarray) -> None:
+        """Interpolate a stack of fields to a block of rows of the output grid, into out"""
+        values = values.reshape(len(values), *self.input_shape)
+        y_matrix = self.y_matrix[rows]
+        input_rows, input_columns = self.input_shape
+        # Interpolate first along the axis that gives the smallest intermediate array
+        x_first = (
+            input_rows * self.x_matrix.shape[0] <= y_matrix.shape[0] * input_columns
+        )
+        for field, output in zip(values, out):
+            if x_first:
+                output[...] = y_matrix @ (self.x_matrix @ field.T).T
+            else:
+                output[...] = (self.x_matrix @ (y_matrix @ field).T).T
+
+
+# Rough working memory for computing the weights of one output point, and for interpolating
+# one field to one output point
+_WEIGHTS_BYTES_PER_POINT = 256
+_APPLY_BYTES_PER_VALUE = 16
+
+
+def apply_in_blocks(
+    weights: "DownscaleWeights | RegularDownscaleWeights",
+    values: np.ndarray,
+    workers: int | None = 1,
+    max_memory: int | None = None,
+) -> np.ndarray:
+    """Interpolate a stack of fields into a preallocated output, a block of output rows at a time.
+
+    The blocks are interpolated on a thread pool of the given number of workers, which defaults
+    to the number of CPUs, as numpy and scipy release the GIL. The blocks are small enough that
+    the working memory of all workers together, besides the input and output, stays below
+    max_memory bytes.
+    """
+    result = np.empty(
+        (len(values), *weights.shape), dtype=np.result_type(values, np.float64)
+    )
+    columns = int(np.prod(weights.shape[1:]))
+    blocks = row_blocks(
+        weights.shape[0],
+        len(values) * columns * _APPLY_BYTES_PER_VALUE,
+        workers,
+        max_memory,
+    )
+
+    def apply_block(rows: slice) -> None:
+        weights.apply_rows(values, rows, result[:, rows])
+
+    if len(blocks) == 1:
+        apply_block(blocks[0])
+    else:
+        with ThreadPoolExecutor(max_workers=_worker_count(workers)) as executor:
+            list(executor.map(apply_block, blocks))
+    return result
+
+
+def row_blocks(
+    rows: int, row_bytes: int, workers: int | None = 1, max_memory: int | None = None
+) -> list[slice]:
+    """Split rows into blocks, so that each worker has a few blocks, and the blocks that are
+    processed at the same time use less than max_memory bytes together."""
+    workers = _worker_count(workers)
+    block_rows = rows if workers == 1 else -(-rows // (4 * workers))
+    if max_memory is not None:
+        block_rows = min(block_rows, max_memory // (workers * max(row_bytes, 1)))
+    block_rows = max(block_rows, 1)
+    return [
+        slice(start, min(start + block_rows, rows))
+        for start in range(0, rows, block_rows)
+    ]
+
+
+def _worker_count(workers: int | None) -> int:
+    return workers if workers is not None else os.cpu_count() or 1
+
+
+def _axis_matrix(
+    source: np.ndarray, target: np.ndarray, interpolation: str
+) -> scipy.sparse.csr_matrix:
+    """Interpolation weights along one axis, as a (target, source) matrix"""
+    source = np.asarray(source, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    n = len(source)
+    descending = source[0] > source[-1]
+    if descending:
+        source = source[::-1]
+
+    cell = np.clip(np.searchsorted(source, target, side="right") - 1, 0, n - 2)
+    t = (target - source[cell]) / (source[cell + 1] - source[cell])
+    # allow for rounding errors in coordinates on the edge of the input grid
+    outside = (t < -1e-6) | (t > 1 + 1e-6)
+    t = np.clip(t, 0, 1)
+
+    if interpolation == "linear":
+        indices = np.column_stack((cell, cell + 1))
+        weights = np.column_stack((1 - t, t))
+    elif interpolation == "cubic":
+        # cubic convolution kernel with a = -0.5 (Keys, 1981)
+        indices = cell[:, np.newaxis] + np.arange(-1, 3)
+        weights = np.column_stack(
+            (
+                ((-0.5 * t + 1) * t - 0.5) * t,
+                (1.5 * t - 2.5) * t * t + 1,
+                ((-1.5 * t + 2) * t + 0.5) * t,
+                (0.5 * t - 0.5) * t * t,
+            )
+        )
+    else:
+        raise ValueError(
+            f"Unknown interpolation {interpolation}, expected one of {', '.join(INTERPOLATIONS)}"
+        )
+
+    weights[outside] = np.nan
+    rows = np.repeat(np.arange(len(target)), indices.shape[1])
+    rows, indices, weights = _extrapolate_edges(
+        rows, indices.ravel(), weights.ravel(), n
+    )
+    if descending:
+        indices = n - 1 - indices
+    # Weights for the same input point are summed
+    return scipy.sparse.csr_matrix((weights, (rows, indices)), shape=(len(target), n))
+
+
+def _extrapolate_edges(
+    rows: np.ndarray, indices: np.ndarray, weights: np.ndarray, n: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Replace weights of the points just outside an axis of n points by weights of points inside.
+
+    The cubic kernel reaches one point beyond each end of the axis. Its value there is
+    extrapolated with the boundary condition of Keys (1981), f(-1) = 3 f(0) - 3 f(1) + f(2),
+    which keeps the interpolation exact for quadratic fields up to the edges. With only two
+    points, the value is extrapolated linearly.
+    """
+    if n >= 3:
+        factors = np.array([3.0, -3.0, 1.0])
+    else:
+        factors = np.array([2.0, -1.0])
+    offsets = np.arange(len(factors))
+
+    inside = (indices >= 0) & (indices < n)
+    parts = [(rows[inside], indices[inside], weights[inside])]
+    for edge, edge_indices in (
+        (indices == -1, offsets),
+        (indices == n, n - 1 - offsets),
+    ):
+        count = int(np.count_nonzero(edge))
+        parts.append(
+            (
+                np.repeat(rows[edge], len(factors)),
+                np.tile(edge_indices, count),
+                (weights[edge][:, np.newaxis] * factors).ravel(),
+            )
+        )
+    return tuple(np.concatenate(p) for p in zip(*parts))  # type: ignore
+
+
+def regular_axes(
+    x_values: np.ndarray, y_values: np.ndarray
+) -> typing.Tuple[np.ndarray, np.ndarray] | None:
+    """The x and y axes of a regular grid, or None if the grid is not regular.
+
+    The grid may be given either as 1D axes, or as 2D arrays of coordinates.
+    """
+    if x_values.ndim == 1 and y_values.ndim == 1:
+        x_axis, y_axis = x_values, y_values
+    elif x_values.ndim == 2 and x_values.shape == y_values.shape:
+        x_axis, y_axis = x_values[0], y_values[:, 0]
+        if not np.array_equal(x_values, np.broadcast_to(x_axis, x_values.shape)):
+            return None
+        if not np.array_equal(
+            y_values, np.broadcast_to(y_axis[:, np.newaxis], y_values.shape)
+        ):
+            return None
+    else:
+        return None
+
+    for axis in (x_axis, y_axis):
+        if len(axis) < 2:
+            return None
+        steps = np.diff(axis)
+        if not (np.all(steps > 0) or np.all(steps < 0)):
+            return None
+    return x_axis, y_axis
+
+
+# Weights recently used in this process, by grid hash, so that repeated retrievals do not even read the cache
+_weights: dict[str, DownscaleWeights] = {}
+_weights_lock = threading.Lock()
+
 
 def downscaler(
-    ix: np.ndarray, iy: np.ndarray, ox: np.ndarray, oy: np.ndarray
-) -> typing.Callable[[np.ndarray], np.ndarray]:
+    ix: np.ndarray,
+    iy: np.ndarray,
+    ox: np.ndarray,
+    oy: np.ndarray,
+    cache_dir: str | None = DEFAULT_WEIGHTS_CACHE,
+    interpolation: str = "linear",
+    workers: int | None = None,
+    max_memory: int | None = None,
+) -> DownscaleWeights | RegularDownscaleWeights:
+    """Get interpolation from the input grid (ix, iy) to the output grid (ox, oy).
+
+    If both grids are regular, the interpolation is separable, and only needs a few weights
+    along each axis. Otherwise, linear interpolation weights are computed on a triangulation
+    of the input grid, once for each pair of grids, and kept on disk in cache_dir, keyed by
+    a hash of the grids. If cache_dir is None, they are only kept in memory. The triangulation
+    is searched in blocks of output rows, with workers and max_memory as in apply_in_blocks.
+    """
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError(
+            f"Unknown interpolation {interpolation}, expected one of {', '.join(INTERPOLATIONS)}"
+        )
+
+    input_axes = regular_axes(ix, iy)
+    output_axes = regular_axes(ox, oy)
+    if input_axes is not None and output_axes is not None:
+        return RegularDownscaleWeights.from_axes(
+            *input_axes, *output_axes, interpolation
+        )
+    if interpolation != "linear":
+        raise ValueError(
+            f"{interpolation} interpolation is only supported between regular grids"
+        )
+
     if len(ix.shape) == 1:
         if len(iy.shape) != 1:
             raise ValueError("ix must be 1D if iy is 1D")
         ix, iy = make_two_dimensional(ix, iy)
-    ipoints = np.column_stack((iy.flatten(), ix.flatten()))
-
-    triangulation = Delaunay(ipoints)
-
     if len(ox.shape) == 1:
         if len(oy.shape) != 1:
             raise ValueError("ox must be 1D if oy is 1D")
         ox, oy = make_two_dimensional(ox, oy)
-    opoints = np.column_stack((oy.flatten(), ox.flatten()))
 
-    def interpolate(values: np.ndarray) -> np.ndarray:
-        interpolator = scipy.interpolate.LinearNDInterpolator(
-            triangulation, values.flatten()
-        )
-        return interpolator(opoints).reshape(ox.shape)
+    key = grid_hash(ix, iy, ox, oy)
+    # Concurrent retrievals on the same grids wait for the first one to compute the weights
+    with _weights_lock:
+        if key in _weights:
+            return _weights[key]
+
+        path = os.path.join(cache_dir, f"{key}.npz") if cache_dir is not None else None
+        if path is not None and os.path.exists(path):
+            weights = DownscaleWeights.load(path)
+        else:
+            weights = DownscaleWeights.from_grids(ix, iy, ox, oy, workers, max_memory)
+            if path is not None:
+                try:
+                    weights.save(path)
+                except OSError as e:
+                    print(f"Unable to save downscaling weights to {path}: {e}")
+
+        if len(_weights) >= 4:
+            # only keep the latest grid pairs in memory
+            del _weights[next(iter(_weights))]
+        _weights[key] = weights
+        return weights
+
+
+def _barycentric_weights(
+    triangulation: Delaunay, opoints: np.ndarray
+) -> tuple[scipy.sparse.csr_matrix, np.ndarray]:
+    """Sparse matrix of barycentric weights for the output points, and which of them are inside"""
+    simplex = triangulation.find_simplex(opoints)
+    inside = simplex >= 0
+
+    transform = triangulation.transform[simplex[inside]]
+    b = np.einsum("nij,nj->ni", transform[:, :2], opoints[inside] - transform[:, 2])
+    weights = np.column_stack((b, 1 - b.sum(axis=1)))
+    vertices = triangulation.simplices[simplex[inside]]
+
+    matrix = scipy.sparse.csr_matrix(
+        (weights.ravel(), (np.repeat(np.flatnonzero(inside), 3), vertices.ravel())),
+        shape=(len(opoints), triangulation.npoints),
+    )
+    return matrix, inside
 
-    return interpolate
+
+def grid_hash(*arrays: np.ndarray) -> str:
+    h = hashlib.sha256()
+    for a in arrays:
+        h.update(str(a.shape).encode())
+        # hash a block of rows at a time, as the arrays may be views of 1D axes
+        rows = max(1, (1 << 20) // max(1, a[:1].size))
+        for start in range(0, max(len(a), 1), rows):
+            h.update(
+                np.ascontiguousarray(
+                    a[start : start + rows], dtype=np.float64
+                ).tobytes()
+            )
+    return h.hexdigest()[:32]
 
 
 class DownscalePreProcessor(Processor):
     def __init__(self, context: Context, **kwargs):
+        self._weights_cache = kwargs.pop("weights_cache", DEFAULT_WEIGHTS_CACHE)
+        self._interpolation = kwargs.pop("interpolation", "linear")
+        self._workers = kwargs.pop("workers", None)
+        self._max_memory = _mebibytes_to_bytes(kwargs.pop("max_memory", None))
         if "orography_file" in kwargs:
             self._topography = Topography.from_topography_file(kwargs["orography_file"])
         else:
@@ -128,7 +614,15 @@ class DownscalePreProcessor(Processor):
         super().__init__(context, **kwargs)
 
     def process(self, fields: ekd.FieldList) -> ekd.FieldList:  # type: ignore
-        return downscale(fields, self._topography.x_values, self._topography.y_values)
+        return downscale(
+            fields,
+            self._topography.x_values,
+            self._topography.y_values,
+            cache_dir=self._weights_cache,
+            interpolation=self._interpolation,
+            workers=self._workers,
+            max_memory=self._max_memory,
+        )
 
 
 class DownscaledMarsInput(MarsInput):
@@ -141,6 +635,47 @@ class DownscaledMarsInput(MarsInput):
             The context in which the input operates.
         mars_options : dict, optional
             Options for MARS retrieval. Keys will be converted to strings.
+        weights_cache : str, optional
+            Directory for caching interpolation weights between the MARS grid and
+            the topography grid. Defaults to ~/.cache/bris-adapt/downscale. Set to
+            null to only keep them in memory.
+        interpolation : str, optional
+            Either linear (the default) or cubic. When both the MARS grid and the
+            topography grid are regular, this is bilinear or bicubic interpolation
+            along the grid axes. Cubic is only supported between regular grids.
+        workers : int, optional
+            Number of threads interpolating blocks of the topography grid in
+            parallel. Defaults to the number of CPUs.
+        max_memory : int, optional
+            Limit in MiB on the working memory used for interpolation, on top of
+            the retrieved and downscaled fields. The topography grid is split into
+            smaller blocks to stay below it. Defaults to no limit.
+        grib_cache : str, optional
+            Directory for caching retrieved GRIB data, keyed by the variables,
+            dates and MARS options of each retrieval, so that a repeated run does
+            not fetch the same data again. Set to true to use
+            ~/.cache/bris-adapt/grib. Defaults to no caching.
+        grib_cache_size : int, optional
+            Size limit of the GRIB cache in MiB. The least recently used files are
+            removed to stay below it. Defaults to 10240.
+        cache_downscaled : bool, optional
+            Also cache the downscaled fields, keyed additionally by the topography
+            grid and the interpolation, so that a repeated run does not have to
+            interpolate again. The cached fields are packed in GRIB, so they are
+            slightly less precise than freshly downscaled ones. Defaults to false.
+        retrieval_workers : int, optional
+            Split each retrieval into one request per pressure level, and one for
+            all surface variables, and send up to this many of them at the same
+            time. Each group is downscaled as soon as it arrives. Defaults to a
+            single request.
+        prefetch : bool, optional
+            When several dates are asked for at once, retrieve them one at a time,
+            fetching the next date in the background while the current one is
+            downscaled. Defaults to false.
+        orography_file : str or list, optional
+            Topography to downscale to, instead of the grid of the checkpoint. This
+            is a GeoTIFF or VRT file, a directory of GeoTIFF tiles, or a list of
+            files. Only the part that is inside area, if it is given, is read.
         """
         if "grid" in kwargs:
             grid = kwargs["grid"]
@@ -148,9 +683,34 @@ class DownscaledMarsInput(MarsInput):
                 if len(grid) > 0 and grid[0] in ("O", "N", "H"):
                     raise ValueError("only regular grids are supported for downscaling")
 
+        self._weights_cache = kwargs.pop("weights_cache", DEFAULT_WEIGHTS_CACHE)
+        self._interpolation = kwargs.pop("interpolation", "linear")
+        if self._interpolation not in INTERPOLATIONS:
+            raise ValueError(
+                f"interpolation must be one of {', '.join(INTERPOLATIONS)}"
+            )
+        self._workers = kwargs.pop("workers", None)
+        self._max_memory = _mebibytes_to_bytes(kwargs.pop("max_memory", None))
+
+        grib_cache = kwargs.pop("grib_cache", None)
+        grib_cache_size = _mebibytes_to_bytes(kwargs.pop("grib_cache_size", None))
+        if grib_cache is True:
+            grib_cache = DEFAULT_GRIB_CACHE
+        self._grib_cache = (
+            GribCache(grib_cache, grib_cache_size or DEFAULT_GRIB_CACHE_SIZE)
+            if grib_cache
+            else None
+        )
+        self._cache_downscaled = bool(kwargs.pop("cache_downscaled", False))
+
+        self._retrieval_workers = kwargs.pop("retrieval_workers", None)
+        self._prefetch = bool(kwargs.pop("prefetch", False))
+
         if "orography_file" in kwargs:
-            self._topography = Topography.from_topography_file(kwargs["orography_file"])
-            del kwargs["orography_file"]
+            # Points outside the MARS area would not get values, so they are not read
+            self._topography = Topography.from_topography_file(
+                kwargs.pop("orography_file"), _area_bounds(kwargs.get("area"))
+            )
         else:
             self._topography = Topography.from_supporting_array(context)
 
@@ -159,55 +719,231 @@ class DownscaledMarsInput(MarsInput):
     def retrieve(
         self, variables: typing.List[str], dates: typing.List[Date]
     ) -> typing.Any:
-        original: ekd.FieldList = super().retrieve(variables, dates)  # type: ignore
-        return downscale(original, self._topography.x_values, self._topography.y_values)
+        if not self._prefetch or len(dates) < 2:
+            return self._retrieve_groups(variables, dates)
+
+        # One date at a time, with the next date fetched while the current one is downscaled
+        fields = []
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            fetching = executor.submit(self._fetch_groups, variables, dates[:1])
+            for i in range(len(dates)):
+                fetched = fetching.result()
+                if i + 1 < len(dates):
+                    fetching = executor.submit(
+                        self._fetch_groups, variables, dates[i + 1 : i + 2]
+                    )
+                for group in fetched:
+                    fields.extend(self._downscale_fetched(*group))
+        return ekd.FieldList.from_fields(fields)
+
+    def _retrieve_groups(
+        self, variables: typing.List[str], dates: typing.List[Date]
+    ) -> ekd.FieldList:
+        """Retrieve and downscale, as concurrent requests if retrieval_workers is set"""
+        if not self._retrieval_workers:
+            return self._retrieve_one(variables, dates)
+
+        groups = self._variable_groups(variables)
+        with ThreadPoolExecutor(max_workers=self._retrieval_workers) as executor:
+            results = list(
+                executor.map(lambda group: self._retrieve_one(group, dates), groups)
+            )
+        return ekd.FieldList.from_fields([field for r in results for field in r])
+
+    def _fetch_groups(
+        self, variables: typing.List[str], dates: typing.List[Date]
+    ) -> list[tuple[ekd.FieldList, str | None, bool]]:
+        """Fetch without downscaling, as concurrent requests if retrieval_workers is set"""
+        if not self._retrieval_workers:
+            return [self._fetch_cached(variables, dates)]
+
+        groups = self._variable_groups(variables)
+        with ThreadPoolExecutor(max_workers=self._retrieval_workers) as executor:
+            return list(
+                executor.map(lambda group: self._fetch_cached(group, dates), groups)
+            )
+
+    def _variable_groups(self, variables: typing.List[str]) -> list[list[str]]:
+        """Variables grouped by pressure level, with all other variables in one group"""
+        groups: dict[typing.Any, list[str]] = {}
+        for name in variables:
+            variable = self.checkpoint.typed_variables.get(name)
+            if variable is not None and variable.is_pressure_level:
+                key = variable.level
+            else:
+                key = "sfc"
+            groups.setdefault(key, []).append(name)
+        return list(groups.values())
+
+    def _retrieve_one(
+        self, variables: typing.List[str], dates: typing.List[Date]
+    ) -> ekd.FieldList:
+        return self._downscale_fetched(*self._fetch_cached(variables, dates))
 
+    def _fetch_cached(
+        self, variables: typing.List[str], dates: typing.List[Date]
+    ) -> tuple[ekd.FieldList, str | None, bool]:
+        """Fields from the GRIB cache, or from MARS.
 
-def downscale(
-    source_ds: ekd.FieldList, output_x_values: np.ndarray, output_y_values: np.ndarray
-) -> ekd.FieldList:
-    fields = []
+        Returns the fields, the cache key for them once downscaled, and whether they are
+        already downscaled.
+        """
+        if self._grib_cache is None:
+            return self._fetch(variables, dates), None, False
+
+        request = self._cache_request(variables, dates)
+        downscaled_key = None
+        if self._cache_downscaled:
+            downscaled_key = GribCache.key(
+                request=request,
+                topography=grid_hash(
+                    self._topography.x_values, self._topography.y_values
+                ),
+                interpolation=self._interpolation,
+            )
+            cached = self._grib_cache.get(downscaled_key)
+            if cached is not None:
+                return cached, None, True
+
+        key = GribCache.key(request=request)
+        original = self._grib_cache.get(key)
+        if original is None:
+            original = self._fetch(variables, dates)
+            self._grib_cache.put(key, original)
+        return original, downscaled_key, False
+
+    def _downscale_fetched(
+        self, fields: ekd.FieldList, downscaled_key: str | None, downscaled: bool
+    ) -> ekd.FieldList:
+        if downscaled:
+            return fields
+        result = self._downscale(fields)
+        if downscaled_key is not None:
+            self._grib_cache.put(downscaled_key, result)  # type: ignore
+        return result
+
+    def _fetch(
+        self, variables: typing.List[str], dates: typing.List[Date]
+    ) -> ekd.FieldList:
+        return super().retrieve(variables, dates)  # type: ignore
+
+    def _downscale(self, original: ekd.FieldList) -> ekd.FieldList:
+        return downscale(
+            original,
+            self._topography.x_values,
+            self._topography.y_values,
+            cache_dir=self._weights_cache,
+            interpolation=self._interpolation,
+            workers=self._workers,
+            max_memory=self._max_memory,
+        )
 
-    field: ekd.FieldList = source_ds.sel(param="z")  # type: ignore
-    latlon = field.to_latlon()
+    def _cache_request(
+        self, variables: typing.List[str], dates: typing.List[Date]
+    ) -> dict:
+        """What identifies a retrieval, with the same values for equivalent requests"""
+        options = self.kwargs.copy()
+        options.setdefault("grid", self.checkpoint.grid)
+        options.setdefault("area", self.checkpoint.area)
+        return {
+            "variables": sorted(variables),
+            "dates": sorted(to_datetime(d).isoformat() for d in dates),
+            "options": {k: _normalise_option(v) for k, v in options.items()},
+            "patches": self.patches,
+        }
 
-    downscale = downscaler(
-        iy=latlon["lat"],  # type: ignore
-        ix=latlon["lon"],  # type: ignore
-        oy=output_y_values,
-        ox=output_x_values,
-    )
 
+def downscale(
+    source_ds: ekd.FieldList,
+    output_x_values: np.ndarray,
+    output_y_values: np.ndarray,
+    cache_dir: str | None = DEFAULT_WEIGHTS_CACHE,
+    interpolation: str = "linear",
+    workers: int | None = None,
+    max_memory: int | None = None,
+) -> ekd.FieldList:
+    """Interpolate all fields to the output grid.
+
+    Fields that share a grid are interpolated together, with the same weights. The output grid
+    is split into blocks of rows, which are interpolated on a thread pool of the given number
+    of workers, keeping the working memory below max_memory bytes.
+    """
+    source_fields = list(source_ds)  # type: ignore
+
+    # The output grid may be given by its axes, or by 2D coordinates
+    x_values, y_values = output_x_values, output_y_values
+    if x_values.ndim == 1:
+        x_values, y_values = make_two_dimensional(x_values, y_values)
     metadata_overrides = {
-        "Ni": output_x_values.shape[1],
-        "Nj": output_y_values.shape[0],
-        "latitudeOfFirstGridPointInDegrees": output_y_values[0, 0],
-        "latitudeOfLastGridPointInDegrees": output_y_values[-1, 0],
-        "longitudeOfFirstGridPointInDegrees": output_x_values[0, 0],
-        "longitudeOfLastGridPointInDegrees": output_x_values[0, -1],
+        "Ni": int(x_values.shape[1]),
+        "Nj": int(y_values.shape[0]),
+        "latitudeOfFirstGridPointInDegrees": float(y_values[0, 0]),
+        "latitudeOfLastGridPointInDegrees": float(y_values[-1, 0]),
+        "longitudeOfFirstGridPointInDegrees": float(x_values[0, 0]),
+        "longitudeOfLastGridPointInDegrees": float(x_values[0, -1]),
     }
 
-    for field in source_ds:  # type: ignore
-        # name: str = field.metadata("shortName")  # type: ignore
+    groups: dict[str, list[int]] = {}
+    for i, field in enumerate(source_fields):
+        groups.setdefault(field.metadata("md5GridSection", default=None), []).append(i)
+
+    fields: list[ArrayField | None] = [None] * len(source_fields)
+    for indices in groups.values():
+        latlon = source_fields[indices[0]].to_latlon()
+        weights = downscaler(
+            iy=latlon["lat"],  # type: ignore
+            ix=latlon["lon"],  # type: ignore
+            oy=output_y_values,
+            ox=output_x_values,
+            cache_dir=cache_dir,
+            interpolation=interpolation,
+            workers=workers,
+            max_memory=max_memory,
+        )
+
+        values = np.stack([source_fields[i].to_numpy() for i in indices])
+        data = weights.apply_many(values, workers=workers, max_memory=max_memory)
+        for i, field_data in zip(indices, data):
+            metadata = source_fields[i].metadata().override(**metadata_overrides)  # type: ignore
+            fields[i] = ArrayField(field_data, metadata)
+
+    return ekd.FieldList.from_fields(fields)
+
+
+def _normalise_option(value: typing.Any) -> typing.Any:
+    """Turn MARS options like "0.25/0.25" and [0.25, "0.25"] into the same list of floats"""
+    if isinstance(value, str) and "/" in value:
+        value = value.split("/")
+    if isinstance(value, (list, tuple)):
+        return [_normalise_option(v) for v in value]
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
 
-        # original_data = source_ds.sel(param=name).to_numpy()  # type: ignore
-        original_data = field.to_numpy()
+def _area_bounds(area: typing.Any) -> Bounds | None:
+    """West, south, east and north of a MARS area, given as north/west/south/east"""
+    if area is None:
+        return None
+    if isinstance(area, str):
+        area = area.split("/")
+    north, west, south, east = (float(v) for v in area)
+    return (west, south, east, north)
 
-        data = downscale(original_data)  # type: ignore
-        metadata = field.metadata().override(**metadata_overrides)  # type: ignore
-        af = ArrayField(data, metadata)
-        fields.append(af)
 
-    # return source_ds
-    ret = ekd.FieldList.from_fields(fields)
-    return ret
+def _mebibytes_to_bytes(value: int | None) -> int | None:
+    """Convert an option in MiB to bytes"""
+    return int(value) * 1024 * 1024 if value is not None else None
 
 
 def make_two_dimensional(
     x_values: np.ndarray, y_values: np.ndarray
 ) -> typing.Tuple[np.ndarray, np.ndarray]:
-    x = np.tile(x_values, (len(y_values), 1))
-    y = np.transpose(np.tile(y_values, (len(x_values), 1)))
+    """2D x and y coordinates of a grid from its axes, as read-only views that take no memory"""
+    shape = (len(y_values), len(x_values))
+    x = np.broadcast_to(x_values, shape)
+    y = np.broadcast_to(y_values[:, np.newaxis], shape)
     return x, y
 
 
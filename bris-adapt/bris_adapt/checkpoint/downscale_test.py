@@ -0,0 +1,339 @@
+import datetime
+import threading
+import time
+from types import SimpleNamespace
+
+import earthkit.data as ekd
+import eccodes
+import numpy as np
+import pytest
+from anemoi.inference.inputs.mars import MarsInput
+from earthkit.data.sources.array_list import ArrayField
+from scipy.interpolate import LinearNDInterpolator, RegularGridInterpolator
+
+from bris_adapt.checkpoint import downscale
+from bris_adapt.checkpoint.downscale import (
+    DownscaledMarsInput,
+    DownscaleWeights,
+    RegularDownscaleWeights,
+    downscaler,
+    row_blocks,
+)
+
+LATENCY = 0.2  # seconds for each request to the stand-in MARS
+
+VARIABLES = ["2t", "msl", "t_850", "u_850", "t_500"]
+DATES = [datetime.datetime(2024, 1, 1, 0), datetime.datetime(2024, 1, 1, 6)]
+
+
+def _template() -> ekd.Field:
+    """A 0.5 degree GRIB field covering 5-9E and 58-62N"""
+    handle = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+    try:
+        for key, value in {
+            "Ni": 9,
+            "Nj": 9,
+            "latitudeOfFirstGridPointInDegrees": 62.0,
+            "latitudeOfLastGridPointInDegrees": 58.0,
+            "longitudeOfFirstGridPointInDegrees": 5.0,
+            "longitudeOfLastGridPointInDegrees": 9.0,
+            "iDirectionIncrementInDegrees": 0.5,
+            "jDirectionIncrementInDegrees": 0.5,
+        }.items():
+            eccodes.codes_set(handle, key, value)
+        eccodes.codes_set_values(handle, np.zeros(81))
+        message = eccodes.codes_get_message(handle)
+    finally:
+        eccodes.codes_release(handle)
+    return ekd.from_source("memory", message)[0]  # type: ignore
+
+
+class StandInMars:
+    """Replaces MarsInput.retrieve with fields made up on the spot, after a delay"""
+
+    def __init__(self):
+        self.template = _template()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.requests: list[tuple[list[str], list, float, float]] = []
+
+    def retrieve(self, variables: list[str], dates: list) -> ekd.FieldList:
+        start = time.perf_counter()
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(LATENCY)
+        with self.lock:
+            self.active -= 1
+            self.requests.append((variables, dates, start, time.perf_counter()))
+
+        fields = []
+        for date in dates:
+            for name in variables:
+                param, _, level = name.partition("_")
+                keys = {
+                    "shortName": param,
+                    "dataDate": int(f"{date:%Y%m%d}"),
+                    "dataTime": date.hour * 100,
+                }
+                if level:
+                    keys.update(typeOfLevel="isobaricInhPa", level=int(level))
+                metadata = self.template.metadata().override(**keys)
+                seed = sum(map(ord, name)) + date.hour
+                values = np.random.default_rng(seed).random(81)
+                fields.append(ArrayField(values, metadata))
+        return ekd.FieldList.from_fields(fields)
+
+
+@pytest.fixture
+def mars(monkeypatch) -> StandInMars:
+    stand_in = StandInMars()
+    monkeypatch.setattr(
+        MarsInput,
+        "retrieve",
+        lambda input, variables, dates: stand_in.retrieve(variables, dates),
+    )
+    return stand_in
+
+
+def _input(**kwargs) -> DownscaledMarsInput:
+    # The checkpoint grid is a 0.25 degree grid inside the MARS grid
+    latitudes, longitudes = np.meshgrid(
+        np.arange(61.5, 58.4, -0.25), np.arange(5.5, 8.6, 0.25), indexing="ij"
+    )
+    typed_variables = {
+        name: SimpleNamespace(
+            is_pressure_level="_" in name,
+            level=int(name.split("_")[1]) if "_" in name else None,
+        )
+        for name in VARIABLES
+    }
+    checkpoint = SimpleNamespace(
+        supporting_arrays={
+            "lam_0/latitudes": latitudes,
+            "lam_0/longitudes": longitudes,
+        },
+        typed_variables=typed_variables,
+        grid=[0.5, 0.5],
+        area=[62, 5, 58, 9],
+    )
+    context = SimpleNamespace(checkpoint=checkpoint)
+    return DownscaledMarsInput(
+        context,  # type: ignore
+        variables=VARIABLES,
+        namer=lambda field, metadata: field.metadata("param"),
+        weights_cache=None,
+        **kwargs,
+    )
+
+
+def _values(fields: ekd.FieldList) -> dict:
+    return {
+        (
+            f.metadata("param"),
+            f.metadata("level"),
+            f.metadata("valid_datetime"),
+        ): f.to_numpy()
+        for f in fields
+    }
+
+
+def test_groups_are_fetched_concurrently(mars: StandInMars):
+    fields = _input(retrieval_workers=2).retrieve(VARIABLES, DATES[:1])
+
+    # One request for the surface, and one for each of the two pressure levels
+    assert sorted(sorted(r[0]) for r in mars.requests) == [
+        ["2t", "msl"],
+        ["t_500"],
+        ["t_850", "u_850"],
+    ]
+    assert mars.max_active == 2
+    assert len(fields) == len(VARIABLES)
+
+
+def test_split_retrieval_is_the_same(mars: StandInMars):
+    expected = _values(_input().retrieve(VARIABLES, DATES))
+    split = _values(_input(retrieval_workers=3).retrieve(VARIABLES, DATES))
+    prefetched = _values(
+        _input(retrieval_workers=3, prefetch=True).retrieve(VARIABLES, DATES)
+    )
+
+    assert len(expected) == len(VARIABLES) * len(DATES)
+    for result in (split, prefetched):
+        assert result.keys() == expected.keys()
+        for key, values in expected.items():
+            assert np.array_equal(result[key], values, equal_nan=True)
+
+
+def test_next_date_is_fetched_while_downscaling(mars: StandInMars, monkeypatch):
+    downscaling: list[tuple[float, float]] = []
+    original_downscale = DownscaledMarsInput._downscale
+
+    def slow_downscale(self, fields):
+        start = time.perf_counter()
+        time.sleep(LATENCY)
+        result = original_downscale(self, fields)
+        downscaling.append((start, time.perf_counter()))
+        return result
+
+    monkeypatch.setattr(DownscaledMarsInput, "_downscale", slow_downscale)
+    threads = threading.active_count()
+    fields = _input(prefetch=True).retrieve(VARIABLES, DATES)
+
+    assert len(fields) == len(VARIABLES) * len(DATES)
+    assert [r[1] for r in mars.requests] == [DATES[:1], DATES[1:]]
+    # The second date was requested before the first one was downscaled
+    assert mars.requests[1][2] < downscaling[0][1]
+    # and the background thread is gone when retrieve returns
+    assert threading.active_count() == threads
+
+
+def test_grib_cache(mars: StandInMars, tmp_path):
+    cache = {"grib_cache": str(tmp_path), "cache_downscaled": True}
+    expected = _values(_input(grid="0.5/0.5", **cache).retrieve(VARIABLES, DATES))
+    assert len(mars.requests) == 1
+
+    # The same request with the grid written as a list is read from the cache
+    cached = _input(grid=[0.5, "0.5"], **cache).retrieve(VARIABLES, DATES)
+    assert len(mars.requests) == 1
+    assert _values(cached).keys() == expected.keys()
+    for key, values in _values(cached).items():
+        assert np.allclose(values, expected[key], equal_nan=True)
+
+    # Another grid is not
+    _input(grid=[0.25, 0.25], **cache).retrieve(VARIABLES, DATES)
+    assert len(mars.requests) == 2
+
+
+def _curvilinear_grid(rows: int, columns: int) -> tuple[np.ndarray, np.ndarray]:
+    """A slightly rotated and distorted grid, which is not regular"""
+    j, i = np.meshgrid(np.arange(rows), np.arange(columns), indexing="ij")
+    x = 5 + 0.1 * i + 0.02 * j + 0.001 * np.sin(i * j)
+    y = 62 - 0.1 * j + 0.02 * i
+    return x, y
+
+
+def _output_grid() -> tuple[np.ndarray, np.ndarray]:
+    """A finer grid, partly outside the grids of _curvilinear_grid"""
+    return np.meshgrid(np.linspace(4.9, 7.2, 47), np.linspace(62.3, 59.8, 31))
+
+
+def test_barycentric_weights_are_linear_nd_interpolation():
+    ix, iy = _curvilinear_grid(20, 15)
+    ox, oy = _output_grid()
+    values = np.random.default_rng(0).random(ix.shape)
+
+    weights = DownscaleWeights.from_grids(ix, iy, ox, oy, workers=1)
+
+    expected = LinearNDInterpolator(
+        np.column_stack((iy.ravel(), ix.ravel())), values.ravel()
+    )(oy, ox)
+    result = weights(values)
+    assert result.shape == ox.shape
+    # Points outside the convex hull of the input grid are NaN
+    assert np.array_equal(np.isnan(result), np.isnan(expected))
+    assert 0 < np.count_nonzero(np.isnan(result)) < result.size
+    assert np.allclose(result, expected, equal_nan=True)
+
+    points = DownscaleWeights.from_points(
+        np.column_stack((iy.ravel(), ix.ravel())),
+        np.column_stack((oy.ravel(), ox.ravel())),
+        ox.shape,
+    )
+    assert np.allclose(points(values), expected, equal_nan=True)
+
+
+def test_regular_weights_are_regular_grid_interpolation():
+    ix = np.linspace(5, 7, 21)
+    iy = np.linspace(62, 60, 11)  # north to south
+    ox = np.linspace(4.95, 7, 83)
+    oy = np.linspace(61.99, 59.9, 29)
+    field = np.random.default_rng(0).random((len(iy), len(ix)))
+    x, y = np.meshgrid(ox, oy)
+
+    linear = RegularDownscaleWeights.from_axes(ix, iy, ox, oy, "linear")
+    expected = RegularGridInterpolator(
+        (iy[::-1], ix), field[::-1], bounds_error=False, fill_value=np.nan
+    )((y, x))
+    result = linear(field)
+    assert np.array_equal(np.isnan(result), np.isnan(expected))
+    assert np.any(np.isnan(result))
+    assert np.allclose(result, expected, equal_nan=True)
+
+    # Cubic convolution is exact for a quadratic field, also in the cells at the edges,
+    # where the cubic spline of RegularGridInterpolator is close to it
+    def quadratic(x, y):
+        return (x - 6) ** 2 + 3 * (x - 6) * (y - 61) - (y - 61) ** 2
+
+    cubic = RegularDownscaleWeights.from_axes(ix, iy, ox, oy, "cubic")
+    xi, yi = np.meshgrid(ix, iy)
+    expected = RegularGridInterpolator(
+        (iy[::-1], ix), quadratic(xi, yi)[::-1], "cubic", False, np.nan
+    )((y, x))
+    result = cubic(quadratic(xi, yi))
+    assert np.array_equal(np.isnan(result), np.isnan(expected))
+    assert np.allclose(result, expected, atol=1e-3, equal_nan=True)
+    inside = ~np.isnan(result)
+    assert np.allclose(result[inside], quadratic(x, y)[inside])
+
+
+@pytest.mark.parametrize("regular", [False, True])
+def test_blocks_are_the_same_as_one_block(regular: bool):
+    ox, oy = _output_grid()
+    if regular:
+        weights = RegularDownscaleWeights.from_axes(
+            np.linspace(4.5, 7.5, 31), np.linspace(63, 59, 41), ox[0], oy[:, 0]
+        )
+        shape = (41, 31)
+    else:
+        ix, iy = _curvilinear_grid(20, 15)
+        weights = DownscaleWeights.from_grids(ix, iy, ox, oy)
+        shape = ix.shape
+    values = np.random.default_rng(0).random((3, *shape))
+
+    assert len(row_blocks(ox.shape[0], 1, workers=3)) > 1
+    expected = weights.apply_many(values, workers=1)
+    assert np.array_equal(
+        weights.apply_many(values, workers=3), expected, equal_nan=True
+    )
+    # With a small memory budget, the blocks are a row each
+    assert np.array_equal(
+        weights.apply_many(values, workers=3, max_memory=1), expected, equal_nan=True
+    )
+
+
+def test_weights_are_computed_in_blocks():
+    ix, iy = _curvilinear_grid(20, 15)
+    ox, oy = _output_grid()
+    expected = DownscaleWeights.from_grids(ix, iy, ox, oy, workers=1)
+
+    blocked = DownscaleWeights.from_grids(ix, iy, ox, oy, workers=3, max_memory=1)
+
+    assert (blocked.matrix != expected.matrix).nnz == 0
+    assert np.array_equal(blocked.outside, expected.outside)
+
+
+def test_weights_cache(tmp_path, monkeypatch):
+    ix, iy = _curvilinear_grid(20, 15)
+    ox, oy = _output_grid()
+    monkeypatch.setattr(downscale, "_weights", {})
+    computed = downscaler(ix, iy, ox, oy, cache_dir=str(tmp_path))
+    assert isinstance(computed, DownscaleWeights)
+    assert [p.suffix for p in tmp_path.iterdir()] == [".npz"]
+
+    # A new process reads the weights from the cache instead of computing them
+    monkeypatch.setattr(downscale, "_weights", {})
+
+    def not_computed(*args, **kwargs):
+        raise AssertionError("weights were computed again")
+
+    monkeypatch.setattr(DownscaleWeights, "from_grids", not_computed)
+    loaded = downscaler(ix, iy, ox, oy, cache_dir=str(tmp_path))
+
+    assert isinstance(loaded, DownscaleWeights)
+    assert loaded.shape == computed.shape
+    assert (loaded.matrix != computed.matrix).nnz == 0
+    assert np.array_equal(loaded.outside, computed.outside)
+    # and the same grids in the same process get the same weights
+    assert downscaler(ix, iy, ox, oy, cache_dir=str(tmp_path)) is loaded
@@ -1,5 +1,7 @@
 import zipfile
 
+from .reader import METADATA_FOLDER, CheckpointReader
+
 
 def add_fiab_metadata_to_checkpoint(
     grid: str | float, area: str, global_grid: str, checkpoint: str
@@ -9,21 +11,10 @@ def add_fiab_metadata_to_checkpoint(
 
 
 def _add_metadata_to_checkpoint(metadata, checkpoint: str):
-    with zipfile.ZipFile(checkpoint, "a") as zf:
-        # Find the top-level directory in the zip file
-        top_levels = set()
-        for name in zf.namelist():
-            parts = name.split("/")
-            if len(parts) > 0:
-                top_levels.add(parts[0])
-        if len(top_levels) != 1:
-            raise RuntimeError(
-                f"Expected a single top-level directory in checkpoint zip file, found: {top_levels}"
-            )
-        top_level = top_levels.pop()
+    top_level = CheckpointReader(checkpoint).top_level_directory
 
-        # Prepare the path and content
-        target_path = f"{top_level}/anemoi-metadata/forecast-in-a-box.json"
+    with zipfile.ZipFile(checkpoint, "a") as zf:
+        target_path = f"{top_level}/{METADATA_FOLDER}/forecast-in-a-box.json"
         zf.writestr(target_path, metadata)
 
 
@@ -1,9 +1,10 @@
 from dataclasses import dataclass
-from io import BufferedIOBase
 
 import earthkit.data as ekd
 import numpy as np
 
+from bris_adapt.orography.mosaic import OrographySource
+
 from .downscale import Topography, make_two_dimensional
 from .elevation import get_model_elevation_mars_grid
 from .make_graph import build_stretched_graph
@@ -24,16 +25,19 @@ def run(
     original_checkpoint: str,
     new_checkpoint: str,
     graph_config: GraphConfig,
-    orography_stream: BufferedIOBase | None,
+    orography: OrographySource | None,
     save_graph_to: str = "",
+    orography_resampling: str = "average",
 ):
     lat, lon, model_elevation = get_model_elevation_mars_grid(
         graph_config.area, graph_config.grid
     )
 
     correct_elevation: np.ndarray | None = None
-    if orography_stream is not None:
-        correct_elevation = _get_topography_on_grid(orography_stream, lat, lon)
+    if orography is not None:
+        correct_elevation = _get_topography_on_grid(
+            orography, lat, lon, orography_resampling
+        )
 
     graph = build_stretched_graph(
         lat.flatten(),
@@ -62,15 +66,16 @@ def run(
 
 
 def _get_topography_on_grid(
-    orography_stream: BufferedIOBase, latitude: np.ndarray, longitude: np.ndarray
+    orography: OrographySource,
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    resampling: str = "average",
 ) -> np.ndarray:
-    # TODO: Verify that orography_stream has a larger area than latitude/longitude
-
     topo = Topography.from_topography_file_to_grid(
-        orography_stream, latitude, longitude
+        orography, latitude, longitude, resampling
     )
     assert topo.elevation is not None
-    return topo.elevation.astype("int16")
+    return np.rint(topo.elevation).astype("int16", copy=False)
 
 
 def _get_lat_lon_from_area(
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import threading
+import typing
+
+import earthkit.data as ekd
+
+DEFAULT_GRIB_CACHE = os.path.join(
+    os.path.expanduser("~"), ".cache", "bris-adapt", "grib"
+)
+DEFAULT_GRIB_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+
+class GribCache:
+    """A directory of GRIB files, named by a hash of what they contain.
+
+    The least recently used files are removed when the total size goes above max_size bytes.
+    Reading a file marks it as used by updating its modification time. Files are read into
+    memory at once, so that fields that have been got stay readable if another process
+    removes the file.
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_GRIB_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def key(**parts: typing.Any) -> str:
+        """Hash of the parts, which must be JSON serializable, independent of their order"""
+        text = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.grib")
+
+    def get(self, key: str) -> ekd.FieldList | None:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # removed by another process since it was read
+        return ekd.from_source("memory", data)  # type: ignore
+
+    def put(self, key: str, fields: ekd.FieldList) -> None:
+        # Write to a temporary file first, so that concurrent readers never see a partial file
+        path = self.path(key)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            fields.to_target("file", tmp_path)  # type: ignore
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Unable to save GRIB data to {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict(keep=path)
+
+    def evict(self, keep: str | None = None) -> None:
+        """Remove the least recently used files until the cache is below its size limit"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".grib"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # removed by another process
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,70 @@
+import os
+
+import earthkit.data as ekd
+import eccodes
+import numpy as np
+
+from bris_adapt.checkpoint.grib_cache import GribCache
+
+
+def _fields(*values: float) -> ekd.FieldList:
+    """One 2t field for each value, with all points set to it"""
+    messages = b""
+    for i, value in enumerate(values):
+        handle = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+        try:
+            eccodes.codes_set(handle, "shortName", "2t")
+            eccodes.codes_set(handle, "dataTime", i * 100)
+            size = eccodes.codes_get_size(handle, "values")
+            eccodes.codes_set_values(handle, np.full(size, value))
+            messages += eccodes.codes_get_message(handle)
+        finally:
+            eccodes.codes_release(handle)
+    return ekd.from_source("memory", messages)  # type: ignore
+
+
+def _means(fields: ekd.FieldList) -> list[float]:
+    return [float(field.to_numpy().mean()) for field in fields]  # type: ignore
+
+
+def test_key():
+    key = GribCache.key(variables=["2t", "msl"], options={"grid": [0.25, 0.25]})
+    assert key == GribCache.key(options={"grid": [0.25, 0.25]}, variables=["2t", "msl"])
+    assert key != GribCache.key(variables=["2t", "msl"], options={"grid": [0.5, 0.5]})
+    assert key != GribCache.key(variables=["msl", "2t"], options={"grid": [0.25, 0.25]})
+
+
+def test_hit_and_miss(tmp_path):
+    cache = GribCache(str(tmp_path))
+    assert cache.get("a") is None
+
+    cache.put("a", _fields(1, 2))
+
+    assert _means(cache.get("a")) == [1, 2]  # type: ignore
+    assert cache.get("b") is None
+
+
+def test_fields_outlive_the_file(tmp_path):
+    cache = GribCache(str(tmp_path))
+    cache.put("a", _fields(1, 2))
+
+    fields = cache.get("a")
+    os.remove(cache.path("a"))  # as if evicted by another process
+
+    assert _means(fields) == [1, 2]  # type: ignore
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = GribCache(str(tmp_path))
+    cache.put("a", _fields(1))
+    # Room for two files of one field
+    cache.max_size = 2 * os.path.getsize(cache.path("a"))
+    cache.put("b", _fields(2))
+    os.utime(cache.path("a"), (1000, 1000))
+    os.utime(cache.path("b"), (2000, 2000))
+
+    # Reading a marks it as used, so b is now the least recently used
+    assert cache.get("a") is not None
+    cache.put("c", _fields(3))
+
+    assert sorted(os.listdir(tmp_path)) == ["a.grib", "c.grib"]
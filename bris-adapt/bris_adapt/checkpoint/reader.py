@@ -0,0 +1,115 @@
+import json
+import struct
+import zipfile
+from functools import cached_property
+
+import numpy as np
+
+METADATA_FOLDER = "anemoi-metadata"
+METADATA_NAMES = ("anemoi.json", "ai-models.json")
+
+# Size of the fixed part of a zip local file header. The name and extra field follow it.
+_LOCAL_HEADER_SIZE = 30
+
+
+class CheckpointReader:
+    """Read metadata and supporting arrays directly from a checkpoint zip file.
+
+    Unlike anemoi.inference.checkpoint.Checkpoint or torch.load, this never reads
+    the model itself, and supporting arrays are only read when asked for.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with zipfile.ZipFile(path) as zf:
+            self._infos = {info.filename: info for info in zf.infolist()}
+
+    @cached_property
+    def top_level_directory(self) -> str:
+        top_levels = {name.split("/")[0] for name in self._infos}
+        if len(top_levels) != 1:
+            raise RuntimeError(
+                f"Expected a single top-level directory in checkpoint zip file, found: {top_levels}"
+            )
+        return top_levels.pop()
+
+    @cached_property
+    def metadata(self) -> dict:
+        """The anemoi metadata of the checkpoint"""
+        for name in METADATA_NAMES:
+            paths = [p for p in self._infos if p.split("/")[-1] == name]
+            if len(paths) > 1:
+                raise ValueError(f"Found two or more '{name}' in {self.path}.")
+            if paths:
+                return json.loads(self.read(paths[0]))
+        raise FileNotFoundError(f"Could not find anemoi metadata in {self.path}")
+
+    def read(self, name: str) -> bytes:
+        """Read a file from the checkpoint zip archive."""
+        with zipfile.ZipFile(self.path) as zf:
+            return zf.read(name)
+
+    def metadata_files(self) -> list[str]:
+        """Names of all files in the metadata folder, such as forecast-in-a-box.json"""
+        prefix = f"{self.top_level_directory}/{METADATA_FOLDER}/"
+        return [
+            name[len(prefix) :]
+            for name in self._infos
+            if name.startswith(prefix) and not name.endswith(".numpy")
+        ]
+
+    @cached_property
+    def supporting_array_entries(self) -> dict[str, dict]:
+        """Path, shape and dtype of each supporting array, by name"""
+        entries: dict[str, dict] = {}
+        _flatten_entries(self.metadata.get("supporting_arrays_paths", {}), "", entries)
+        return entries
+
+    def supporting_array_shape(self, name: str) -> tuple[int, ...]:
+        return tuple(self._entry(name)["shape"])
+
+    def supporting_array(self, name: str, mmap: bool = True) -> np.ndarray:
+        """Read a single supporting array.
+
+        If the array is stored uncompressed, which is what anemoi does, and mmap is True,
+        the returned array is a read-only memory map of the checkpoint file.
+        """
+        entry = self._entry(name)
+        info = self._infos[entry["path"]]
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+
+        if mmap and info.compress_type == zipfile.ZIP_STORED and info.file_size > 0:
+            return np.memmap(
+                self.path,
+                dtype=dtype,
+                mode="r",
+                offset=self._data_offset(info),
+                shape=shape,
+            )
+        return np.frombuffer(self.read(entry["path"]), dtype=dtype).reshape(shape)
+
+    def _entry(self, name: str) -> dict:
+        try:
+            return self.supporting_array_entries[name]
+        except KeyError:
+            raise KeyError(
+                f"No supporting array {name} in {self.path}. Available: {', '.join(self.supporting_array_entries)}"
+            ) from None
+
+    def _data_offset(self, info: zipfile.ZipInfo) -> int:
+        # The local header may have a different extra field than the central directory,
+        # so its lengths have to be read from the file itself.
+        with open(self.path, "rb") as f:
+            f.seek(info.header_offset)
+            header = f.read(_LOCAL_HEADER_SIZE)
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        return info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+
+
+def _flatten_entries(entries: dict, prefix: str, result: dict[str, dict]) -> None:
+    for key, entry in entries.items():
+        if isinstance(entry, dict) and set(entry.keys()) != {"path", "shape", "dtype"}:
+            _flatten_entries(entry, f"{prefix}{key}/", result)
+        else:
+            result[f"{prefix}{key}"] = entry
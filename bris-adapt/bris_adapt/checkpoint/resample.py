@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.warp import reproject, transform, transform_bounds
+from rasterio.windows import Window
+
+from bris_adapt.orography.mosaic import GEOGRAPHIC_CRS
+
+RESAMPLINGS = ("nearest", "average", "mode")
+
+
+def resample_to_axes(
+    src: rasterio.DatasetReader,
+    x_axis: np.ndarray,
+    y_axis: np.ndarray,
+    resampling: str = "nearest",
+) -> np.ndarray:
+    """Resample the first band of a raster to a regular latitude/longitude grid.
+
+    Each grid point is the centre of a cell, and GDAL reads and warps the raster a block at
+    a time. With "average", each cell gets the mean of the raster pixels it covers, with
+    "mode" the most common value, and with "nearest" the pixel at its centre.
+
+    Returns an array with shape (len(y_axis), len(x_axis)), in the dtype of the raster, or
+    float32 for the average of an integer raster.
+    """
+    if resampling not in RESAMPLINGS:
+        raise ValueError(
+            f"Unknown resampling {resampling}, expected one of {', '.join(RESAMPLINGS)}"
+        )
+    _check_coverage(src, x_axis, y_axis)
+
+    dtype = np.dtype(src.dtypes[0])
+    if resampling == "average" and not np.issubdtype(dtype, np.floating):
+        dtype = np.dtype(np.float32)
+    nodata = src.nodata if src.nodata is not None else _default_nodata(dtype)
+
+    dx = abs(float(x_axis[1] - x_axis[0]))
+    dy = abs(float(y_axis[1] - y_axis[0]))
+    values = np.full((len(y_axis), len(x_axis)), nodata, dtype=dtype)
+    reproject(
+        source=rasterio.band(src, 1),
+        destination=values,
+        src_nodata=src.nodata,
+        dst_transform=from_origin(
+            float(np.min(x_axis)) - dx / 2, float(np.max(y_axis)) + dy / 2, dx, dy
+        ),
+        dst_crs=GEOGRAPHIC_CRS,
+        dst_nodata=nodata,
+        resampling=Resampling[resampling],
+        num_threads=os.cpu_count() or 1,
+        warp_mem_limit=256,
+    )
+
+    # The raster rows go from north to south, and its columns from west to east
+    if y_axis[0] < y_axis[-1]:
+        values = values[::-1]
+    if x_axis[0] > x_axis[-1]:
+        values = values[:, ::-1]
+    return _fill_nodata(values, nodata)
+
+
+def resample_to_points(
+    src: rasterio.DatasetReader, latitudes: np.ndarray, longitudes: np.ndarray
+) -> np.ndarray:
+    """The value of the raster pixel that each point falls in.
+
+    Only the window of the raster that contains the points is read.
+    """
+    xs, ys = np.ravel(longitudes), np.ravel(latitudes)
+    if src.crs is not None and src.crs != rasterio.CRS.from_string(GEOGRAPHIC_CRS):
+        xs, ys = (np.asarray(v) for v in transform(GEOGRAPHIC_CRS, src.crs, xs, ys))
+    columns, rows = ~src.transform * (xs, ys)
+    rows = np.floor(rows).astype(np.int64)
+    columns = np.floor(columns).astype(np.int64)
+    if rows.min() < 0 or rows.max() >= src.height:
+        raise ValueError("the orography file does not cover the whole grid")
+    if columns.min() < 0 or columns.max() >= src.width:
+        raise ValueError("the orography file does not cover the whole grid")
+
+    window = Window.from_slices(
+        (int(rows.min()), int(rows.max()) + 1),
+        (int(columns.min()), int(columns.max()) + 1),
+    )
+    data = src.read(1, window=window)
+    values = data[rows - rows.min(), columns - columns.min()]
+    if src.nodata is not None:
+        values = _fill_nodata(values, src.nodata)
+    return values.reshape(np.shape(latitudes))
+
+
+def _check_coverage(
+    src: rasterio.DatasetReader, x_axis: np.ndarray, y_axis: np.ndarray
+) -> None:
+    west, south, east, north = transform_bounds(
+        GEOGRAPHIC_CRS,
+        src.crs or GEOGRAPHIC_CRS,
+        float(np.min(x_axis)),
+        float(np.min(y_axis)),
+        float(np.max(x_axis)),
+        float(np.max(y_axis)),
+    )
+    left, bottom, right, top = src.bounds
+    if west < left or east > right or south < bottom or north > top:
+        raise ValueError(
+            f"the orography file covers {left}/{bottom}/{right}/{top}, which does not include "
+            f"the whole grid {west}/{south}/{east}/{north} (west/south/east/north)"
+        )
+
+
+def _default_nodata(dtype: np.dtype) -> float | int:
+    if np.issubdtype(dtype, np.floating):
+        return np.nan
+    return np.iinfo(dtype).min
+
+
+def _fill_nodata(values: np.ndarray, nodata: float | int) -> np.ndarray:
+    """Set points without data, such as voids in the raster, to sea level"""
+    missing = np.isnan(values) if np.isnan(nodata) else values == nodata
+    count = int(np.count_nonzero(missing))
+    if count:
+        print(f"Warning: no orography data for {count} points, using 0")
+        values = values.copy()
+        values[missing] = 0
+    return values
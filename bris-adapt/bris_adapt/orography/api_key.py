@@ -27,3 +27,14 @@ def read_api_key(filepath: str | None = None) -> str:
     with open(filepath, "r") as f:
         data = json.load(f)
     return data.get("api_key")
+
+
+def read_config(filepath: str | None = None) -> dict:
+    """The settings in the API key file, or none if there is no such file"""
+    if filepath is None:
+        filepath = find_api_key_file()
+        if filepath is None:
+            return {}
+
+    with open(filepath, "r") as f:
+        return json.load(f)
@@ -0,0 +1,148 @@
+import os
+import typing
+from dataclasses import dataclass
+
+from bris_adapt.orography.api_key import read_api_key, read_config
+from bris_adapt.orography.download import (
+    DEFAULT_TILE_SIZE,
+    TileIndex,
+    download_tiles,
+    tile_indices,
+    tile_path,
+)
+
+DEFAULT_TILE_CACHE = os.path.join(
+    os.path.expanduser("~"), ".cache", "bris-adapt", "orography"
+)
+DEFAULT_TILE_CACHE_SIZE = 5 * 1024 * 1024 * 1024
+
+
+@dataclass
+class CachedTile:
+    path: str
+    dem_type: str
+    tile_size: float
+    index: TileIndex
+    size: int  # bytes
+    last_used: float  # seconds since the epoch
+
+
+class TileCache:
+    """A directory of downloaded DEM tiles, named by DEM type, tile size and tile index.
+
+    The least recently used tiles are removed when the total size goes above max_size bytes.
+    Using a tile marks it as used by updating its modification time.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_TILE_CACHE,
+        max_size: int = DEFAULT_TILE_CACHE_SIZE,
+    ):
+        self.directory = directory
+        self.max_size = max_size
+
+    @classmethod
+    def from_config(cls, filepath: str | None = None) -> "TileCache":
+        """The tile cache set up in the API key file (.opentopographyrc).
+
+        The file may have a "tile_cache" directory and a "tile_cache_size" in MiB, next to
+        the "api_key".
+        """
+        config = read_config(filepath)
+        directory = os.path.expanduser(config.get("tile_cache", DEFAULT_TILE_CACHE))
+        max_size = config.get("tile_cache_size")
+        return cls(
+            directory,
+            (
+                int(max_size * 1024 * 1024)
+                if max_size is not None
+                else DEFAULT_TILE_CACHE_SIZE
+            ),
+        )
+
+    def get(
+        self,
+        area_latlon: tuple[float | str, float | str, float | str, float | str],
+        dem_type: str = "SRTMGL3",
+        api_key: str | None = None,
+        **kwargs: typing.Any,
+    ) -> list[str]:
+        """Paths of the tiles covering an area, downloading those that are not cached.
+
+        The API key is only read, if not given, when something has to be downloaded. Other
+        keyword arguments are passed to download_tiles.
+        """
+        tile_size = kwargs.get("tile_size", DEFAULT_TILE_SIZE)
+        paths = [
+            tile_path(self.directory, dem_type, tile_size, index)
+            for index in tile_indices(area_latlon, tile_size)
+        ]
+        if all(os.path.exists(path) for path in paths):
+            print(f"Using {len(paths)} cached orography tiles from {self.directory}")
+        else:
+            if api_key is None:
+                api_key = read_api_key()
+            paths = download_tiles(
+                area_latlon, self.directory, api_key, dem_type, **kwargs
+            )
+
+        for path in paths:
+            os.utime(path)
+        self.evict(keep=paths)
+        return paths
+
+    def tiles(self) -> list[CachedTile]:
+        """The tiles in the cache, least recently used first"""
+        if not os.path.isdir(self.directory):
+            return []
+        tiles = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".tif"):
+                continue
+            try:
+                dem_type, tile_size, lat_index, lon_index = entry.name[:-4].rsplit(
+                    "_", 3
+                )
+                index = (int(lat_index), int(lon_index))
+                stat = entry.stat()
+            except (ValueError, FileNotFoundError):
+                continue  # not a tile, or removed by another process
+            tiles.append(
+                CachedTile(
+                    path=entry.path,
+                    dem_type=dem_type,
+                    tile_size=float(tile_size),
+                    index=index,
+                    size=stat.st_size,
+                    last_used=stat.st_mtime,
+                )
+            )
+        return sorted(tiles, key=lambda tile: tile.last_used)
+
+    def evict(
+        self, keep: typing.Iterable[str] = (), max_size: int | None = None
+    ) -> list[CachedTile]:
+        """Remove the least recently used tiles until the cache is below max_size bytes.
+
+        max_size defaults to the size limit of the cache. Tiles in keep are not removed.
+        Returns the removed tiles.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        keep = set(keep)
+        tiles = self.tiles()
+        total = sum(tile.size for tile in tiles)
+        removed = []
+        for tile in tiles:
+            if total <= max_size:
+                break
+            if tile.path in keep:
+                continue
+            try:
+                os.remove(tile.path)
+            except FileNotFoundError:
+                pass
+            total -= tile.size
+            removed.append(tile)
+        return removed
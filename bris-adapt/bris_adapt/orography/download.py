@@ -1,24 +1,199 @@
-from typing import BinaryIO
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import rasterio
 import requests
+from requests.adapters import HTTPAdapter
 
+from bris_adapt.orography.mosaic import open_orography
 
-def download(
+GLOBALDEM_URL = "https://portal.opentopography.org/API/globaldem"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_TILE_SIZE = 1.0  # degrees
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 2.0  # seconds before the first retry, doubled for each following one
+
+TileIndex = tuple[int, int]  # latitude and longitude index of the south west corner
+
+
+def download_tiles(
     area_latlon: tuple[float | str, float | str, float | str, float | str],
-    dest_stream: BinaryIO,
+    tile_dir: str,
     api_key: str,
     dem_type: str = "SRTMGL3",
-) -> None:
+    tile_size: float = DEFAULT_TILE_SIZE,
+    workers: int = DEFAULT_WORKERS,
+    retries: int = DEFAULT_RETRIES,
+    backoff: float = DEFAULT_BACKOFF,
+    url: str = GLOBALDEM_URL,
+) -> list[str]:
     """
-    Download topography data from OpenTopography Global DEM API.
+    Download the topography covering an area as tiles, several at a time.
+
+    The area is split into tiles of tile_size degrees on a fixed grid, which are fetched by
+    up to workers threads sharing one HTTP session. A tile that fails is retried up to
+    retries times, waiting backoff seconds and then twice as long each time. Each tile is
+    written to tile_dir as soon as it is complete, and tiles that are already there are not
+    downloaded again, so an interrupted download can be resumed by running it again.
 
     Args:
       area_latlon (tuple): Bounding box coordinates as (north, west, south, east).
-      dest_stream (BinaryIO): A writable binary file-like object to save the downloaded data.
+      tile_dir (str): Directory to save the tiles in.
       dem_type (str): DEM type (default: 'SRTMGL3').
+
+    Returns:
+      list: The paths of the tiles, which may be read as one raster with
+      bris_adapt.orography.mosaic.open_orography.
+    """
+    os.makedirs(tile_dir, exist_ok=True)
+    indices = tile_indices(area_latlon, tile_size)
+    paths = {
+        index: tile_path(tile_dir, dem_type, tile_size, index) for index in indices
+    }
+    missing = [index for index in indices if not os.path.exists(paths[index])]
+    print(
+        f"Downloading {len(missing)} of {len(indices)} tiles of DEM type {dem_type} "
+        f"for area {area_latlon}..."
+    )
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    lock = threading.Lock()
+    done_tiles = 0
+    done_bytes = 0
+
+    def fetch(index: TileIndex) -> None:
+        nonlocal done_tiles, done_bytes
+        params = _request_params(tile_bounds(index, tile_size), api_key, dem_type)
+        size = _download_with_retries(
+            session, url, params, paths[index], retries, backoff
+        )
+        with lock:
+            done_tiles += 1
+            done_bytes += size
+            print(f"  tile {index} ({done_tiles}/{len(missing)})", flush=True)
+
+    start = time.perf_counter()
+    with session, ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume the results, so that errors are raised
+        list(executor.map(fetch, missing))
+    elapsed = time.perf_counter() - start
+    if missing:
+        print(
+            f"Downloaded {done_bytes / 1e6:.1f} MB in {elapsed:.1f} s "
+            f"({done_bytes / 1e6 / max(elapsed, 1e-6):.1f} MB/s)"
+        )
+    return [paths[index] for index in indices]
+
+
+def download_mosaic(
+    area_latlon: tuple[float | str, float | str, float | str, float | str],
+    dest: str,
+    api_key: str,
+    dem_type: str = "SRTMGL3",
+    tile_dir: str | None = None,
+    **kwargs,
+) -> None:
+    """
+    Download the topography of an area as tiles, and combine them into one GeoTIFF.
+
+    The tiles are kept in tile_dir, which defaults to dest with .tiles appended, until the
+    GeoTIFF is written, so that an interrupted download can be resumed. Other keyword
+    arguments are passed to download_tiles.
+    """
+    if tile_dir is None:
+        tile_dir = f"{dest}.tiles"
+    paths = download_tiles(area_latlon, tile_dir, api_key, dem_type, **kwargs)
+
+    write_mosaic(paths, area_latlon, dest)
+
+    for path in paths:
+        os.remove(path)
+    if not os.listdir(tile_dir):
+        os.rmdir(tile_dir)
+
+
+def write_mosaic(
+    paths: list[str],
+    area_latlon: tuple[float | str, float | str, float | str, float | str],
+    dest: str,
+) -> None:
+    """Combine the part of the tiles inside an area into one GeoTIFF, a block at a time.
+
+    Each block is read through the VRT mosaic of the tiles, which only reads the tile blocks
+    under it, so the whole area is never held in memory.
     """
-    url = "https://portal.opentopography.org/API/globaldem"
-    params = {
+    north, west, south, east = (float(v) for v in area_latlon)
+    with open_orography(paths, (west, south, east, north)) as src:
+        profile = src.profile
+        profile.update(
+            driver="GTiff",
+            tiled=True,
+            blockxsize=256,
+            blockysize=256,
+            compress="deflate",
+        )
+        # A temporary file left by an interrupted run is not a valid GeoTIFF
+        tmp_path = f"{dest}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with rasterio.open(tmp_path, "w", **profile) as dst:
+            for _, window in dst.block_windows(1):
+                dst.write(src.read(window=window), window=window)
+    os.replace(tmp_path, dest)
+
+    print(f"Saved DEM to {dest}")
+
+
+def tile_indices(
+    area_latlon: tuple[float | str, float | str, float | str, float | str],
+    tile_size: float = DEFAULT_TILE_SIZE,
+) -> list[TileIndex]:
+    """Indices of the tiles that cover an area given as (north, west, south, east)"""
+    north, west, south, east = (float(v) for v in area_latlon)
+    if north <= south or east <= west:
+        raise ValueError(f"Invalid area {area_latlon}, expected north/west/south/east")
+    return [
+        (lat_index, lon_index)
+        for lat_index in range(
+            math.floor(south / tile_size), math.ceil(north / tile_size)
+        )
+        for lon_index in range(
+            math.floor(west / tile_size), math.ceil(east / tile_size)
+        )
+    ]
+
+
+def tile_bounds(
+    index: TileIndex, tile_size: float = DEFAULT_TILE_SIZE
+) -> tuple[float, float, float, float]:
+    """Bounding box of a tile as (north, west, south, east)"""
+    lat_index, lon_index = index
+    return (
+        (lat_index + 1) * tile_size,
+        lon_index * tile_size,
+        lat_index * tile_size,
+        (lon_index + 1) * tile_size,
+    )
+
+
+def tile_path(tile_dir: str, dem_type: str, tile_size: float, index: TileIndex) -> str:
+    return os.path.join(tile_dir, f"{dem_type}_{tile_size:g}_{index[0]}_{index[1]}.tif")
+
+
+def _request_params(
+    area_latlon: tuple[float | str, float | str, float | str, float | str],
+    api_key: str,
+    dem_type: str,
+) -> dict:
+    return {
         "demtype": dem_type,
         "south": area_latlon[2],
         "north": area_latlon[0],
@@ -27,14 +202,42 @@ def download(
         "outputFormat": "GTiff",
         "API_Key": api_key,
     }
-    response = requests.get(url, params=params, stream=True)
-    response.raise_for_status()
-    print(f"Downloading DEM of type {dem_type} for area {area_latlon}...")
-    print("Downloading...", end="", flush=True)
-    count = 0
-    for chunk in response.iter_content(chunk_size=8192):
-        count += 1
-        if count % 100 == 0:
-            print(".", end="", flush=True)
-        dest_stream.write(chunk)
-    print(f"\nDownloaded DEM to stream")
+
+
+def _download_with_retries(
+    session: requests.Session,
+    url: str,
+    params: dict,
+    path: str,
+    retries: int,
+    backoff: float,
+) -> int:
+    """Download to path through a temporary file, retrying connection and server errors"""
+    tmp_path = f"{path}.{threading.get_ident()}.part"
+    attempt = 0
+    while True:
+        try:
+            with session.get(url, params=params, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                size = 0
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp_path, path)
+            return size
+        except requests.RequestException as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            status = e.response.status_code if e.response is not None else None
+            retryable = status is None or status == 429 or status >= 500
+            if not retryable or attempt == retries:
+                raise
+            delay = backoff * 2**attempt
+            attempt += 1
+            # The URL in the message of e contains the API key, so it is not printed
+            reason = status or type(e).__name__
+            print(
+                f"  retrying tile {params['north']}/{params['west']} in {delay:g} s ({reason})"
+            )
+            time.sleep(delay)
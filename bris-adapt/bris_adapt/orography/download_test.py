@@ -0,0 +1,168 @@
+import http.server
+import os
+import threading
+import urllib.parse
+
+import numpy as np
+import pytest
+import rasterio
+import requests
+from rasterio.transform import from_origin
+
+from bris_adapt.orography.download import download_mosaic, download_tiles
+
+AREA = (61.5, 5.5, 60.5, 7.0)  # north, west, south, east; 2 x 2 tiles of 1 degree
+RESOLUTION = 0.05  # degrees
+
+
+def _tile(north: float, west: float, south: float, east: float) -> bytes:
+    """A GeoTIFF of the given bounds with values that depend on the position"""
+    width = round((east - west) / RESOLUTION)
+    height = round((north - south) / RESOLUTION)
+    rows, columns = np.mgrid[0:height, 0:width]
+    values = (
+        (north - rows * RESOLUTION) * 1000 + (west + columns * RESOLUTION)
+    ).astype("float32")
+    with rasterio.MemoryFile() as memory_file:
+        with memory_file.open(
+            driver="GTiff",
+            width=width,
+            height=height,
+            count=1,
+            dtype="float32",
+            crs="EPSG:4326",
+            transform=from_origin(west, north, RESOLUTION, RESOLUTION),
+        ) as dst:
+            dst.write(values, 1)
+        return memory_file.read()
+
+
+class StandInGlobalDem(http.server.ThreadingHTTPServer):
+    """Serves tiles like the OpenTopography Global DEM API, failing as it is told to.
+
+    failures maps the (north, west) corner of a tile to a list of what to do with the next
+    requests for it: "503" answers with an error, "truncate" closes the connection halfway
+    through the body.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.failures: dict[tuple[float, float], list[str]] = {}
+        self.requests: list[tuple[float, float]] = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/API/globaldem"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server: StandInGlobalDem
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        north, west, south, east = (
+            float(query[key]) for key in ("north", "west", "south", "east")
+        )
+        with self.server.lock:
+            self.server.requests.append((north, west))
+            failures = self.server.failures.get((north, west), [])
+            failure = failures.pop(0) if failures else None
+
+        if failure == "503":
+            self.send_error(503)
+            return
+        data = _tile(north, west, south, east)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/tiff")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if failure == "truncate":
+            self.wfile.write(data[: len(data) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def server():
+    server = StandInGlobalDem()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_retry_after_server_error(server: StandInGlobalDem, tmp_path):
+    server.failures = {(61.0, 5.0): ["503", "503"], (61.0, 6.0): ["503"]}
+
+    paths = download_tiles(AREA, str(tmp_path), "key", backoff=0.01, url=server.url)
+
+    assert len(paths) == 4
+    assert server.requests.count((61.0, 5.0)) == 3
+    assert server.requests.count((61.0, 6.0)) == 2
+    assert len(server.requests) == 7
+    for path in paths:
+        with rasterio.open(path) as src:
+            assert src.shape == (20, 20)
+
+
+def test_server_error_after_last_retry(server: StandInGlobalDem, tmp_path):
+    server.failures = {(61.0, 5.0): ["503"] * 3}
+
+    with pytest.raises(requests.HTTPError, match="503"):
+        download_tiles(
+            AREA, str(tmp_path), "key", retries=2, backoff=0.01, url=server.url
+        )
+    assert server.requests.count((61.0, 5.0)) == 3
+
+
+def test_resume_after_truncated_transfer(server: StandInGlobalDem, tmp_path):
+    tile_dir = tmp_path / "tiles"
+    server.failures = {(62.0, 6.0): ["truncate"] * 2}
+
+    # With one retry, the tile that is cut off twice fails the download
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download_mosaic(
+            AREA,
+            str(tmp_path / "dem.tif"),
+            "key",
+            tile_dir=str(tile_dir),
+            retries=1,
+            backoff=0.01,
+            url=server.url,
+        )
+    assert server.requests.count((62.0, 6.0)) == 2
+    # Nothing is left of the truncated tile, and the other tiles are kept
+    assert sorted(os.listdir(tile_dir)) == [
+        "SRTMGL3_1_60_5.tif",
+        "SRTMGL3_1_60_6.tif",
+        "SRTMGL3_1_61_5.tif",
+    ]
+
+    # Running again only downloads the missing tile
+    server.requests.clear()
+    download_mosaic(
+        AREA,
+        str(tmp_path / "dem.tif"),
+        "key",
+        tile_dir=str(tile_dir),
+        backoff=0.01,
+        url=server.url,
+    )
+    assert server.requests == [(62.0, 6.0)]
+    assert not tile_dir.exists()
+
+    north, west, south, east = AREA
+    with rasterio.open(tmp_path / "dem.tif") as src:
+        assert src.bounds == pytest.approx((west, south, east, north))
+        values = src.read(1)
+    expected = (
+        (north - np.arange(values.shape[0]) * RESOLUTION)[:, None] * 1000
+        + (west + np.arange(values.shape[1]) * RESOLUTION)[None, :]
+    ).astype("float32")
+    assert np.array_equal(values, expected)
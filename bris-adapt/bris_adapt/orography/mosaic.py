@@ -0,0 +1,234 @@
+import contextlib
+import glob
+import math
+import os
+import typing
+from xml.etree import ElementTree
+
+import numpy as np
+import rasterio
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+
+TILE_PATTERNS = ("*.tif", "*.tiff", "*.vrt")
+
+GEOGRAPHIC_CRS = "EPSG:4326"
+
+# west, south, east, north in degrees
+Bounds = tuple[float, float, float, float]
+
+# numpy dtype names of the raster types that a VRT band may have
+GDAL_DATA_TYPES = {
+    "uint8": "Byte",
+    "int8": "Int8",
+    "uint16": "UInt16",
+    "int16": "Int16",
+    "uint32": "UInt32",
+    "int32": "Int32",
+    "float32": "Float32",
+    "float64": "Float64",
+}
+
+OrographySource = typing.Union[str, os.PathLike, typing.Sequence[str], typing.BinaryIO]
+
+
+def tile_paths(source: str | os.PathLike | typing.Sequence[str]) -> list[str]:
+    """The raster files of an orography source.
+
+    The source is a GeoTIFF or VRT file, a directory of them, or a list of files and
+    directories.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = [os.fspath(source)]
+    paths = []
+    for path in source:
+        if os.path.isdir(path):
+            tiles = sorted(
+                tile
+                for pattern in TILE_PATTERNS
+                for tile in glob.glob(os.path.join(path, pattern))
+            )
+            if not tiles:
+                raise ValueError(f"no GeoTIFF or VRT files found in {path}")
+            paths.extend(tiles)
+        else:
+            paths.append(os.fspath(path))
+    if not paths:
+        raise ValueError("no orography files given")
+    return paths
+
+
+@contextlib.contextmanager
+def open_orography(
+    source: OrographySource, bounds: Bounds | None = None
+) -> typing.Iterator[rasterio.DatasetReader]:
+    """Open an orography source as a single raster.
+
+    A stream, or a single file such as a GeoTIFF or a VRT, is opened as it is, and GDAL only
+    reads the blocks that are used from it. Several tiles are combined into a VRT mosaic of
+    the area within bounds, which refers to the windows of the tiles that intersect it, so
+    that reads and warps of the mosaic only read the blocks of the tiles that they need.
+    Without bounds, the mosaic covers all the tiles.
+    """
+    if hasattr(source, "read"):
+        with rasterio.MemoryFile(source) as memory_file:  # type: ignore
+            with memory_file.open() as src:
+                yield src
+        return
+
+    paths = tile_paths(source)  # type: ignore
+    if len(paths) == 1:
+        with rasterio.open(paths[0]) as src:
+            yield src
+        return
+
+    vrt = _mosaic_vrt(paths, bounds)
+    with rasterio.MemoryFile(vrt.encode(), ext=".vrt") as memory_file:
+        with memory_file.open() as src:
+            yield src
+
+
+def _mosaic_vrt(paths: list[str], bounds: Bounds | None) -> str:
+    """A VRT of the tiles within bounds, on the pixel grid of the first tile.
+
+    Where tiles overlap, the first one with data is used, like rasterio.merge does.
+    """
+    with contextlib.ExitStack() as stack:
+        tiles = [stack.enter_context(rasterio.open(path)) for path in paths]
+        first = tiles[0]
+        mosaic_bounds = (
+            min(t.bounds.left for t in tiles),
+            min(t.bounds.bottom for t in tiles),
+            max(t.bounds.right for t in tiles),
+            max(t.bounds.top for t in tiles),
+        )
+        if bounds is not None:
+            snapped = _snap_bounds(
+                first,
+                transform_bounds(GEOGRAPHIC_CRS, first.crs or GEOGRAPHIC_CRS, *bounds),
+            )
+            tiles = [t for t in tiles if _intersects(t.bounds, snapped)]
+            if not tiles:
+                raise ValueError(
+                    f"none of the {len(paths)} orography files cover the area {bounds} (west/south/east/north)"
+                )
+            # Do not extend the mosaic beyond the tiles, so that missing coverage is detected
+            mosaic_bounds = (
+                max(snapped[0], min(t.bounds.left for t in tiles)),
+                max(snapped[1], min(t.bounds.bottom for t in tiles)),
+                min(snapped[2], max(t.bounds.right for t in tiles)),
+                min(snapped[3], max(t.bounds.top for t in tiles)),
+            )
+
+        dtype = np.dtype(first.dtypes[0])
+        nodata = first.nodata
+        if nodata is None:
+            nodata = (
+                np.nan if np.issubdtype(dtype, np.floating) else np.iinfo(dtype).min
+            )
+        dx, dy = abs(first.transform.a), abs(first.transform.e)
+        left, bottom, right, top = mosaic_bounds
+        width = round((right - left) / dx)
+        height = round((top - bottom) / dy)
+
+        root = ElementTree.Element(
+            "VRTDataset", rasterXSize=str(width), rasterYSize=str(height)
+        )
+        if first.crs is not None:
+            ElementTree.SubElement(root, "SRS").text = first.crs.to_wkt()
+        ElementTree.SubElement(root, "GeoTransform").text = (
+            f"{left!r}, {dx!r}, 0.0, {top!r}, 0.0, {-dy!r}"
+        )
+        band = ElementTree.SubElement(
+            root, "VRTRasterBand", dataType=GDAL_DATA_TYPES[dtype.name], band="1"
+        )
+        ElementTree.SubElement(band, "NoDataValue").text = repr(float(nodata))
+        # Later sources are drawn over earlier ones, so the first tile goes last
+        for tile in reversed(tiles):
+            _add_source(band, tile, mosaic_bounds, dx, dy)
+        return ElementTree.tostring(root, encoding="unicode")
+
+
+def _add_source(
+    band: ElementTree.Element,
+    tile: rasterio.DatasetReader,
+    mosaic_bounds: Bounds,
+    dx: float,
+    dy: float,
+) -> None:
+    """Add the part of a tile inside the mosaic to a VRT band"""
+    left, bottom, right, top = mosaic_bounds
+    west = max(left, tile.bounds.left)
+    east = min(right, tile.bounds.right)
+    south = max(bottom, tile.bounds.bottom)
+    north = min(top, tile.bounds.top)
+    if west >= east or south >= north:
+        return
+    tile_dx, tile_dy = abs(tile.transform.a), abs(tile.transform.e)
+
+    source = ElementTree.SubElement(band, "ComplexSource")
+    ElementTree.SubElement(source, "SourceFilename", relativeToVRT="0").text = (
+        os.path.abspath(tile.name)
+    )
+    ElementTree.SubElement(source, "SourceBand").text = "1"
+    ElementTree.SubElement(
+        source,
+        "SrcRect",
+        xOff=str(round((west - tile.bounds.left) / tile_dx)),
+        yOff=str(round((tile.bounds.top - north) / tile_dy)),
+        xSize=str(round((east - west) / tile_dx)),
+        ySize=str(round((north - south) / tile_dy)),
+    )
+    ElementTree.SubElement(
+        source,
+        "DstRect",
+        xOff=str(round((west - left) / dx)),
+        yOff=str(round((top - north) / dy)),
+        xSize=str(round((east - west) / dx)),
+        ySize=str(round((north - south) / dy)),
+    )
+    if tile.nodata is not None:
+        # Pixels without data do not hide the data of other tiles
+        ElementTree.SubElement(source, "NODATA").text = repr(float(tile.nodata))
+
+
+def bounds_window(src: rasterio.DatasetReader, bounds: Bounds) -> Window:
+    """The window of whole pixels of a raster that covers bounds, limited to the raster"""
+    west, south, east, north = transform_bounds(
+        GEOGRAPHIC_CRS, src.crs or GEOGRAPHIC_CRS, *bounds
+    )
+    columns, rows = ~src.transform * (
+        np.array([west, east, west, east]),
+        np.array([north, north, south, south]),
+    )
+    row_start = max(math.floor(min(rows)), 0)
+    row_stop = min(math.ceil(max(rows)), src.height)
+    column_start = max(math.floor(min(columns)), 0)
+    column_stop = min(math.ceil(max(columns)), src.width)
+    if row_start >= row_stop or column_start >= column_stop:
+        raise ValueError(
+            f"the orography file does not cover the area {bounds} (west/south/east/north)"
+        )
+    return Window.from_slices((row_start, row_stop), (column_start, column_stop))
+
+
+def _snap_bounds(src: rasterio.DatasetReader, bounds: Bounds) -> Bounds:
+    """Extend bounds outwards to the pixel edges of a raster, so that a mosaic stays aligned"""
+    west, south, east, north = bounds
+    dx, dy = abs(src.transform.a), abs(src.transform.e)
+    left, top = src.transform.c, src.transform.f
+    return (
+        left + math.floor(round((west - left) / dx, 6)) * dx,
+        top - math.ceil(round((top - south) / dy, 6)) * dy,
+        left + math.ceil(round((east - left) / dx, 6)) * dx,
+        top - math.floor(round((top - north) / dy, 6)) * dy,
+    )
+
+
+def _intersects(tile_bounds: typing.Any, bounds: Bounds) -> bool:
+    return (
+        tile_bounds.left < bounds[2]
+        and tile_bounds.right > bounds[0]
+        and tile_bounds.bottom < bounds[3]
+        and tile_bounds.top > bounds[1]
+    )
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from bris_adapt.orography.mosaic import open_orography
+
+RESOLUTION = 0.1  # degrees
+NODATA = -9999.0
+
+
+def _elevation(north: float, west: float, height: int, width: int) -> np.ndarray:
+    """Elevation that depends on the position, the same whichever tile it is read from"""
+    latitudes = north - (np.arange(height) + 0.5) * RESOLUTION
+    longitudes = west + (np.arange(width) + 0.5) * RESOLUTION
+    return (latitudes[:, None] * 1000 + longitudes[None, :]).astype("float32")
+
+
+def _write_tile(path, north: float, west: float, size: int = 10, holes=False) -> str:
+    values = _elevation(north, west, size, size)
+    if holes:
+        values[::3, ::2] = NODATA
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=size,
+        height=size,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(west, north, RESOLUTION, RESOLUTION),
+        nodata=NODATA,
+    ) as dst:
+        dst.write(values, 1)
+    return str(path)
+
+
+@pytest.fixture
+def tiles(tmp_path) -> list[str]:
+    # 2 x 2 tiles of one degree, and a tile with holes overlapping all of them
+    paths = [
+        _write_tile(tmp_path / f"tile_{north}_{west}.tif", north, west)
+        for north in (61, 62)
+        for west in (5, 6)
+    ]
+    return paths + [_write_tile(tmp_path / "overlap.tif", 61.5, 5.5, holes=True)]
+
+
+def test_mosaic_of_all_tiles(tiles):
+    with open_orography(tiles) as src:
+        assert src.driver == "VRT"
+        assert src.bounds == pytest.approx((5, 60, 7, 62))
+        assert np.array_equal(src.read(1), _elevation(62, 5, 20, 20))
+
+
+def test_mosaic_of_area(tiles):
+    # Extended outwards to whole pixels, and limited to the tiles
+    with open_orography(tiles, (5.55, 60.95, 7.5, 61.42)) as src:
+        assert src.bounds == pytest.approx((5.5, 60.9, 7.0, 61.5))
+        assert np.array_equal(src.read(1), _elevation(61.5, 5.5, 6, 15))
+        window = src.read(1, window=Window(3, 2, 7, 3))
+    assert np.array_equal(window, _elevation(61.3, 5.8, 3, 7))
+
+
+def test_area_outside_tiles(tiles):
+    with pytest.raises(ValueError, match="cover the area"):
+        with open_orography(tiles, (10, 50, 11, 51)):
+            pass
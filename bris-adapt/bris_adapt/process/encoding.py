@@ -0,0 +1,170 @@
+import os
+import time
+from typing import Dict, Literal
+
+import numpy as np
+import pydantic
+import xarray as xr
+
+
+class EncodingProfileConfig(pydantic.BaseModel):
+    compression: Literal["zlib", "zstd"] | None = None
+    complevel: int = 4
+    shuffle: bool = True
+    chunking: Literal["map", "timeseries"] | None = (
+        None  # map: one chunk per field, timeseries: all times for a small tile
+    )
+    timeseries_tile: int = (
+        16  # horizontal size of a chunk, in grid points, when chunking is timeseries
+    )
+    packing: Literal["int16"] | None = (
+        None  # store as int16 with scale_factor/add_offset
+    )
+    keep_bits: int | None = (
+        None  # bit-round to this many mantissa bits before compression
+    )
+
+
+INT16_FILL_VALUE = np.iinfo(np.int16).min
+
+
+def make_encoding(
+    ds: xr.Dataset, profile: EncodingProfileConfig
+) -> Dict[str, Dict[str, object]]:
+    """Create a to_netcdf encoding for all gridded data variables of ds, according to profile."""
+    encoding = {}
+    for name, variable in ds.data_vars.items():
+        if "lat" not in variable.dims or "lon" not in variable.dims:
+            continue
+
+        var_encoding: Dict[str, object] = {}
+        if profile.compression is not None:
+            var_encoding["compression"] = profile.compression
+            var_encoding["complevel"] = profile.complevel
+            var_encoding["shuffle"] = profile.shuffle
+
+        if profile.chunking is not None:
+            var_encoding["chunksizes"] = _chunk_shape(variable, profile)
+
+        if profile.packing == "int16" and np.issubdtype(variable.dtype, np.floating):
+            var_encoding.update(_int16_packing(variable))
+        elif profile.keep_bits is not None:
+            var_encoding["significant_digits"] = profile.keep_bits
+            var_encoding["quantize_mode"] = "BitRound"
+
+        encoding[str(name)] = var_encoding
+    return encoding
+
+
+def make_zarr_encoding(
+    ds: xr.Dataset, profile: EncodingProfileConfig | None, zarr_format: int
+) -> Dict[str, Dict[str, object]]:
+    """Create a to_zarr encoding for all gridded data variables of ds, according to profile.
+
+    Without a profile, data is chunked as maps, one time step and level per chunk."""
+    if profile is None:
+        profile = EncodingProfileConfig(chunking="map")
+    if profile.chunking is None:
+        profile = profile.model_copy(update={"chunking": "map"})
+
+    encoding = {}
+    for name, variable in ds.data_vars.items():
+        if "lat" not in variable.dims or "lon" not in variable.dims:
+            continue
+
+        var_encoding: Dict[str, object] = {"chunks": _chunk_shape(variable, profile)}
+        if profile.compression is not None:
+            var_encoding["compressors"] = [_zarr_compressor(profile, zarr_format)]
+        if profile.keep_bits is not None and profile.packing is None:
+            var_encoding["filters"] = [_zarr_bitround(profile.keep_bits, zarr_format)]
+
+        if profile.packing == "int16" and np.issubdtype(variable.dtype, np.floating):
+            var_encoding.update(_int16_packing(variable))
+
+        encoding[str(name)] = var_encoding
+    return encoding
+
+
+def _zarr_compressor(profile: EncodingProfileConfig, zarr_format: int) -> object:
+    if zarr_format == 2:
+        import numcodecs
+
+        if profile.compression == "zstd":
+            return numcodecs.Zstd(level=profile.complevel)
+        return numcodecs.Zlib(level=profile.complevel)
+
+    from zarr.codecs import GzipCodec, ZstdCodec
+
+    if profile.compression == "zstd":
+        return ZstdCodec(level=profile.complevel)
+    return GzipCodec(level=profile.complevel)
+
+
+def _zarr_bitround(keep_bits: int, zarr_format: int) -> object:
+    if zarr_format == 2:
+        import numcodecs
+
+        return numcodecs.BitRound(keepbits=keep_bits)
+
+    from numcodecs.zarr3 import BitRound
+
+    return BitRound(keepbits=keep_bits)
+
+
+def _chunk_shape(
+    variable: xr.DataArray, profile: EncodingProfileConfig
+) -> tuple[int, ...]:
+    shape = []
+    for dim, size in variable.sizes.items():
+        if dim in ("lat", "lon"):
+            shape.append(
+                size
+                if profile.chunking == "map"
+                else min(size, profile.timeseries_tile)
+            )
+        elif dim == "time":
+            shape.append(1 if profile.chunking == "map" else size)
+        else:
+            shape.append(1)
+    return tuple(shape)
+
+
+def _int16_packing(variable: xr.DataArray) -> Dict[str, object]:
+    # This needs the value range of the variable, so for lazy data it costs an extra pass over the input
+    low = float(variable.min(skipna=True))
+    high = float(variable.max(skipna=True))
+    # Reserve the lowest value for _FillValue
+    steps = np.iinfo(np.int16).max - INT16_FILL_VALUE - 1
+    scale_factor = (high - low) / steps if high > low else 1.0
+    add_offset = (high + low) / 2
+    return {
+        "dtype": "int16",
+        "scale_factor": scale_factor,
+        "add_offset": add_offset,
+        "_FillValue": INT16_FILL_VALUE,
+    }
+
+
+def write_netcdf(
+    ds: xr.Dataset,
+    output: str,
+    profile_name: str | None,
+    profile: EncodingProfileConfig | None,
+) -> None:
+    """Write ds to output, encoded according to profile, and report the resulting size and write time."""
+    encoding = make_encoding(ds, profile) if profile is not None else None
+
+    start = time.perf_counter()
+    ds.to_netcdf(output, encoding=encoding)
+    elapsed = time.perf_counter() - start
+
+    report_size(ds, output, os.path.getsize(output), profile_name, elapsed)
+
+
+def report_size(
+    ds: xr.Dataset, output: str, size: int, profile_name: str | None, elapsed: float
+) -> None:
+    print(
+        f"Wrote {output} with encoding profile {profile_name or 'none'}: "
+        f"{size / 2**20:.1f} MiB ({100 * size / ds.nbytes:.1f}% of in-memory size) in {elapsed:.2f} s"
+    )
@@ -0,0 +1,408 @@
+import json
+import pint
+import xarray as xr
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict
+import pydantic
+
+from .encoding import EncodingProfileConfig
+from .grid_template import GridTemplate, get_grid_template
+from .regrid import RegridTemplate, get_regrid_template
+from .subset import LeadTimes, Subset, point_runs, time_indices
+
+
+class VariableConfig(pydantic.BaseModel):
+    variable_name: str
+    attributes: Dict[str, object]
+    assumed_input_units: str | None = (
+        None  # if set, convert from this unit to the unit in attributes
+    )
+
+
+class SurfaceVariablesConfig(pydantic.BaseModel):
+    variables: Dict[str, VariableConfig]
+
+
+class PressureLevelVariablesConfig(pydantic.BaseModel):
+    levels: list[int]
+    variables: Dict[str, VariableConfig]
+
+
+class VariablesConfig(pydantic.BaseModel):
+    sfc: SurfaceVariablesConfig
+    pl: PressureLevelVariablesConfig
+
+
+class MkGridConfig(pydantic.BaseModel):
+    variables: VariablesConfig
+    encoding_profiles: Dict[str, EncodingProfileConfig] = {}
+
+
+def load_config(config: str) -> MkGridConfig:
+    with open(config) as f:
+        config_json = json.load(f)
+        return MkGridConfig.model_validate(config_json)
+
+
+def make_grid(
+    data: str | xr.Dataset,
+    config: MkGridConfig | str,
+    checkpoint: str | None = None,
+    subset: Subset | None = None,
+    time_block: int | None = 1,
+    workers: int | None = 1,
+) -> xr.Dataset:
+    """Convert anemoi-inference output to a gridded, CF-annotated dataset.
+
+    data is the path of an anemoi-inference output file, or an opened one. config is the variable mapping,
+    or the path of a configuration file like etc/mkgrid.json. checkpoint is needed if the output also has
+    global points, and subset selects a part of the forecast to convert.
+
+    The result is lazy: with time_block set, the default, variables are dask arrays reading blocks of that many
+    time steps from data only when computed. With time_block None, data is read at once, and where the points
+    are already in grid order, variables are views of the arrays read, without copies.
+    """
+    if isinstance(config, str):
+        config = load_config(config)
+    if isinstance(data, str):
+        data = xr.open_dataset(data)
+    setup = GridSetup.create(
+        config, data.latitude.values, data.longitude.values, checkpoint, subset
+    )
+    return grid_dataset(data, setup, workers=workers, time_block=time_block)
+
+
+@dataclass
+class GridSetup:
+    """Everything needed for converting output files that share the same checkpoint and configuration."""
+
+    config: MkGridConfig
+    template: GridTemplate | RegridTemplate
+    unit_factors: Dict[
+        str, float
+    ]  # surface variable -> factor for converting from assumed_input_units
+    runs: (
+        np.ndarray
+    )  # (start, stop) ranges of the input points read, which together are the points of the template
+    lead_times: LeadTimes | None = None
+
+    @classmethod
+    def create(
+        cls,
+        met_variables: MkGridConfig,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        checkpoint: str | None,
+        subset: Subset | None = None,
+    ) -> "GridSetup":
+        subset = subset or Subset()
+        met_variables = select_config(met_variables, subset.variables, subset.levels)
+
+        template = get_grid_template(latitudes, longitudes, checkpoint)
+        runs = np.array([[0, template.size]])
+        if subset.area is not None:
+            template, points = template.crop(*subset.area)
+            runs = point_runs(points)
+
+        return GridSetup(
+            config=met_variables,
+            template=template,
+            unit_factors=_unit_factors(met_variables),
+            runs=runs,
+            lead_times=subset.lead_times,
+        )
+
+    @classmethod
+    def create_regridded(
+        cls,
+        met_variables: MkGridConfig,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        checkpoint: str | None,
+        subset: Subset | None,
+        resolution: float,
+        area: tuple[float, float, float, float],
+        method: str,
+    ) -> "GridSetup":
+        """Set up conversion of all points, limited area and global, to a regular grid with the given resolution and area."""
+        subset = subset or Subset()
+        met_variables = select_config(met_variables, subset.variables, subset.levels)
+        return GridSetup(
+            config=met_variables,
+            template=get_regrid_template(
+                latitudes, longitudes, resolution, area, method, checkpoint
+            ),
+            unit_factors=_unit_factors(met_variables),
+            runs=np.array([[0, len(latitudes)]]),
+            lead_times=subset.lead_times,
+        )
+
+    @property
+    def point_count(self) -> int:
+        """Number of flat points an input file must have"""
+        return int(self.runs[-1, 1])
+
+    def select_input(
+        self, data: xr.Dataset, time_block: int | None = None
+    ) -> xr.Dataset:
+        """Select the variables, time steps and points to convert from an opened input file.
+
+        This is done before any data is read. The points of each run are read as one hyperslab.
+        If time_block is given, the result is a dask-backed dataset with blocks of that many time steps.
+        """
+        names = [v for v in self.config.variables.sfc.variables if v in data.data_vars]
+        levels = self.config.variables.pl.levels
+        for variable in self.config.variables.pl.variables:
+            names += [
+                f"{variable}_{level}"
+                for level in levels
+                if f"{variable}_{level}" in data.data_vars
+            ]
+        times = time_indices(data["time"].values, self.lead_times)
+        data = data[names].isel(time=times)
+
+        pieces = [data.isel(values=slice(start, stop)) for start, stop in self.runs]
+        if time_block is not None:
+            pieces = [piece.chunk({"time": time_block}) for piece in pieces]
+        if len(pieces) == 1:
+            return pieces[0]
+        return xr.concat(pieces, dim="values")
+
+    def spatial_ref(self) -> xr.DataArray:
+        return xr.DataArray(
+            data=0,
+            attrs={
+                "crs_wkt": 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AXIS["Latitude",NORTH],AXIS["Longitude",EAST],AUTHORITY["EPSG","4326"]]',
+                "semi_major_axis": 6378137.0,
+                "semi_minor_axis": 6356752.314245179,
+                "inverse_flattening": 298.257223563,
+                "reference_ellipsoid_name": "WGS 84",
+                "longitude_of_prime_meridian": 0.0,
+                "prime_meridian_name": "Greenwich",
+                "geographic_crs_name": "WGS 84",
+                "horizontal_datum_name": "World Geodetic System 1984",
+                "grid_mapping_name": "latitude_longitude",
+                "spatial_ref": 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AXIS["Latitude",NORTH],AXIS["Longitude",EAST],AUTHORITY["EPSG","4326"]]',
+                "GeoTransform": self.template.geo_transform,
+            },
+        )
+
+    def coords(self, times: np.ndarray) -> Dict[str, xr.DataArray]:
+        return {
+            "time": xr.DataArray(times, dims="time", attrs={"standard_name": "time"}),
+            "lat": xr.DataArray(
+                self.template.y,
+                dims="lat",
+                attrs={"units": "degree", "standard_name": "latitude"},
+            ),
+            "lon": xr.DataArray(
+                self.template.x,
+                dims="lon",
+                attrs={"units": "degree", "standard_name": "longitude"},
+            ),
+            "pl": xr.DataArray(
+                self.config.variables.pl.levels,
+                dims="pl",
+                attrs={
+                    "units": "hPa",
+                    "standard_name": "air_pressure",
+                    "long_name": "pressure level",
+                },
+            ),
+        }
+
+
+def grid_dataset(
+    data: xr.Dataset,
+    setup: GridSetup,
+    workers: int | None = 1,
+    time_block: int | None = None,
+) -> xr.Dataset:
+    """Convert an opened anemoi-inference output to a gridded dataset.
+
+    If workers is not 1, variables are converted in parallel on a thread pool of that size.
+    If time_block is given, the conversion is lazy, in blocks of that many time steps.
+    """
+    met_variables = setup.config
+    template = setup.template
+    reference_time = data["time"].values[0]
+    data = setup.select_input(data, time_block)
+    times = data["time"].values
+    x = template.x
+    y = template.y
+    levels = met_variables.variables.pl.levels
+
+    variables = {
+        "spatial_ref": setup.spatial_ref(),  # type: ignore
+        "forecast_reference_time": xr.DataArray(
+            np.datetime64(reference_time),
+            dims=(),
+            attrs={
+                "long_name": "forecast reference time",
+                "standard_name": "forecast_reference_time",
+            },
+        ),
+    }
+
+    def sfc_variable(variable: str, cfg: VariableConfig) -> xr.DataArray:
+        # .data is a numpy array, or a dask array when streaming
+        param_data = template.to_grid(data[variable].data)
+        if variable == "tp":
+            param_data = np.nan_to_num(param_data)
+
+        if variable in setup.unit_factors:
+            # Not in place, since param_data may be a view of the input
+            param_data = param_data * setup.unit_factors[variable]
+
+        return xr.DataArray(
+            param_data,
+            coords=[times, y, x],
+            dims=["time", "lat", "lon"],
+            attrs={**cfg.attributes, "grid_mapping": "spatial_ref"},
+        )
+
+    def pl_variable(variable: str, cfg: VariableConfig) -> xr.DataArray:
+        variable_names = [f"{variable}_{level}" for level in levels]
+        param_data = [template.to_grid(data[vn].data) for vn in variable_names]
+        param_data = np.stack(param_data, axis=1)
+
+        return xr.DataArray(
+            param_data,
+            coords=[times, levels, y, x],
+            dims=["time", "pl", "lat", "lon"],
+            attrs={**cfg.attributes, "grid_mapping": "spatial_ref"},
+        )
+
+    tasks = []
+    for variable, cfg in met_variables.variables.sfc.variables.items():
+        if variable not in data.data_vars:
+            print(f"Variable {variable} not found in input data.")
+            continue
+        if not cfg.variable_name:
+            # print(f"Variable {variable} is not configured.")
+            continue
+        tasks.append((cfg.variable_name, sfc_variable, variable, cfg))
+
+    for variable, cfg in met_variables.variables.pl.variables.items():
+        if not cfg.variable_name:
+            print(f"Variable {variable} is not configured.")
+            continue
+        tasks.append((cfg.variable_name, pl_variable, variable, cfg))
+
+    if workers == 1:
+        for name, convert, variable, cfg in tasks:
+            variables[name] = convert(variable, cfg)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (name, executor.submit(convert, variable, cfg))
+                for name, convert, variable, cfg in tasks
+            ]
+            for name, future in futures:
+                variables[name] = future.result()
+
+    return xr.Dataset(
+        variables,
+        coords=setup.coords(times),
+    )
+
+
+def select_config(
+    met_variables: MkGridConfig, variables: list[str] | None, levels: list[int] | None
+) -> MkGridConfig:
+    """Reduce the configuration to the selected variables and pressure levels.
+
+    Variables may be given by their input name, e.g. 2t, or by their output name."""
+    sfc = met_variables.variables.sfc
+    pl = met_variables.variables.pl
+
+    if variables is not None:
+        configured = {**sfc.variables, **pl.variables}
+        names = {name for name, cfg in configured.items() if cfg.variable_name} | {
+            cfg.variable_name for cfg in configured.values() if cfg.variable_name
+        }
+        unknown = [v for v in variables if v not in names]
+        if unknown:
+            raise ValueError(
+                f"Unknown variables {', '.join(unknown)}. Available: {', '.join(sorted(names))}"
+            )
+        selected = set(variables)
+        sfc = sfc.model_copy(
+            update={
+                "variables": {
+                    k: v
+                    for k, v in sfc.variables.items()
+                    if k in selected or v.variable_name in selected
+                }
+            }
+        )
+        pl = pl.model_copy(
+            update={
+                "variables": {
+                    k: v
+                    for k, v in pl.variables.items()
+                    if k in selected or v.variable_name in selected
+                }
+            }
+        )
+
+    if levels is not None:
+        unknown_levels = [level for level in levels if level not in pl.levels]
+        if unknown_levels:
+            raise ValueError(
+                f"Unknown levels {', '.join(map(str, unknown_levels))}. Available: {', '.join(map(str, pl.levels))}"
+            )
+        pl = pl.model_copy(
+            update={"levels": [level for level in pl.levels if level in levels]}
+        )
+
+    return met_variables.model_copy(
+        update={
+            "variables": met_variables.variables.model_copy(
+                update={"sfc": sfc, "pl": pl}
+            )
+        }
+    )
+
+
+def _unit_factors(met_variables: MkGridConfig) -> Dict[str, float]:
+    unit_factors = {}
+    for variable, cfg in met_variables.variables.sfc.variables.items():
+        if (
+            cfg.assumed_input_units
+            and "units" in cfg.attributes
+            and cfg.attributes["units"] != cfg.assumed_input_units
+        ):
+            from_units = pint.Unit(cfg.assumed_input_units)
+            to_units = pint.Unit(str(cfg.attributes["units"]))
+            unit_factors[variable] = (1 * from_units).to(to_units).magnitude
+    return unit_factors
+
+
+def time_block_size(
+    data: xr.Dataset, met_variables: MkGridConfig, size: int, max_memory: int
+) -> int:
+    """Find how many time steps may be converted at once while staying below max_memory bytes.
+
+    Each block holds the input points read for all levels of a variable, as well as the gridded result.
+    """
+    step_bytes = 0
+    for variable in met_variables.variables.sfc.variables:
+        if variable in data.data_vars:
+            step_bytes = max(step_bytes, data[variable].dtype.itemsize * 2 * size)
+    levels = met_variables.variables.pl.levels
+    for variable in met_variables.variables.pl.variables:
+        names = [
+            f"{variable}_{level}"
+            for level in levels
+            if f"{variable}_{level}" in data.data_vars
+        ]
+        if names:
+            step_bytes = max(
+                step_bytes, data[names[0]].dtype.itemsize * len(names) * 2 * size
+            )
+    if step_bytes == 0:
+        return data.sizes["time"]
+    return max(1, min(data.sizes["time"], max_memory // step_bytes))
@@ -0,0 +1,170 @@
+import hashlib
+import os
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+
+
+@dataclass
+class GridTemplate:
+    """Mapping from the flat points of an anemoi-inference output file to a regular lat/lon grid"""
+
+    size: int  # number of points belonging to the limited area, which come first in the output
+    x: np.ndarray  # longitude axis
+    y: np.ndarray  # latitude axis, north to south
+    gather: (
+        np.ndarray
+    )  # for each grid cell, in row-major order, the index of the flat point
+    geo_transform: str
+
+    @classmethod
+    def from_points(
+        cls, latitudes: np.ndarray, longitudes: np.ndarray
+    ) -> "GridTemplate":
+        x = np.unique(longitudes)
+        y = np.unique(latitudes)[::-1]
+        if len(x) * len(y) != len(latitudes):
+            raise ValueError(
+                f"points do not form a regular grid: {len(latitudes)} points, {len(y)} latitudes and {len(x)} longitudes"
+            )
+
+        # Scatter each flat point to its (j, i) position in the grid
+        i = np.searchsorted(x, longitudes)
+        j = len(y) - 1 - np.searchsorted(y[::-1], latitudes)
+        gather = np.full(len(x) * len(y), -1, dtype=np.int64)
+        gather[j * len(x) + i] = np.arange(len(latitudes))
+        if np.any(gather < 0):
+            raise ValueError(
+                "points do not form a regular grid: some grid cells have no point"
+            )
+
+        return GridTemplate(
+            size=len(latitudes),
+            x=x,
+            y=y,
+            gather=gather,
+            geo_transform=_geo_transform(x, y, x[1] - x[0], y[-1] - y[-2]),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "GridTemplate":
+        with np.load(path) as f:
+            return GridTemplate(
+                size=int(f["size"]),
+                x=f["x"],
+                y=f["y"],
+                gather=f["gather"],
+                geo_transform=str(f["geo_transform"]),
+            )
+
+    def save(self, path: str) -> None:
+        # Write to a temporary file first, so that concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                size=self.size,
+                x=self.x,
+                y=self.y,
+                gather=self.gather,
+                geo_transform=self.geo_transform,
+            )
+        os.replace(tmp_path, path)
+
+    def crop(
+        self, north: float, west: float, south: float, east: float
+    ) -> tuple["GridTemplate", np.ndarray]:
+        """Get the template for the part of the grid inside a bounding box.
+
+        Returns the cropped template and the points it needs, as sorted flat point indices. The
+        gather of the cropped template refers to positions in that array of points.
+        """
+        rows = np.flatnonzero((self.y <= north) & (self.y >= south))
+        cols = np.flatnonzero((self.x >= west) & (self.x <= east))
+        if len(rows) == 0 or len(cols) == 0:
+            raise ValueError(
+                f"area {north}/{west}/{south}/{east} does not contain any grid points. "
+                f"The grid covers {self.y[0]}/{self.x[0]}/{self.y[-1]}/{self.x[-1]}"
+            )
+
+        window = self.gather.reshape(len(self.y), len(self.x))[
+            rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1
+        ]
+        points = np.unique(window)
+        x = self.x[cols[0] : cols[-1] + 1]
+        y = self.y[rows[0] : rows[-1] + 1]
+        template = GridTemplate(
+            size=len(points),
+            x=x,
+            y=y,
+            gather=np.searchsorted(points, window.ravel()),
+            geo_transform=_geo_transform(
+                x, y, self.x[1] - self.x[0], self.y[-1] - self.y[-2]
+            ),
+        )
+        return template, points
+
+    @cached_property
+    def is_row_major(self) -> bool:
+        return bool(np.array_equal(self.gather, np.arange(self.size)))
+
+    def to_grid(self, values):
+        """Convert a (time, points) array to (time, lat, lon).
+
+        values may be a numpy or a dask array. Points outside the limited area are ignored.
+        """
+        shape = (values.shape[0], len(self.y), len(self.x))
+        if self.is_row_major:
+            return values[:, : self.size].reshape(shape)
+        return values[:, self.gather].reshape(shape)
+
+
+def _geo_transform(x: np.ndarray, y: np.ndarray, dx: float, dy: float) -> str:
+    return f"{x[0]} {dx:.3g} 0.0 {y[-1]} 0.0 {dy:.3g}"
+
+
+def get_grid_template(
+    latitudes: np.ndarray, longitudes: np.ndarray, checkpoint: str | None
+) -> GridTemplate:
+    """Get the grid template for an output file with the given point coordinates.
+
+    If checkpoint is given, the output is assumed to also contain global points after the
+    limited area. The template is then cached next to the checkpoint, keyed by a hash of
+    the point coordinates, so that the checkpoint metadata only needs to be read the first time.
+    """
+    if checkpoint is None:
+        return GridTemplate.from_points(latitudes, longitudes)
+
+    path = template_path(checkpoint, latitudes, longitudes)
+    if os.path.exists(path):
+        return GridTemplate.load(path)
+
+    from bris_adapt.checkpoint.reader import CheckpointReader
+
+    c = CheckpointReader(checkpoint)
+    size = (
+        c.supporting_array_shape("source0/latitudes")[0]
+        - c.supporting_array_shape("source1/latitudes")[0]
+    )
+    template = GridTemplate.from_points(latitudes[:size], longitudes[:size])
+    try:
+        template.save(path)
+        print(f"Saved grid template to {path}")
+    except OSError as e:
+        print(f"Unable to save grid template to {path}: {e}")
+    return template
+
+
+def template_path(
+    checkpoint: str, latitudes: np.ndarray, longitudes: np.ndarray
+) -> str:
+    return f"{checkpoint}.grid-{points_hash(latitudes, longitudes)}.npz"
+
+
+def points_hash(latitudes: np.ndarray, longitudes: np.ndarray) -> str:
+    """A hash of the point coordinates, which is the same for files with the same points in the same order"""
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(latitudes, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(longitudes, dtype=np.float64).tobytes())
+    return h.hexdigest()[:16]
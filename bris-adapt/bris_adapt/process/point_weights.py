@@ -0,0 +1,187 @@
+import hashlib
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from .grid_template import GridTemplate
+
+METHODS = ("nearest", "bilinear")
+
+
+@dataclass
+class PointWeights:
+    """Weights for getting values at a set of stations from the flat points of an anemoi-inference output file"""
+
+    indices: (
+        np.ndarray
+    )  # (stations, neighbours) indices of the flat points used for each station
+    weights: (
+        np.ndarray
+    )  # (stations, neighbours) weights of those points, summing to 1 for each station
+
+    @classmethod
+    def nearest(cls, tree, station_points: np.ndarray) -> "PointWeights":
+        _, indices = tree.query(station_points, k=1)
+        indices = indices.reshape(-1, 1)
+        return PointWeights(indices=indices, weights=np.ones(indices.shape))
+
+    @classmethod
+    def inverse_distance(
+        cls, tree, station_points: np.ndarray, k: int = 4
+    ) -> "PointWeights":
+        distances, indices = tree.query(station_points, k=k)
+        with np.errstate(divide="ignore"):
+            weights = 1 / distances
+        # A station exactly on a point only gets the value of that point
+        exact = np.isinf(weights)
+        weights[exact.any(axis=1)] = exact[exact.any(axis=1)]
+        return PointWeights(
+            indices=indices, weights=weights / weights.sum(axis=1, keepdims=True)
+        )
+
+    @classmethod
+    def bilinear(
+        cls, template: GridTemplate, latitudes: np.ndarray, longitudes: np.ndarray
+    ) -> tuple["PointWeights", np.ndarray]:
+        """Bilinear weights on the regular grid of the limited area.
+
+        Returns the weights and a mask of the stations inside the grid. Weights of stations outside it are 0.
+        """
+        x = template.x
+        y = template.y[::-1]  # ascending
+        inside = (
+            (longitudes >= x[0])
+            & (longitudes <= x[-1])
+            & (latitudes >= y[0])
+            & (latitudes <= y[-1])
+        )
+
+        i = np.clip(np.searchsorted(x, longitudes) - 1, 0, len(x) - 2)
+        j = np.clip(np.searchsorted(y, latitudes) - 1, 0, len(y) - 2)
+        fx = np.clip((longitudes - x[i]) / (x[i + 1] - x[i]), 0, 1)
+        fy = np.clip((latitudes - y[j]) / (y[j + 1] - y[j]), 0, 1)
+
+        # Row numbers in the template, which is north to south
+        south = len(y) - 1 - j
+        north = south - 1
+        gather = template.gather.reshape(len(template.y), len(x))
+        indices = np.stack(
+            [
+                gather[south, i],
+                gather[south, i + 1],
+                gather[north, i],
+                gather[north, i + 1],
+            ],
+            axis=1,
+        )
+        weights = np.stack(
+            [(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy], axis=1
+        )
+        weights[~inside] = 0
+        return PointWeights(indices=indices, weights=weights), inside
+
+    @classmethod
+    def load(cls, path: str) -> "PointWeights":
+        with np.load(path) as f:
+            return PointWeights(indices=f["indices"], weights=f["weights"])
+
+    def save(self, path: str) -> None:
+        # Write to a temporary file first, so that concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, indices=self.indices, weights=self.weights)
+        os.replace(tmp_path, path)
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        """Get station values from a (time, points) array, as (time, stations)"""
+        return np.einsum("tsk,sk->ts", values[:, self.indices], self.weights)
+
+    def to_sparse(self, point_count: int):
+        """The weights as a (stations, points) sparse matrix"""
+        import scipy.sparse
+
+        stations, neighbours = self.indices.shape
+        return scipy.sparse.csr_matrix(
+            (
+                self.weights.ravel(),
+                (np.repeat(np.arange(stations), neighbours), self.indices.ravel()),
+            ),
+            shape=(stations, point_count),
+        )
+
+
+def get_point_weights(
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    station_latitudes: np.ndarray,
+    station_longitudes: np.ndarray,
+    method: str,
+    template: GridTemplate | None,
+    checkpoint: str | None,
+) -> PointWeights:
+    """Get weights for the stations, from the flat points of an output file.
+
+    With bilinear, stations inside the limited area are interpolated on its regular grid, given by
+    template. Outside it, where the global points do not form a regular grid, the four nearest points
+    are weighted by inverse distance.
+
+    If checkpoint is given, the weights are cached next to it, keyed by a hash of the point and
+    station coordinates, so that the KD-tree only needs to be built the first time.
+    """
+    if method not in METHODS:
+        raise ValueError(
+            f"Unknown interpolation method {method}. Available: {', '.join(METHODS)}"
+        )
+
+    path = None
+    if checkpoint is not None:
+        path = weights_path(
+            checkpoint,
+            method,
+            latitudes,
+            longitudes,
+            station_latitudes,
+            station_longitudes,
+        )
+        if os.path.exists(path):
+            return PointWeights.load(path)
+
+    from scipy.spatial import cKDTree
+
+    from bris_adapt.checkpoint.interpolate import _sph2cart
+
+    tree = cKDTree(_sph2cart(latitudes, longitudes))
+    station_points = _sph2cart(station_latitudes, station_longitudes)
+    if method == "nearest":
+        weights = PointWeights.nearest(tree, station_points)
+    else:
+        weights, inside = PointWeights.bilinear(
+            template, station_latitudes, station_longitudes
+        )
+        if not inside.all():
+            outside = PointWeights.inverse_distance(tree, station_points[~inside])
+            weights.indices[~inside] = outside.indices
+            weights.weights[~inside] = outside.weights
+
+    if path is not None:
+        try:
+            weights.save(path)
+            print(f"Saved point weights to {path}")
+        except OSError as e:
+            print(f"Unable to save point weights to {path}: {e}")
+    return weights
+
+
+def weights_path(
+    checkpoint: str,
+    method: str,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    station_latitudes: np.ndarray,
+    station_longitudes: np.ndarray,
+) -> str:
+    h = hashlib.sha256()
+    for a in (latitudes, longitudes, station_latitudes, station_longitudes):
+        h.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+    return f"{checkpoint}.points-{method}-{h.hexdigest()[:16]}.npz"
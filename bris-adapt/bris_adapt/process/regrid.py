@@ -0,0 +1,133 @@
+import hashlib
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import scipy.sparse
+
+from .grid_template import _geo_transform
+from .point_weights import PointWeights
+
+METHODS = ("nearest", "inverse-distance")
+
+
+@dataclass
+class RegridTemplate:
+    """Mapping from all flat points of an anemoi-inference output file, limited area and global, to a regular lat/lon grid.
+
+    This has the same interface as GridTemplate, so that it can be used for make-grid.
+    """
+
+    size: int  # number of flat points, all of which are used
+    x: np.ndarray  # longitude axis
+    y: np.ndarray  # latitude axis, north to south
+    matrix: scipy.sparse.csr_matrix  # (grid cells, points) interpolation weights
+    geo_transform: str
+
+    is_row_major = False
+
+    def to_grid(self, values):
+        """Convert a (time, points) array to (time, lat, lon), with one sparse matrix product.
+
+        values may be a numpy or a dask array. A dask array must have a single chunk along points.
+        """
+        shape = (len(self.y), len(self.x))
+
+        def regrid(block: np.ndarray) -> np.ndarray:
+            result = (self.matrix @ block.T).T
+            return result.reshape((block.shape[0], *shape)).astype(
+                block.dtype, copy=False
+            )
+
+        if isinstance(values, np.ndarray):
+            return regrid(values)
+        return values.map_blocks(
+            regrid,
+            chunks=(values.chunks[0], (shape[0],), (shape[1],)),
+            new_axis=2,
+            dtype=values.dtype,
+        )
+
+
+def regular_axes(
+    resolution: float, area: tuple[float, float, float, float]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Longitude and latitude axes of a regular grid covering area, as north/west/south/east"""
+    north, west, south, east = area
+    nx = int(round((east - west) / resolution)) + 1
+    if np.isclose(resolution * (nx - 1), 360):
+        nx -= 1  # do not repeat the first longitude
+    ny = int(round((north - south) / resolution)) + 1
+    return west + resolution * np.arange(nx), north - resolution * np.arange(ny)
+
+
+def get_regrid_template(
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    resolution: float,
+    area: tuple[float, float, float, float],
+    method: str,
+    checkpoint: str | None,
+) -> RegridTemplate:
+    """Get the template for interpolating all points of an output file to a regular grid.
+
+    If checkpoint is given, the weights are cached next to it as a sparse matrix, keyed by a hash
+    of the point coordinates and the target grid, so that they only need to be computed the first time.
+    """
+    if method not in METHODS:
+        raise ValueError(
+            f"Unknown regridding method {method}. Available: {', '.join(METHODS)}"
+        )
+
+    x, y = regular_axes(resolution, area)
+    path = None
+    matrix = None
+    if checkpoint is not None:
+        path = regrid_path(checkpoint, method, latitudes, longitudes, x, y)
+        if os.path.exists(path):
+            matrix = scipy.sparse.load_npz(path).tocsr()
+
+    if matrix is None:
+        from scipy.spatial import cKDTree
+
+        from bris_adapt.checkpoint.interpolate import _sph2cart
+
+        lon, lat = np.meshgrid(x, y)
+        tree = cKDTree(_sph2cart(latitudes, longitudes))
+        targets = _sph2cart(lat.ravel(), lon.ravel())
+        if method == "nearest":
+            weights = PointWeights.nearest(tree, targets)
+        else:
+            weights = PointWeights.inverse_distance(tree, targets)
+        matrix = weights.to_sparse(len(latitudes))
+
+        if path is not None:
+            try:
+                tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+                scipy.sparse.save_npz(tmp_path, matrix)
+                os.replace(tmp_path, path)
+                print(f"Saved regridding weights to {path}")
+            except OSError as e:
+                print(f"Unable to save regridding weights to {path}: {e}")
+
+    return RegridTemplate(
+        size=len(latitudes),
+        x=x,
+        y=y,
+        matrix=matrix,
+        geo_transform=_geo_transform(x, y, resolution, -resolution),
+    )
+
+
+def regrid_path(
+    checkpoint: str,
+    method: str,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+) -> str:
+    h = hashlib.sha256()
+    for a in (latitudes, longitudes, x, y):
+        h.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+    return f"{checkpoint}.regrid-{method}-{h.hexdigest()[:16]}.npz"
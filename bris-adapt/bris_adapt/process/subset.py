@@ -0,0 +1,118 @@
+import numpy as np
+from dataclasses import dataclass
+
+
+@dataclass
+class LeadTimes:
+    """Selection of lead times, in hours after the first time step of a forecast"""
+
+    start: float | None = None
+    end: float | None = None
+    stride: float | None = None
+
+    @classmethod
+    def parse(cls, text: str) -> "LeadTimes":
+        '''Parse START:END[:STRIDE], where START and END may be left out, e.g. "0:48:6" or ":24"'''
+        elements = text.split(":")
+        if len(elements) not in (2, 3):
+            raise ValueError(
+                "Lead times must be in the format start:end[:stride], in hours."
+            )
+        try:
+            start, end, stride = [
+                float(e) if e else None for e in elements + [""] * (3 - len(elements))
+            ]
+        except ValueError:
+            raise ValueError(
+                "Lead times must be in the format start:end[:stride], in hours."
+            )
+        if stride is not None and stride <= 0:
+            raise ValueError("Lead time stride must be positive.")
+        return LeadTimes(start, end, stride)
+
+    def indices(self, times: np.ndarray) -> np.ndarray:
+        """Indices of the selected time steps, for the time steps of a forecast"""
+        hours = (times - times[0]) / np.timedelta64(1, "h")
+        selected = np.ones(len(times), dtype=bool)
+        if self.start is not None:
+            selected &= hours >= self.start
+        if self.end is not None:
+            selected &= hours <= self.end
+        if self.stride is not None:
+            offset = hours - (self.start or 0)
+            selected &= np.isclose(offset / self.stride, np.round(offset / self.stride))
+        return np.flatnonzero(selected)
+
+
+@dataclass
+class Subset:
+    """Selection of the part of a forecast to convert"""
+
+    area: tuple[float, float, float, float] | None = None  # north, west, south, east
+    variables: list[str] | None = None  # input or output variable names
+    levels: list[int] | None = None
+    lead_times: LeadTimes | None = None
+
+    @classmethod
+    def from_options(
+        cls,
+        area: str | None,
+        variables: str | None,
+        levels: str | None,
+        lead_times: str | None,
+    ) -> "Subset":
+        """Create a selection from the text of the make-grid command line options. Raises ValueError if they are invalid."""
+        subset = Subset()
+        if area is not None:
+            subset.area = parse_area(area)
+        if variables is not None:
+            subset.variables = [v.strip() for v in variables.split(",") if v.strip()]
+        if levels is not None:
+            try:
+                subset.levels = [int(level) for level in levels.split(",")]
+            except ValueError:
+                raise ValueError(
+                    "Levels must be a comma separated list of pressure levels, e.g. 500,850."
+                )
+        if lead_times is not None:
+            subset.lead_times = LeadTimes.parse(lead_times)
+        return subset
+
+
+def parse_area(area: str) -> tuple[float, float, float, float]:
+    """Parse north/west/south/east"""
+    area_elements = area.split("/")
+    try:
+        north, west, south, east = [float(e) for e in area_elements]
+    except ValueError:
+        raise ValueError("Area must be in the format north/west/south/east.")
+    if north < south or east < west:
+        raise ValueError(
+            "Area must be in the format north/west/south/east, with north >= south and east >= west."
+        )
+    return north, west, south, east
+
+
+def time_indices(times: np.ndarray, lead_times: LeadTimes | None) -> slice | np.ndarray:
+    """Indices of the selected time steps, as a slice where possible, so that it is read as a single hyperslab"""
+    if lead_times is None:
+        return slice(None)
+    indices = lead_times.indices(times)
+    if len(indices) == 0:
+        raise ValueError(
+            f"No time steps in the forecast match the lead time selection {lead_times}"
+        )
+    if len(indices) == 1:
+        return slice(indices[0], indices[0] + 1)
+    steps = np.diff(indices)
+    if np.all(steps == steps[0]):
+        return slice(indices[0], indices[-1] + 1, steps[0])
+    return indices
+
+
+def point_runs(points: np.ndarray) -> np.ndarray:
+    """Split sorted point indices into (start, stop) ranges of consecutive points"""
+    breaks = np.flatnonzero(np.diff(points) != 1) + 1
+    starts = points[np.concatenate([[0], breaks])]
+    stops = points[np.concatenate([breaks - 1, [len(points) - 1]])] + 1
+    return np.stack([starts, stops], axis=1)
@@ -1,7 +1,9 @@
 import click
 
 from .download_orography import download_orography
+from .inspect_checkpoint import inspect_checkpoint
 from .move_domain import move_domain
+from .orography_cache import orography_cache
 
 
 @click.group()
@@ -12,3 +14,5 @@ def checkpoint():
 
 checkpoint.add_command(move_domain)
 checkpoint.add_command(download_orography)
+checkpoint.add_command(inspect_checkpoint)
+checkpoint.add_command(orography_cache)
@@ -2,6 +2,7 @@ import click
 
 from bris_adapt.orography import download
 from bris_adapt.orography.api_key import find_api_key_file, read_api_key
+from bris_adapt.orography.cache import TileCache
 
 
 @click.command(
@@ -10,7 +11,12 @@ from bris_adapt.orography.api_key import find_api_key_file, read_api_key
         "The API key file must be a JSON file with the following format:\n"
         '{\n  "api_key": "YOUR_API_KEY_HERE"\n}\n\n'
         "Default api_key file is '.opentopographyrc' in the current or home directory.\n\n"
-        "Create an account and get an API key from https://portal.opentopography.org/login.\n"
+        "Create an account and get an API key from https://portal.opentopography.org/login.\n\n"
+        "The area is downloaded as tiles, several at a time, which are kept in the "
+        "orography tile cache (see orography-cache) and combined into DEST. Tiles that are "
+        "already in the cache are not downloaded again, so an interrupted download is "
+        "resumed by running the same command again. With --no-cache, the tiles are kept "
+        "in DEST.tiles until they have been combined.\n"
     )
 )
 @click.option(
@@ -33,8 +39,44 @@ from bris_adapt.orography.api_key import find_api_key_file, read_api_key
     show_default=True,
     help="Type of DEM to download",
 )
+@click.option(
+    "--tile-size",
+    type=float,
+    default=download.DEFAULT_TILE_SIZE,
+    show_default=True,
+    help="Size in degrees of the tiles the area is downloaded in",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=download.DEFAULT_WORKERS,
+    show_default=True,
+    help="Number of tiles downloaded at the same time",
+)
+@click.option(
+    "--retries",
+    type=int,
+    default=download.DEFAULT_RETRIES,
+    show_default=True,
+    help="Number of times a failed tile is retried, waiting twice as long each time",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Do not keep the tiles in the orography tile cache",
+)
 @click.argument("dest")
-def download_orography(area: str, api_key_file: str | None, dem_type: str, dest: str):
+def download_orography(
+    area: str,
+    api_key_file: str | None,
+    dem_type: str,
+    tile_size: float,
+    workers: int,
+    retries: int,
+    no_cache: bool,
+    dest: str,
+):
     if api_key_file is None:
         api_key_file = find_api_key_file()
         if not api_key_file:
@@ -53,8 +95,14 @@ def download_orography(area: str, api_key_file: str | None, dem_type: str, dest:
 
     print(f"Using API key from: {api_key_file}")
 
-    with open(dest, "wb") as f:
-        download.download(area_elements, f, api_key, dem_type)
+    options = {"tile_size": tile_size, "workers": workers, "retries": retries}
+    if no_cache:
+        download.download_mosaic(area_elements, dest, api_key, dem_type, **options)  # type: ignore
+    else:
+        paths = TileCache.from_config(api_key_file).get(
+            area_elements, dem_type, api_key, **options  # type: ignore
+        )
+        download.write_mosaic(paths, area_elements, dest)  # type: ignore
 
 
 if __name__ == "__main__":
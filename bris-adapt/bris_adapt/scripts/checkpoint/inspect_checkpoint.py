@@ -0,0 +1,62 @@
+import json
+import os
+
+import click
+import numpy as np
+
+from bris_adapt.checkpoint.reader import CheckpointReader
+
+
+@click.command(name="inspect")
+@click.option(
+    "--metadata",
+    "show_metadata",
+    is_flag=True,
+    default=False,
+    help="Print the full anemoi metadata as JSON.",
+)
+@click.option(
+    "--array",
+    "arrays",
+    type=str,
+    multiple=True,
+    help="Print statistics for the given supporting array. May be given several times.",
+)
+@click.argument("src", type=click.Path(exists=True))
+def inspect_checkpoint(show_metadata: bool, arrays: tuple[str, ...], src: str) -> None:
+    """Show metadata and supporting arrays of a checkpoint, without loading the model."""
+    reader = CheckpointReader(src)
+
+    if show_metadata:
+        click.echo(json.dumps(reader.metadata, indent=2))
+        return
+
+    click.echo(f"Checkpoint: {src} ({os.path.getsize(src) / 2**20:.1f} MiB)")
+    click.echo(f"Top-level directory: {reader.top_level_directory}")
+    click.echo(f"Metadata files: {', '.join(reader.metadata_files())}")
+
+    data_request = reader.metadata.get("dataset", {}).get("data_request", {})
+    if "grid" in data_request:
+        click.echo(f"Global grid: {data_request['grid']}")
+
+    click.echo("Supporting arrays:")
+    for name, entry in reader.supporting_array_entries.items():
+        shape = "x".join(str(s) for s in entry["shape"])
+        click.echo(f"  {name:<30} {shape:>14} {entry['dtype']}")
+
+    for name in arrays:
+        try:
+            values = reader.supporting_array(name)
+        except KeyError as e:
+            raise click.BadParameter(str(e), param_hint="--array")
+        if np.issubdtype(values.dtype, np.number) or values.dtype == bool:
+            values = values.astype(float)
+            click.echo(
+                f"{name}: min {np.nanmin(values):.6g}, max {np.nanmax(values):.6g}, mean {np.nanmean(values):.6g}"
+            )
+        else:
+            click.echo(f"{name}: {values}")
+
+
+if __name__ == "__main__":
+    inspect_checkpoint()
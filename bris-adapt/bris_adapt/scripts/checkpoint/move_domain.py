@@ -1,12 +1,9 @@
-import io
-import os
-import tempfile
-
 import click
 import yaml
 
 from bris_adapt.checkpoint import graph
-from bris_adapt.orography import api_key, download
+from bris_adapt.checkpoint.resample import RESAMPLINGS
+from bris_adapt.orography.cache import TileCache
 
 
 @click.command()
@@ -42,8 +39,15 @@ from bris_adapt.orography import api_key, download
 @click.option(
     "--orography-file",
     type=click.Path(exists=True),
-    default=None,
-    help="Path to a local orography file (GeoTIFF). If not provided, the script will download orography data from OpenTopography.org.",
+    multiple=True,
+    help="Local orography: a GeoTIFF or VRT file, or a directory of GeoTIFF tiles. May be given several times for a mosaic of tiles, of which only the parts around the new area are read. If not provided, the script will download orography data from OpenTopography.org, or use tiles downloaded before (see orography-cache).",
+)
+@click.option(
+    "--orography-resampling",
+    type=click.Choice(RESAMPLINGS),
+    default="average",
+    show_default=True,
+    help="How the orography is resampled to the new grid. average gives each grid cell the mean elevation it covers, mode the most common one, and nearest the elevation at its centre.",
 )
 @click.option(
     "--save-graph-to",
@@ -62,7 +66,8 @@ def move_domain(
     lam_resolution: int,
     global_resolution: int,
     margin_radius_km: int,
-    orography_file: str | None,
+    orography_file: tuple[str, ...],
+    orography_resampling: str,
     save_graph_to: str | None,
     src: str,
     dest: str,
@@ -78,7 +83,7 @@ def move_domain(
         f"Moving domain from {src} to {dest} with grid {grid} and area {north}/{west}/{south}/{east}."
     )
 
-    orography_stream = get_orography_stream(orography_file, north, west, south, east)
+    orography = get_orography(orography_file, north, west, south, east)
 
     graph_config = graph.GraphConfig(
         area=tuple(area_elements),  # type: ignore
@@ -91,9 +96,10 @@ def move_domain(
     graph.run(
         original_checkpoint=src,
         new_checkpoint=dest,
-        orography_stream=orography_stream,
+        orography=orography,
         graph_config=graph_config,
         save_graph_to=save_graph_to,
+        orography_resampling=orography_resampling,
     )
 
     if add_fiab_metadata:
@@ -109,24 +115,24 @@ def move_domain(
     click.echo("created new checkpoint at " + dest)
 
 
-def get_orography_stream(
-    orography_file: str | None, north: str, west: str, south: str, east: str
-) -> io.BufferedIOBase:
-    if orography_file is None:
-        orography_stream = io.BytesIO()
-        download.download(
+def get_orography(
+    orography_file: tuple[str, ...], north: str, west: str, south: str, east: str
+) -> list[str]:
+    """Paths of the orography files to use, from the tile cache if none are given.
+
+    Tiles that are not in the cache are downloaded to it, and read from there by rasterio,
+    so that the DEM is never held in memory as a whole. A later run over the same area does
+    not download anything.
+    """
+    if not orography_file:
+        return TileCache.from_config().get(
             area_latlon=(
                 float(north) + 1,
                 float(west) - 1,
                 float(south) - 1,
                 float(east) + 1,
             ),
-            dest_stream=orography_stream,
-            api_key=api_key.read_api_key(),
         )
-        orography_stream.seek(0)
-        return orography_stream
 
-    print(f"Using local orography file: {orography_file}")
-    f = open(orography_file, "r+b")
-    return f  # we don't care about closing this file - it will be closed on exit
+    print(f"Using local orography: {', '.join(orography_file)}")
+    return list(orography_file)
@@ -0,0 +1,63 @@
+import datetime
+
+import click
+
+from bris_adapt.orography.cache import TileCache
+
+
+@click.group(name="orography-cache")
+def orography_cache() -> None:
+    """List or prune the cache of downloaded orography tiles.
+
+    The cache is in ~/.cache/bris-adapt/orography, and holds up to 5 GiB. Set "tile_cache"
+    (a directory) and "tile_cache_size" (in MiB) in .opentopographyrc to change this.
+    """
+    pass
+
+
+@orography_cache.command(name="list")
+def list_tiles() -> None:
+    """List the cached tiles, least recently used first."""
+    cache = TileCache.from_config()
+    tiles = cache.tiles()
+    for tile in tiles:
+        last_used = datetime.datetime.fromtimestamp(tile.last_used)
+        north = (tile.index[0] + 1) * tile.tile_size
+        west = tile.index[1] * tile.tile_size
+        click.echo(
+            f"{tile.dem_type:8} {tile.tile_size:g}° tile at {north:g}/{west:g} "
+            f"{tile.size / 2**20:8.1f} MiB  last used {last_used:%Y-%m-%d %H:%M}"
+        )
+    total = sum(tile.size for tile in tiles)
+    click.echo(
+        f"{len(tiles)} tiles, {total / 2**20:.1f} MiB of {cache.max_size / 2**20:.0f} MiB "
+        f"in {cache.directory}"
+    )
+
+
+@orography_cache.command()
+@click.option(
+    "--max-size",
+    type=float,
+    default=None,
+    help="Remove the least recently used tiles until the cache is below this size in MiB. Defaults to the configured size of the cache.",
+)
+@click.option(
+    "--all",
+    "remove_all",
+    is_flag=True,
+    default=False,
+    help="Remove all tiles.",
+)
+def prune(max_size: float | None, remove_all: bool) -> None:
+    """Remove the least recently used tiles from the cache."""
+    cache = TileCache.from_config()
+    if remove_all:
+        max_size = 0
+    removed = cache.evict(
+        max_size=int(max_size * 2**20) if max_size is not None else None
+    )
+    click.echo(
+        f"Removed {len(removed)} tiles, {sum(tile.size for tile in removed) / 2**20:.1f} MiB, "
+        f"from {cache.directory}"
+    )
@@ -1,9 +1,17 @@
 import click
 from .make_grid import make_grid
+from .make_grid_batch import make_grid_batch
+from .extract_points import extract_points
+from .export_cog import export_cog
+
 
 @click.group()
 def process():
-    '''Manipulate FIAB output files.'''
+    """Manipulate FIAB output files."""
     pass
 
-process.add_command(make_grid)
\ No newline at end of file
+
+process.add_command(make_grid)
+process.add_command(make_grid_batch)
+process.add_command(extract_points)
+process.add_command(export_cog)
@@ -0,0 +1,104 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+# Two surface variables and one variable on two pressure levels
+MKGRID_CONFIG = {
+    "variables": {
+        "sfc": {
+            "variables": {
+                "2t": {
+                    "variable_name": "air_temperature_2m",
+                    "attributes": {"units": "K", "standard_name": "air_temperature"},
+                },
+                "msl": {
+                    "variable_name": "air_pressure_at_sea_level",
+                    "attributes": {
+                        "units": "Pa",
+                        "standard_name": "air_pressure_at_sea_level",
+                    },
+                },
+            }
+        },
+        "pl": {
+            "levels": [500, 850],
+            "variables": {
+                "t": {
+                    "variable_name": "air_temperature_pl",
+                    "attributes": {"units": "K", "standard_name": "air_temperature"},
+                }
+            },
+        },
+    },
+    "encoding_profiles": {
+        "timeseries": {"chunking": "timeseries", "timeseries_tile": 2},
+    },
+}
+
+LATITUDES = np.array([61.0, 60.5, 60.0])  # north to south
+LONGITUDES = np.array([5.0, 5.5, 6.0, 6.5])
+REFERENCE_TIME = pd.Timestamp("2024-01-01 00:00")
+
+
+def _field_values(name: str, step: int, latitudes, longitudes) -> np.ndarray:
+    """Made up values of a variable, which depend on the position, so that grid order errors show"""
+    offset = sum(map(ord, name))
+    return (offset + step * 10 + latitudes * 100 + longitudes).astype("float32")
+
+
+def _forecast_dataset(
+    steps: int = 4,
+    step_hours: int = 6,
+    order: np.ndarray | None = None,
+) -> xr.Dataset:
+    """An anemoi-inference output on a 3 x 4 regular grid, with the points in row-major order
+    unless order gives another permutation of them"""
+    latitudes, longitudes = (
+        a.ravel() for a in np.meshgrid(LATITUDES, LONGITUDES, indexing="ij")
+    )
+    if order is not None:
+        latitudes, longitudes = latitudes[order], longitudes[order]
+    times = REFERENCE_TIME + pd.to_timedelta(np.arange(steps) * step_hours, "h")
+    names = ["2t", "msl", "t_500", "t_850"]
+    return xr.Dataset(
+        {
+            name: (
+                ("time", "values"),
+                np.stack(
+                    [
+                        _field_values(name, s, latitudes, longitudes)
+                        for s in range(steps)
+                    ]
+                ),
+            )
+            for name in names
+        }
+        | {
+            "latitude": ("values", latitudes),
+            "longitude": ("values", longitudes),
+        },
+        coords={"time": times},
+    )
+
+
+@pytest.fixture
+def forecast_file(tmp_path):
+    """Write an anemoi-inference output, see _forecast_dataset, and return its path"""
+
+    def write(name: str = "forecast.nc", **kwargs) -> str:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _forecast_dataset(**kwargs).to_netcdf(path)
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def mkgrid_config(tmp_path) -> str:
+    path = tmp_path / "mkgrid.json"
+    path.write_text(json.dumps(MKGRID_CONFIG))
+    return str(path)
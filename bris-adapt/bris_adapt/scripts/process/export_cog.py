@@ -0,0 +1,167 @@
+import click
+import os
+import time
+import numpy as np
+import pandas as pd
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+
+from .zarr_output import require_zarr
+
+
+@click.command()
+@click.option(
+    "--variables",
+    type=str,
+    default=None,
+    help="Comma separated list of variables to export. Defaults to all gridded variables",
+)
+@click.option(
+    "--compress",
+    type=click.Choice(["deflate", "zstd", "lzw"]),
+    default="deflate",
+    show_default=True,
+    help="Compression of the tiles",
+)
+@click.option(
+    "--blocksize",
+    type=int,
+    default=512,
+    show_default=True,
+    help="Width and height of the tiles, in pixels",
+)
+@click.option(
+    "--resampling",
+    type=click.Choice(["average", "nearest", "bilinear", "mode"]),
+    default="average",
+    show_default=True,
+    help="Resampling method for the overviews",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of time steps written in parallel. Defaults to a number based on the CPU count",
+)
+@click.argument("input", type=click.Path(exists=True))
+@click.argument("output", type=click.Path(file_okay=False))
+def export_cog(
+    variables: str | None,
+    compress: str,
+    blocksize: int,
+    resampling: str,
+    workers: int | None,
+    input: str,
+    output: str,
+):
+    """Export a gridded file from make-grid to Cloud Optimized GeoTIFFs.
+
+    One tiled, compressed GeoTIFF with overviews is written to the OUTPUT directory for each variable,
+    pressure level and lead time, named like air_temperature_2m_006h.tif or air_temperature_pl_850hPa_006h.tif.
+    The georeferencing is taken from the grid coordinates and the spatial_ref variable of INPUT.
+
+    Lead times are counted from the forecast_reference_time variable that make-grid writes, or
+    from the first time step if INPUT has no such variable.
+
+    Time steps are written in parallel."""
+    import rasterio
+
+    if input.endswith(".zarr") or os.path.isdir(input):
+        require_zarr()
+        data = xr.open_zarr(input)
+    else:
+        data = xr.open_dataset(input)
+
+    names = [
+        v
+        for v in data.data_vars
+        if data[v].dims[:1] == ("time",) and data[v].dims[-2:] == ("lat", "lon")
+    ]
+    if variables is not None:
+        selected = [v.strip() for v in variables.split(",")]
+        unknown = [v for v in selected if v not in names]
+        if unknown:
+            raise click.BadParameter(
+                f"Unknown variables {', '.join(unknown)}. Available: {', '.join(names)}",
+                param_hint="--variables",
+            )
+        names = selected
+
+    profile = {
+        "driver": "COG",
+        "width": data.sizes["lon"],
+        "height": data.sizes["lat"],
+        "count": 1,
+        "crs": rasterio.CRS.from_wkt(data["spatial_ref"].attrs["crs_wkt"]),
+        "transform": _transform(data["lon"].values, data["lat"].values),
+        "nodata": np.nan,
+        "BLOCKSIZE": blocksize,
+        "COMPRESS": compress.upper(),
+        "OVERVIEW_RESAMPLING": resampling.upper(),
+        "NUM_THREADS": 1,
+    }
+    flip = (
+        data["lat"].values[0] < data["lat"].values[-1]
+    )  # GeoTIFF rows go from north to south
+
+    os.makedirs(output, exist_ok=True)
+    times = data["time"].values
+    # The first time step is not the reference time if make-grid selected lead times
+    if "forecast_reference_time" in data.variables:
+        reference_time = data["forecast_reference_time"].values
+    else:
+        reference_time = times[0]
+    lead_times = ((times - reference_time) / np.timedelta64(1, "h")).round().astype(int)
+
+    def write_step(t: int) -> int:
+        count = 0
+        for name in names:
+            # Reading from the input is serialized by xarray, while GDAL encodes tiles in parallel
+            field = data[name].isel(time=t).values
+            if flip:
+                field = field[..., ::-1, :]
+            levels = data["pl"].values if "pl" in data[name].dims else [None]
+            for i, level in enumerate(levels):
+                values = field if level is None else field[i]
+                level_part = "" if level is None else f"_{level}hPa"
+                path = os.path.join(
+                    output, f"{name}{level_part}_{lead_times[t]:03d}h.tif"
+                )
+                with rasterio.open(path, "w", dtype=values.dtype, **profile) as dst:
+                    dst.write(values, 1)
+                    dst.update_tags(
+                        variable=name,
+                        time=pd.Timestamp(times[t]).isoformat(),
+                        forecast_reference_time=pd.Timestamp(
+                            reference_time
+                        ).isoformat(),
+                        **(
+                            {"pressure_level": f"{level} hPa"}
+                            if level is not None
+                            else {}
+                        ),
+                        **{
+                            k: str(v)
+                            for k, v in data[name].attrs.items()
+                            if k in ("units", "standard_name", "long_name")
+                        },
+                    )
+                count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        file_count = sum(executor.map(write_step, range(len(times))))
+    data.close()
+    print(
+        f"Wrote {file_count} Cloud Optimized GeoTIFFs to {output} in {time.perf_counter() - start:.1f} s"
+    )
+
+
+def _transform(x: np.ndarray, y: np.ndarray):
+    """Affine transform of the top left corner of the grid, from the cell centre coordinates"""
+    from rasterio.transform import from_origin
+
+    dx = abs(x[1] - x[0])
+    dy = abs(y[1] - y[0])
+    return from_origin(x.min() - dx / 2, y.max() + dy / 2, dx, dy)
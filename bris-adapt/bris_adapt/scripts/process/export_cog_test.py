@@ -0,0 +1,56 @@
+import os
+
+import rasterio
+import xarray as xr
+from click.testing import CliRunner
+
+from bris_adapt.scripts.process.export_cog import export_cog
+from bris_adapt.scripts.process.make_grid import make_grid
+
+
+def _make_grid(input: str, output: str, config: str, *options: str) -> None:
+    result = CliRunner().invoke(
+        make_grid, ["--config", config, "--variables", "2t", *options, input, output]
+    )
+    assert result.exit_code == 0, result.output
+
+
+def _export_cog(input: str, output: str) -> list[str]:
+    result = CliRunner().invoke(export_cog, [input, output])
+    assert result.exit_code == 0, result.output
+    return sorted(os.listdir(output))
+
+
+def test_lead_times_of_a_subset(forecast_file, mkgrid_config, tmp_path):
+    # Steps every 6 hours to +30h, of which +6h, +18h and +30h are gridded
+    input = forecast_file(steps=6)
+    _make_grid(
+        input, str(tmp_path / "grid.nc"), mkgrid_config, "--lead-times", "6:30:12"
+    )
+
+    files = _export_cog(str(tmp_path / "grid.nc"), str(tmp_path / "cog"))
+
+    assert files == [
+        "air_temperature_2m_006h.tif",
+        "air_temperature_2m_018h.tif",
+        "air_temperature_2m_030h.tif",
+    ]
+    with rasterio.open(tmp_path / "cog" / files[0]) as src:
+        tags = src.tags()
+    assert tags["forecast_reference_time"] == "2024-01-01T00:00:00"
+    assert tags["time"] == "2024-01-01T06:00:00"
+
+
+def test_lead_times_without_reference_time(forecast_file, mkgrid_config, tmp_path):
+    input = forecast_file(steps=3)
+    _make_grid(input, str(tmp_path / "grid.nc"), mkgrid_config)
+    with xr.open_dataset(tmp_path / "grid.nc") as data:
+        data.drop_vars("forecast_reference_time").to_netcdf(tmp_path / "plain.nc")
+
+    files = _export_cog(str(tmp_path / "plain.nc"), str(tmp_path / "cog"))
+
+    assert files == [
+        "air_temperature_2m_000h.tif",
+        "air_temperature_2m_006h.tif",
+        "air_temperature_2m_012h.tif",
+    ]
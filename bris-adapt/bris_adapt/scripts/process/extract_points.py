@@ -0,0 +1,199 @@
+import click
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from bris_adapt.process.grid_template import get_grid_template
+from bris_adapt.process.point_weights import METHODS, PointWeights, get_point_weights
+
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".nc": "netcdf"}
+
+
+@click.command()
+@click.option(
+    "--checkpoint",
+    type=click.Path(exists=True),
+    default=None,
+    help="Checkpoint the forecast was made with. Needed for bilinear interpolation of limited area "
+    "and global output. Interpolation weights are only cached when it is given",
+)
+@click.option(
+    "--method",
+    type=click.Choice(METHODS),
+    default="nearest",
+    show_default=True,
+    help="Interpolation method",
+)
+@click.option(
+    "--variables",
+    type=str,
+    default=None,
+    help="Comma separated list of variables to extract. Defaults to all variables",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(sorted(set(FORMATS.values()))),
+    default=None,
+    help="Format of the output. Defaults to a format based on the extension of OUTPUT",
+)
+@click.argument("input", type=click.Path(exists=True))
+@click.argument("stations", type=click.Path(exists=True))
+@click.argument("output", type=click.Path())
+def extract_points(
+    checkpoint: str | None,
+    method: str,
+    variables: str | None,
+    output_format: str | None,
+    input: str,
+    stations: str,
+    output: str,
+):
+    """Extract time series at stations from anemoi-inference output.
+
+    STATIONS is a CSV file with a latitude and longitude column (or lat and lon), and optionally a
+    name column. All lead times of each variable are read in one pass, and written as a table with
+    one row per station and time to OUTPUT, which may be CSV, Parquet or a NetCDF file with CF
+    timeSeries discrete sampling geometry.
+
+    With --method bilinear, stations inside the limited area are interpolated bilinearly on its grid,
+    and stations outside it get inverse distance weighted values from the four nearest points. The
+    limited area is found from --checkpoint, which is needed if the input also has global points.
+    Without --checkpoint, the interpolation weights are computed again on every run.
+    """
+    if output_format is None:
+        output_format = FORMATS.get(os.path.splitext(output)[1])
+        if output_format is None:
+            raise click.BadParameter(
+                f"Unable to find output format from the extension of {output}. Use --output-format",
+                param_hint="OUTPUT",
+            )
+
+    station_table = read_stations(stations)
+
+    with xr.open_dataset(input) as data:
+        names = [v for v in data.data_vars if data[v].dims == ("time", "values")]
+        if variables is not None:
+            selected = [v.strip() for v in variables.split(",")]
+            unknown = [v for v in selected if v not in names]
+            if unknown:
+                raise click.BadParameter(
+                    f"Unknown variables {', '.join(unknown)}. Available: {', '.join(names)}",
+                    param_hint="--variables",
+                )
+            names = selected
+
+        latitudes = data.latitude.values
+        longitudes = data.longitude.values
+        template = None
+        if method == "bilinear":
+            try:
+                template = get_grid_template(latitudes, longitudes, checkpoint)
+            except ValueError as e:
+                raise click.UsageError(
+                    f"Unable to find the grid for bilinear interpolation: {e}. "
+                    "If the input has global points after the limited area, use --checkpoint"
+                )
+        weights = get_point_weights(
+            latitudes,
+            longitudes,
+            station_table["latitude"].values,
+            station_table["longitude"].values,
+            method,
+            template,
+            checkpoint,
+        )
+
+        # Each variable is read once, as the range of points used by any station
+        first, last = weights.indices.min(), weights.indices.max()
+        local = PointWeights(indices=weights.indices - first, weights=weights.weights)
+        values = {}
+        for name in names:
+            values[name] = local.apply(
+                data[name].isel(values=slice(first, last + 1)).values
+            )
+        times = data["time"].values
+        ds = station_dataset(station_table, times, values, data)
+
+    if output_format == "netcdf":
+        ds.to_netcdf(output)
+    else:
+        table = ds.drop_vars("forecast_reference_time").to_dataframe().reset_index()
+        table = table[["station", "latitude", "longitude", "time", "lead_time", *names]]
+        if output_format == "csv":
+            table.to_csv(output, index=False)
+        else:
+            try:
+                table.to_parquet(output, index=False)
+            except ImportError as e:
+                raise click.ClickException(
+                    f"Writing parquet requires pyarrow or fastparquet: {e}"
+                )
+    print(
+        f"Wrote {len(station_table)} stations, {len(times)} time steps and {len(names)} variables to {output}"
+    )
+
+
+def read_stations(path: str) -> pd.DataFrame:
+    table = pd.read_csv(path)
+    table = table.rename(columns={c: c.strip().lower() for c in table.columns})
+    table = table.rename(columns={"lat": "latitude", "lon": "longitude"})
+    if "latitude" not in table or "longitude" not in table:
+        raise click.BadParameter(
+            f"{path} must have latitude and longitude columns", param_hint="STATIONS"
+        )
+    if "name" not in table:
+        table["name"] = [str(i) for i in range(len(table))]
+    return table
+
+
+def station_dataset(
+    stations: pd.DataFrame,
+    times: np.ndarray,
+    values: dict[str, np.ndarray],
+    data: xr.Dataset,
+) -> xr.Dataset:
+    """Create a CF timeSeries discrete sampling geometry dataset"""
+    variables = {
+        "forecast_reference_time": xr.DataArray(
+            np.datetime64(times[0]),
+            attrs={
+                "long_name": "forecast reference time",
+                "standard_name": "forecast_reference_time",
+            },
+        ),
+    }
+    for name, station_values in values.items():
+        variables[name] = xr.DataArray(
+            station_values.T.astype(data[name].dtype),
+            dims=["station", "time"],
+            attrs={k: v for k, v in data[name].attrs.items() if k != "coordinates"},
+        )
+
+    return xr.Dataset(
+        variables,
+        coords={
+            "station": xr.DataArray(
+                stations["name"].astype(str).values,
+                dims="station",
+                attrs={"cf_role": "timeseries_id", "long_name": "station name"},
+            ),
+            "latitude": xr.DataArray(
+                stations["latitude"].values,
+                dims="station",
+                attrs={"units": "degrees_north", "standard_name": "latitude"},
+            ),
+            "longitude": xr.DataArray(
+                stations["longitude"].values,
+                dims="station",
+                attrs={"units": "degrees_east", "standard_name": "longitude"},
+            ),
+            "time": xr.DataArray(times, dims="time", attrs={"standard_name": "time"}),
+            "lead_time": xr.DataArray(
+                (times - times[0]) / np.timedelta64(1, "h"),
+                dims="time",
+                attrs={"units": "hours", "long_name": "lead time"},
+            ),
+        },
+        attrs={"featureType": "timeSeries", "Conventions": "CF-1.8"},
+    )
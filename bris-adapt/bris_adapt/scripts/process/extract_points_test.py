@@ -0,0 +1,35 @@
+import numpy as np
+import xarray as xr
+from click.testing import CliRunner
+
+from bris_adapt.scripts.process.extract_points import extract_points
+
+
+def _with_global_points(path: str) -> None:
+    """Append scattered points after the regular grid, like the global part of a stretched grid"""
+    with xr.open_dataset(path) as data:
+        data = data.load()
+    extra = data.isel(values=[0, 5, 11])
+    extra["latitude"] = extra["latitude"] + np.array([3.0, -4.2, 7.7])
+    extra["longitude"] = extra["longitude"] + np.array([-6.1, 2.3, 9.4])
+    xr.concat([data, extra], dim="values").to_netcdf(path)
+
+
+def _extract(input: str, stations: str, output: str, *options: str):
+    return CliRunner().invoke(extract_points, [*options, input, stations, output])
+
+
+def test_bilinear_needs_checkpoint_with_global_points(forecast_file, tmp_path):
+    input = forecast_file()
+    _with_global_points(input)
+    stations = tmp_path / "stations.csv"
+    stations.write_text("name,lat,lon\nA,60.25,5.75\nB,65.0,0.0\n")
+
+    result = _extract(
+        input, str(stations), str(tmp_path / "points.csv"), "--method", "bilinear"
+    )
+    assert result.exit_code == 2
+    assert "--checkpoint" in result.output
+
+    result = _extract(input, str(stations), str(tmp_path / "points.csv"))
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,152 @@
+import os
+import time
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from bris_adapt.process.encoding import (
+    EncodingProfileConfig,
+    make_encoding,
+    make_zarr_encoding,
+)
+from .zarr_output import default_zarr_format
+
+
+def follow(
+    input: str,
+    output: str,
+    grid: Callable[[xr.Dataset], xr.Dataset],
+    output_format: str,
+    profile: EncodingProfileConfig | None,
+    poll_interval: float,
+    timeout: float,
+) -> None:
+    """Convert time steps of input as they are written by anemoi-inference, appending them to output.
+
+    anemoi-inference creates its netcdf output with all time steps up front, and fills them in one
+    at a time, writing the time of a step before its fields. A step is regarded as complete when the
+    time of the next step has been written, and the last step when the file has not changed between
+    two checks. This returns when all steps are complete, and raises TimeoutError if no new step
+    has arrived for timeout seconds.
+
+    Reading is best effort: anemoi-inference does not write in HDF5 SWMR mode, so a read may see a
+    partly flushed file. Reads that fail are retried at the next check, but values that have not been
+    flushed yet may be read as missing."""
+    written = 0
+    last_progress = time.monotonic()
+    previous_version = None
+    while True:
+        try:
+            # The run has ended if the file has not changed since the previous check
+            stat = os.stat(input)
+            version = (stat.st_mtime_ns, stat.st_size)
+            ended = version == previous_version
+            previous_version = version
+
+            complete, total = complete_steps(input, written, ended)
+            if complete > written:
+                with xr.open_dataset(input, cache=False) as data:
+                    ds = grid(data.isel(time=slice(written, complete))).load()
+        except (OSError, RuntimeError) as e:
+            # The file may be unreadable while it is being created or flushed
+            print(f"Unable to read {input}, retrying: {e}")
+            complete, total = written, -1
+
+        if complete > written:
+            if written == 0:
+                _create(ds, output, output_format, profile)
+            else:
+                _append(ds, output, output_format)
+            print(f"Wrote time steps {written + 1}-{complete} of {total} to {output}")
+            written = complete
+            last_progress = time.monotonic()
+
+        if written == total:
+            return
+        if time.monotonic() - last_progress > timeout:
+            raise TimeoutError(
+                f"No new time steps in {input} for {timeout} s, {written} of {total} converted"
+            )
+        time.sleep(poll_interval)
+
+
+def complete_steps(path: str, start: int = 0, ended: bool = False) -> tuple[int, int]:
+    """Find the number of completely written time steps in an anemoi-inference netcdf output.
+
+    The steps are those with a time, of which all but the last are complete, since the time of a
+    step is written after the fields of the step before. If ended is true, the run is known to
+    have ended, and the last step is complete too if it is the last one of the file. Steps before
+    start are assumed to be complete. Returns the number of complete steps and the total number
+    of steps in the file."""
+    import netCDF4
+
+    with netCDF4.Dataset(path) as nc:
+        total = len(nc.dimensions["time"])
+        times = nc["time"][:]
+        started = start
+        while started < total and not np.ma.is_masked(times[started]):
+            started += 1
+        if started == total and ended:
+            return total, total
+        return max(start, started - 1), total
+
+
+def wait_for_file(path: str, poll_interval: float, timeout: float) -> None:
+    import netCDF4
+
+    start = time.monotonic()
+    while True:
+        if os.path.exists(path):
+            try:
+                with netCDF4.Dataset(path) as nc:
+                    if "latitude" in nc.variables and "longitude" in nc.variables:
+                        return
+            except (OSError, RuntimeError):
+                pass
+        if time.monotonic() - start > timeout:
+            raise TimeoutError(f"{path} was not created within {timeout} s")
+        time.sleep(poll_interval)
+
+
+def _time_encoding(ds: xr.Dataset) -> dict:
+    # Later appends must be representable in the units chosen for the first block
+    reference = pd.Timestamp(ds["time"].values[0])
+    return {"units": f"seconds since {reference.isoformat()}", "dtype": "int64"}
+
+
+def _create(
+    ds: xr.Dataset,
+    output: str,
+    output_format: str,
+    profile: EncodingProfileConfig | None,
+) -> None:
+    if output_format == "zarr":
+        encoding = make_zarr_encoding(ds, profile, default_zarr_format())
+        encoding["time"] = _time_encoding(ds)
+        ds.to_zarr(output, mode="w", encoding=encoding, consolidated=False)
+    else:
+        encoding = make_encoding(ds, profile) if profile is not None else {}
+        encoding["time"] = _time_encoding(ds)
+        ds.to_netcdf(output, encoding=encoding, unlimited_dims=["time"])
+
+
+def _append(ds: xr.Dataset, output: str, output_format: str) -> None:
+    ds = ds.drop_vars([v for v in ds.variables if "time" not in ds[v].dims])
+    if output_format == "zarr":
+        ds.to_zarr(output, append_dim="time", consolidated=False)
+        return
+
+    import netCDF4
+
+    with netCDF4.Dataset(output, "a") as nc:
+        n = len(nc.dimensions["time"])
+        count = ds.sizes["time"]
+        time_var = nc["time"]
+        times = pd.to_datetime(ds["time"].values).to_pydatetime()
+        time_var[n : n + count] = netCDF4.date2num(
+            times, time_var.units, getattr(time_var, "calendar", "standard")
+        )
+        for name, variable in ds.data_vars.items():
+            nc[name][n : n + count] = variable.values
@@ -0,0 +1,81 @@
+import netCDF4
+import numpy as np
+import xarray as xr
+from click.testing import CliRunner
+
+from bris_adapt.scripts.process.follow import complete_steps
+from bris_adapt.scripts.process.make_grid import make_grid
+
+NAMES = ["2t", "msl", "t_500", "t_850"]
+
+
+def _create(path: str, steps: int) -> netCDF4.Dataset:
+    """Create a file like anemoi-inference does, with all time steps but no data"""
+    latitudes, longitudes = (
+        a.ravel()
+        for a in np.meshgrid([61.0, 60.5, 60.0], [5.0, 5.5, 6.0, 6.5], indexing="ij")
+    )
+    nc = netCDF4.Dataset(path, "w", format="NETCDF4")
+    nc.createDimension("values", len(latitudes))
+    nc.createDimension("time", steps)
+    time = nc.createVariable("time", "i4", ("time",))
+    time.units = "seconds since 2024-01-01 00:00:00"
+    time.calendar = "gregorian"
+    nc.createVariable("latitude", "f4", ("values",))[:] = latitudes
+    nc.createVariable("longitude", "f4", ("values",))[:] = longitudes
+    for name in NAMES:
+        nc.createVariable(name, "f4", ("time", "values"), fill_value=np.nan)
+    return nc
+
+
+def _write_step(nc: netCDF4.Dataset, step: int, missing: str | None = None) -> None:
+    """Write a step like anemoi-inference does, the time first and then the fields"""
+    nc["time"][step] = step * 6 * 3600
+    for i, name in enumerate(NAMES):
+        values = np.full(nc.dimensions["values"].size, 270.0 + i + step)
+        nc[name][step] = np.nan if name == missing else values
+
+
+def test_step_is_complete_when_the_next_one_starts(tmp_path):
+    path = str(tmp_path / "forecast.nc")
+    with _create(path, 3) as nc:
+        _write_step(nc, 0)
+        _write_step(nc, 1)
+    assert complete_steps(path) == (1, 3)
+    assert complete_steps(path, ended=True) == (1, 3)
+
+    with netCDF4.Dataset(path, "a") as nc:
+        _write_step(nc, 2)
+    assert complete_steps(path) == (2, 3)
+    assert complete_steps(path, start=2) == (2, 3)
+    assert complete_steps(path, ended=True) == (3, 3)
+
+
+def test_follow_with_all_missing_values(mkgrid_config, tmp_path):
+    input = str(tmp_path / "forecast.nc")
+    with _create(input, 3) as nc:
+        _write_step(nc, 0)
+        _write_step(nc, 1, missing="t_850")
+        _write_step(nc, 2)
+
+    result = CliRunner().invoke(
+        make_grid,
+        [
+            "--config",
+            mkgrid_config,
+            "--follow",
+            "--poll-interval",
+            "0.01",
+            "--follow-timeout",
+            "5",
+            input,
+            str(tmp_path / "grid.nc"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    with xr.open_dataset(tmp_path / "grid.nc") as ds:
+        assert ds.sizes["time"] == 3
+        temperature = ds["air_temperature_pl"].sel(pl=850).values
+        assert np.all(np.isnan(temperature[1]))
+        assert np.all(np.isfinite(temperature[[0, 2]]))
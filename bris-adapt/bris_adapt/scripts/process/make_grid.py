@@ -1,183 +1,158 @@
 import click
-import json
-import pint
+import os
 import xarray as xr
-import numpy as np
-from typing import Dict
-import pydantic
 
-
-class VariableConfig(pydantic.BaseModel):
-    variable_name: str
-    attributes: Dict[str, object]
-    assumed_input_units: str | None = None # if set, convert from this unit to the unit in attributes
-
-
-class SurfaceVariablesConfig(pydantic.BaseModel):
-    variables: Dict[str, VariableConfig]
-
-
-class PressureLevelVariablesConfig(pydantic.BaseModel):
-    levels: list[int]
-    variables: Dict[str, VariableConfig]
-
-
-class VariablesConfig(pydantic.BaseModel):
-    sfc: SurfaceVariablesConfig
-    pl: PressureLevelVariablesConfig
-
-
-class MkGridConfig(pydantic.BaseModel):
-    variables: VariablesConfig
+from bris_adapt.process.encoding import EncodingProfileConfig, write_netcdf
+from bris_adapt.process.grid import GridSetup, MkGridConfig, grid_dataset, load_config, time_block_size
+from bris_adapt.process.regrid import METHODS as REGRID_METHODS
+from bris_adapt.process.subset import Subset, parse_area
+from .follow import follow, wait_for_file
+from .zarr_output import write_zarr
 
 
 @click.command()
 @click.option('--config', type=click.Path(exists=True), default='etc/mkgrid.json', show_default=True, help='Configuration file for variable mapping')
 @click.option('--checkpoint', type=click.Path(exists=True), default=None, help='Checkpoint file to read metadata from. Only required if you read data from a file with global coverage')
-@click.argument('input', type=click.Path(exists=True))
+@click.option('--max-memory', type=int, default=None, help='Peak memory budget in MiB. If set, data is read, converted and written a block of lead times at a time instead of all at once')
+@click.option('--encoding-profile', type=str, default=None, help='Name of an encoding profile from the configuration file, controlling compression, chunking and packing of the output')
+@click.option('--output-format', type=click.Choice(['netcdf', 'zarr']), default='netcdf', show_default=True, help='Format of the output')
+@click.option('--zarr-format', type=click.Choice(['2', '3']), default=None, help='Zarr format version, if writing zarr. Defaults to the default of the installed zarr library')
+@click.option('--workers', type=int, default=None, help='Number of threads writing zarr chunks in parallel. Defaults to a number based on the CPU count')
+@click.option('--area', type=str, default=None, help='Only convert the part of the grid inside this bounding box, as north/west/south/east')
+@click.option('--variables', type=str, default=None, help='Only convert these variables, as a comma separated list of input or output variable names, e.g. 2t,10u,10v,tp')
+@click.option('--levels', type=str, default=None, help='Only convert these pressure levels, as a comma separated list, e.g. 500,850')
+@click.option('--lead-times', type=str, default=None, help='Only convert these lead times, as start:end[:stride] in hours, e.g. 0:48:6')
+@click.option('--global-output', type=click.Path(), default=None, help='Also write the whole forecast, limited area and global points, regridded to a regular lat/lon grid, to this path')
+@click.option('--global-resolution', type=float, default=0.25, show_default=True, help='Resolution in degrees of the grid for --global-output')
+@click.option('--global-area', type=str, default='90/-180/-90/180', show_default=True, help='Area of the grid for --global-output, as north/west/south/east')
+@click.option('--global-method', type=click.Choice(REGRID_METHODS), default='inverse-distance', show_default=True, help='Interpolation method for --global-output')
+@click.option('--follow', 'follow_input', is_flag=True, default=False, help='Convert time steps as anemoi-inference writes them, appending to the output, and exit when the forecast is complete')
+@click.option('--poll-interval', type=float, default=10, show_default=True, help='Seconds between checks for new time steps, with --follow')
+@click.option('--follow-timeout', type=float, default=3600, show_default=True, help='Give up if no new time steps have arrived for this many seconds, with --follow')
+@click.argument('input', type=click.Path())
 @click.argument('output', type=click.Path())
-def make_grid(config: str, checkpoint: str|None, input: str, output: str):
+def make_grid(config: str, checkpoint: str|None, max_memory: int|None, encoding_profile: str|None, output_format: str, zarr_format: str|None, workers: int|None,
+              area: str|None, variables: str|None, levels: str|None, lead_times: str|None,
+              global_output: str|None, global_resolution: float, global_area: str, global_method: str,
+              follow_input: bool, poll_interval: float, follow_timeout: float, input: str, output: str):
     '''Convert anemoi-inference output to a gridded NetCDF file.
 
     This converts an output file from having run anemoi-inference with bris into a more stadardized netcdf format,
-    suitable for viewing with common tools.'''
-    with open(config) as f:
-        config_json = json.load(f)
-        met_variables = MkGridConfig.model_validate(config_json)
+    suitable for viewing with common tools. The conversion itself is bris_adapt.process.grid.make_grid, which
+    may also be used from Python to get the gridded dataset without writing it.
+
+    With --output-format zarr, a zarr store is written instead, with each variable written as independent chunks
+    in parallel. The store may be opened by readers while it is being written.
+
+    With --max-memory, the conversion is streamed through dask in blocks of lead times, so that the whole
+    forecast never needs to be held in memory. The output is the same as without it.
+
+    With --area, --variables, --levels and --lead-times, only a part of the forecast is converted. The selection
+    is applied before reading, so only the parts of INPUT that are needed are read.
+
+    With --global-output, the global part of the output, which is otherwise dropped, is also written. All points,
+    limited area and global, are interpolated to a regular grid. The interpolation weights are stored as a sparse
+    matrix next to the checkpoint, so that later forecasts are regridded with one sparse product per variable.
+
+    With --follow, INPUT may still be in the process of being written by anemoi-inference. New time steps
+    are converted and appended to the output as they become available. A time step is converted once
+    anemoi-inference has moved on to the next one, or has finished. A step may still be read before
+    it is fully flushed, since anemoi-inference does not write in HDF5 SWMR mode.'''
+    met_variables = load_config(config)
+    profile = get_encoding_profile(met_variables, encoding_profile)
+    try:
+        subset = Subset.from_options(area, variables, levels, lead_times)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    if follow_input:
+        if subset.lead_times is not None:
+            raise click.BadParameter('Selecting lead times is not supported with --follow', param_hint='--lead-times')
+        if global_output is not None:
+            raise click.BadParameter('--global-output is not supported with --follow', param_hint='--global-output')
+        if profile is not None and profile.packing is not None:
+            raise click.BadParameter('Packing is not supported with --follow, since the value range is not known up front', param_hint='--encoding-profile')
+        # anemoi-inference keeps the file open for writing while we read it. This only has
+        # an effect if set before the HDF5 library is loaded, so netCDF4 is imported lazily.
+        os.environ.setdefault('HDF5_USE_FILE_LOCKING', 'FALSE')
+        wait_for_file(input, poll_interval, follow_timeout)
+        with xr.open_dataset(input) as data:
+            setup = create_setup(met_variables, data, checkpoint, subset)
+        try:
+            follow(input, output, lambda data: grid_dataset(data, setup), output_format, profile, poll_interval, follow_timeout)
+        except TimeoutError as e:
+            raise click.ClickException(str(e))
+        return
+
+    if not os.path.exists(input):
+        raise click.BadParameter(f"Path '{input}' does not exist.", param_hint='INPUT')
 
     data = xr.open_dataset(input)
 
-    longitudes = data.longitude.values
-    latitudes = data.latitude.values
-    times = data['time'].values
-    if checkpoint is not None:
-        from anemoi.inference.checkpoint import Checkpoint
-        c = Checkpoint(checkpoint)
-        size = len(c.supporting_arrays['source0/latitudes']) - len(c.supporting_arrays['source1/latitudes'])
-        longitudes = longitudes[:size]
-        latitudes = latitudes[:size]
-
-    x = np.unique(longitudes)
-    y = np.unique(latitudes)[::-1]
-    size = len(x) * len(y)
-    time_count = len(times)
-
-    spatial_ref = xr.DataArray(
-        data=0,
-        attrs={
-            'crs_wkt': 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AXIS["Latitude",NORTH],AXIS["Longitude",EAST],AUTHORITY["EPSG","4326"]]',
-            'semi_major_axis': 6378137.0,
-            'semi_minor_axis': 6356752.314245179,
-            'inverse_flattening': 298.257223563,
-            'reference_ellipsoid_name': 'WGS 84',
-            'longitude_of_prime_meridian': 0.0,
-            'prime_meridian_name': 'Greenwich',
-            'geographic_crs_name': 'WGS 84',
-            'horizontal_datum_name': 'World Geodetic System 1984',
-            'grid_mapping_name': 'latitude_longitude',
-            'spatial_ref': 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AXIS["Latitude",NORTH],AXIS["Longitude",EAST],AUTHORITY["EPSG","4326"]]',
-            'GeoTransform': f'{x[0]} {(x[1] - x[0]):.3g} 0.0 {y[-1]} 0.0 {(y[-1] - y[-2]):.3g}'
-        }
-    )
-
-    variables = {
-        'spatial_ref': spatial_ref,  # type: ignore
-        'forecast_reference_time': xr.DataArray(
-            np.datetime64(times[0]),
-            dims=(),
-            attrs={
-                'long_name': 'forecast reference time',
-                'standard_name': 'forecast_reference_time',
-            }
-        )
-    }
-
-    coords = {
-        'time': xr.DataArray(
-            times,
-            dims='time',
-            attrs={
-                'standard_name': 'time'
-            }
-        ),
-        'lat': xr.DataArray(
-            y,
-            dims='lat',
-            attrs={
-                'units': 'degree',
-                'standard_name': 'latitude'
-            }
-        ),
-        'lon': xr.DataArray(
-            x,
-            dims='lon',
-            attrs={
-                'units': 'degree',
-                'standard_name': 'longitude'
-            }
-        ),
-        'pl': xr.DataArray(
-            met_variables.variables.pl.levels,
-            dims='pl',
-            attrs={
-                'units': 'hPa',
-                'standard_name': 'air_pressure',
-                'long_name': 'pressure level',
-            }
-        )
-    }
-
-    for variable, cfg in met_variables.variables.sfc.variables.items():
-        if variable not in data.data_vars:
-            print(f"Variable {variable} not found in input data.")
-            continue
-        if not cfg.variable_name:
-            # print(f"Variable {variable} is not configured.")
-            continue
-
-        param_data = data[variable].values[:, :size].reshape(
-            (time_count, len(y), len(x)))
-        if variable == 'tp':
-            param_data = np.nan_to_num(param_data, nan=0)
-            assert not np.any(np.isnan(param_data))
-
-        if cfg.assumed_input_units and 'units' in cfg.attributes and cfg.attributes['units'] != cfg.assumed_input_units:
-            from_units = pint.Unit(cfg.assumed_input_units)
-            to_units = pint.Unit(str(cfg.attributes['units']))
-            factor = (1 * from_units).to(to_units).magnitude
-            param_data *= factor
-
-        param = xr.DataArray(
-            param_data,
-            coords=[times, y, x],
-            dims=['time', 'lat', 'lon'],
-            attrs={**cfg.attributes, "grid_mapping": "spatial_ref"}
-        )
-        variables[cfg.variable_name] = param
-
-    for variable, cfg in met_variables.variables.pl.variables.items():
-        if not cfg.variable_name:
-            print(f"Variable {variable} is not configured.")
-            continue
-
-        variable_names = [
-            f'{variable}_{level}' for level in met_variables.variables.pl.levels]
-        param_data = [data[vn].values[:, :size].reshape(
-            (time_count, len(y), len(x))) for vn in variable_names]
-        param_data = np.stack(param_data, axis=1)
-
-        param = xr.DataArray(
-            param_data,
-            coords=[times, met_variables.variables.pl.levels, y, x],
-            dims=['time', 'pl', 'lat', 'lon'],
-            attrs={**cfg.attributes, "grid_mapping": "spatial_ref"}
-        )
-        variables[cfg.variable_name] = param
-
-    ds = xr.Dataset(
-        variables,
-        coords=coords,
-    )
-
-    ds.to_netcdf(output)
+    setup = create_setup(met_variables, data, checkpoint, subset)
+
+    time_block = None
+    if max_memory is not None:
+        time_block = time_block_size(data, setup.config, setup.template.size, max_memory * 1024 * 1024)
+        print(f'Streaming in blocks of {time_block} time steps')
+
+    ds = convert(data, setup, time_block=time_block)
+
+    write_output(ds, output, output_format, encoding_profile, profile, zarr_format, workers, streaming=max_memory is not None)
     print(ds)
+
+    if global_output is not None:
+        try:
+            global_setup = GridSetup.create_regridded(
+                met_variables, data.latitude.values, data.longitude.values, checkpoint, subset,
+                global_resolution, parse_area(global_area), global_method)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        if max_memory is not None:
+            time_block = time_block_size(data, global_setup.config, global_setup.template.size, max_memory * 1024 * 1024)
+        global_ds = convert(data, global_setup, time_block=time_block)
+        write_output(global_ds, global_output, output_format, encoding_profile, profile, zarr_format, workers, streaming=max_memory is not None)
+
+
+def create_setup(met_variables: MkGridConfig, data: xr.Dataset, checkpoint: str|None, subset: Subset) -> GridSetup:
+    '''Set up the conversion, reporting an invalid selection as a usage error'''
+    try:
+        return GridSetup.create(met_variables, data.latitude.values, data.longitude.values, checkpoint, subset)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+
+def convert(data: xr.Dataset, setup: GridSetup, workers: int|None = 1, time_block: int|None = None) -> xr.Dataset:
+    try:
+        return grid_dataset(data, setup, workers=workers, time_block=time_block)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+
+def get_encoding_profile(met_variables: MkGridConfig, encoding_profile: str|None) -> EncodingProfileConfig|None:
+    if encoding_profile is None:
+        return None
+    if encoding_profile not in met_variables.encoding_profiles:
+        raise click.BadParameter(
+            f"Unknown encoding profile {encoding_profile}. Available: {', '.join(met_variables.encoding_profiles)}",
+            param_hint='--encoding-profile')
+    return met_variables.encoding_profiles[encoding_profile]
+
+
+def write_output(ds: xr.Dataset, output: str, output_format: str, encoding_profile: str|None, profile: EncodingProfileConfig|None,
+                 zarr_format: str|None = None, workers: int|None = None, streaming: bool = False) -> None:
+    def write():
+        if output_format == 'zarr':
+            write_zarr(ds, output, encoding_profile, profile, int(zarr_format) if zarr_format else None, workers)
+        else:
+            write_netcdf(ds, output, encoding_profile, profile)
+
+    if streaming:
+        import dask
+
+        # The synchronous scheduler computes and writes one block at a time,
+        # which keeps peak memory within the budget used for the block size.
+        with dask.config.set(scheduler='synchronous'):
+            write()
+    else:
+        write()
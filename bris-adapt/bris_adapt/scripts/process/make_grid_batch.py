@@ -0,0 +1,211 @@
+import click
+import glob
+import os
+import time
+import xarray as xr
+from concurrent.futures import ProcessPoolExecutor
+
+from bris_adapt.process.grid import GridSetup, MkGridConfig, grid_dataset, load_config
+from bris_adapt.process.grid_template import points_hash
+from bris_adapt.process.subset import Subset
+from .make_grid import create_setup, get_encoding_profile, write_output
+
+
+@click.command()
+@click.option(
+    "--config",
+    type=click.Path(exists=True),
+    default="etc/mkgrid.json",
+    show_default=True,
+    help="Configuration file for variable mapping",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(exists=True),
+    default=None,
+    help="Checkpoint file to read metadata from. Only required if you read data from files with global coverage",
+)
+@click.option(
+    "--encoding-profile",
+    type=str,
+    default=None,
+    help="Name of an encoding profile from the configuration file, controlling compression, chunking and packing of the output",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(["netcdf", "zarr"]),
+    default="netcdf",
+    show_default=True,
+    help="Format of the output",
+)
+@click.option(
+    "--processes",
+    type=int,
+    default=None,
+    help="Number of files converted in parallel. Defaults to the CPU count",
+)
+@click.option(
+    "--threads",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Number of variables converted in parallel within each file",
+)
+@click.option(
+    "--area",
+    type=str,
+    default=None,
+    help="Only convert the part of the grid inside this bounding box, as north/west/south/east",
+)
+@click.option(
+    "--variables",
+    type=str,
+    default=None,
+    help="Only convert these variables, as a comma separated list of input or output variable names, e.g. 2t,10u,10v,tp",
+)
+@click.option(
+    "--levels",
+    type=str,
+    default=None,
+    help="Only convert these pressure levels, as a comma separated list, e.g. 500,850",
+)
+@click.option(
+    "--lead-times",
+    type=str,
+    default=None,
+    help="Only convert these lead times, as start:end[:stride] in hours, e.g. 0:48:6",
+)
+@click.argument("input")
+@click.argument("output_pattern")
+def make_grid_batch(
+    config: str,
+    checkpoint: str | None,
+    encoding_profile: str | None,
+    output_format: str,
+    processes: int | None,
+    threads: int,
+    area: str | None,
+    variables: str | None,
+    levels: str | None,
+    lead_times: str | None,
+    input: str,
+    output_pattern: str,
+):
+    """Convert many anemoi-inference output files to gridded files.
+
+    INPUT is a directory, in which case all .nc files in it are converted, or a glob pattern.
+    OUTPUT_PATTERN is the path of each output file, where {stem} is replaced by the input file name
+    without extension, e.g. "grid/{stem}.nc".
+
+    All files must come from the same checkpoint. Configuration, grid layout and unit conversions
+    are set up once, and files are then converted in parallel on a process pool. A file whose points
+    differ from those of the first file, in position or in order, gets a grid layout of its own. The
+    same selection of area, variables, levels and lead times as for make-grid is applied to each file.
+    """
+    if os.path.isdir(input):
+        inputs = sorted(glob.glob(os.path.join(input, "*.nc")))
+    else:
+        inputs = sorted(glob.glob(input))
+    if not inputs:
+        raise click.BadParameter(
+            f"No input files found for {input}", param_hint="INPUT"
+        )
+
+    outputs = [
+        output_pattern.format(stem=os.path.splitext(os.path.basename(i))[0])
+        for i in inputs
+    ]
+    if len(set(outputs)) != len(outputs):
+        raise click.BadParameter(
+            "Output pattern must give a unique name for each input file, e.g. by using {stem}",
+            param_hint="OUTPUT_PATTERN",
+        )
+
+    met_variables = load_config(config)
+    get_encoding_profile(met_variables, encoding_profile)
+    try:
+        subset = Subset.from_options(area, variables, levels, lead_times)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    with xr.open_dataset(inputs[0]) as data:
+        setup = create_setup(met_variables, data, checkpoint, subset)
+        grid = points_hash(data.latitude.values, data.longitude.values)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(
+            {grid: setup},
+            met_variables,
+            checkpoint,
+            subset,
+            encoding_profile,
+            output_format,
+            threads,
+        ),
+    ) as executor:
+        input_bytes = sum(executor.map(_convert, inputs, outputs))
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"Converted {len(inputs)} files ({input_bytes / 1e9:.2f} GB) in {elapsed:.1f} s: "
+        f"{len(inputs) / elapsed:.2f} files/s, {input_bytes / 1e9 / elapsed:.3f} GB/s"
+    )
+
+
+# Per-process state, set up once by _init_worker
+_setups: dict[str, GridSetup]  # by hash of the point coordinates
+_met_variables: MkGridConfig
+_checkpoint: str | None
+_subset: Subset
+_encoding_profile: str | None
+_output_format: str
+_threads: int
+
+
+def _init_worker(
+    setups: dict[str, GridSetup],
+    met_variables: MkGridConfig,
+    checkpoint: str | None,
+    subset: Subset,
+    encoding_profile: str | None,
+    output_format: str,
+    threads: int,
+) -> None:
+    global _setups, _met_variables, _checkpoint, _subset
+    global _encoding_profile, _output_format, _threads
+    _setups = setups
+    _met_variables = met_variables
+    _checkpoint = checkpoint
+    _subset = subset
+    _encoding_profile = encoding_profile
+    _output_format = output_format
+    _threads = threads
+
+
+def _get_setup(input: str, data: xr.Dataset) -> GridSetup:
+    """The setup for the points of an input file, set up again if they differ from the first file"""
+    latitudes = data.latitude.values
+    longitudes = data.longitude.values
+    grid = points_hash(latitudes, longitudes)
+    if grid not in _setups:
+        print(f"The points of {input} differ from the first file, setting up its grid")
+        try:
+            _setups[grid] = GridSetup.create(
+                _met_variables, latitudes, longitudes, _checkpoint, _subset
+            )
+        except ValueError as e:
+            raise ValueError(f"Unable to set up the grid of {input}: {e}") from e
+    return _setups[grid]
+
+
+def _convert(input: str, output: str) -> int:
+    with xr.open_dataset(input) as data:
+        setup = _get_setup(input, data)
+        profile = get_encoding_profile(setup.config, _encoding_profile)
+        ds = grid_dataset(data, setup, workers=_threads)
+        write_output(
+            ds, output, _output_format, _encoding_profile, profile, workers=_threads
+        )
+    return os.path.getsize(input)
@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import xarray as xr
+from click.testing import CliRunner
+
+from bris_adapt.scripts.process.make_grid_batch import make_grid_batch
+
+
+def test_files_with_points_in_another_order(forecast_file, mkgrid_config, tmp_path):
+    first = forecast_file("inputs/a.nc")
+    order = np.random.default_rng(1).permutation(12)
+    forecast_file("inputs/b.nc", order=order)
+
+    result = CliRunner().invoke(
+        make_grid_batch,
+        [
+            "--config",
+            mkgrid_config,
+            "--processes",
+            "1",
+            os.path.dirname(first),
+            str(tmp_path / "{stem}.nc"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    # The same forecast gives the same grid, whichever order its points are in
+    with (
+        xr.open_dataset(tmp_path / "a.nc") as a,
+        xr.open_dataset(tmp_path / "b.nc") as b,
+    ):
+        assert a.sizes["lat"] == 3 and a.sizes["lon"] == 4
+        for name in ("air_temperature_2m", "air_temperature_pl"):
+            assert np.array_equal(a[name].values, b[name].values)
+        # Values increase to the north and to the east
+        values = a["air_temperature_2m"].values
+        assert np.all(np.diff(values, axis=1) < 0)
+        assert np.all(np.diff(values, axis=2) > 0)
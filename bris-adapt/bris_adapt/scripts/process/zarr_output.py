@@ -0,0 +1,118 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import xarray as xr
+
+from bris_adapt.process.encoding import (
+    EncodingProfileConfig,
+    make_zarr_encoding,
+    report_size,
+)
+
+
+def write_zarr(
+    ds: xr.Dataset,
+    output: str,
+    profile_name: str | None,
+    profile: EncodingProfileConfig | None,
+    zarr_format: int | None = None,
+    workers: int | None = None,
+) -> None:
+    """Write ds to a zarr store, writing the chunks of each variable in parallel.
+
+    The store is first created with all metadata and coordinates, but no data. Each gridded
+    variable is then written as independent regions of whole time chunks on a thread pool,
+    earliest lead times first. The store can be opened lazily as soon as it has been created;
+    time steps that have not been written yet read as missing values.
+
+    Dask-backed variables are first rechunked to whole multiples of the zarr chunks, so that no
+    zarr chunk is written from more than one dask chunk. Where a zarr chunk holds more time steps
+    than a dask block, as with timeseries chunking, a block grows to the zarr chunk."""
+    require_zarr()
+    format_kwargs = {}
+    if zarr_format is not None:
+        format_kwargs["zarr_format"] = zarr_format
+    else:
+        zarr_format = default_zarr_format()
+    encoding = make_zarr_encoding(ds, profile, zarr_format)
+
+    ds = ds.copy()
+    time_chunks = {}
+    for name in encoding:
+        chunks = _aligned_chunks(ds[name], encoding[name]["chunks"])  # type: ignore
+        if ds[name].chunks is not None:
+            ds[name] = ds[name].chunk(chunks)
+        time_chunks[name] = chunks["time"]
+
+    start = time.perf_counter()
+
+    # Chunking the template makes to_zarr only write metadata and coordinates when compute=False
+    ds.chunk().to_zarr(
+        output,
+        mode="w",
+        encoding=encoding,
+        compute=False,
+        consolidated=zarr_format == 2,
+        **format_kwargs,
+    )
+
+    tasks = []
+    for name in encoding:
+        time_chunk = time_chunks[name]
+        for first in range(0, ds.sizes["time"], time_chunk):
+            tasks.append(
+                (first, name, slice(first, min(first + time_chunk, ds.sizes["time"])))
+            )
+    tasks.sort(key=lambda task: task[0])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_write_region, ds, output, name, region)
+            for _, name, region in tasks
+        ]
+        for future in futures:
+            future.result()
+
+    elapsed = time.perf_counter() - start
+    report_size(ds, output, _store_size(output), profile_name, elapsed)
+
+
+def _aligned_chunks(variable: xr.DataArray, zarr_chunks: tuple[int, ...]) -> dict:
+    """Chunks of variable that are the smallest multiples of zarr_chunks holding its dask chunks"""
+    chunks = {}
+    for dim, zarr_chunk in zip(variable.dims, zarr_chunks):
+        size = max(variable.chunksizes[dim]) if variable.chunks is not None else 1
+        chunks[dim] = zarr_chunk * max(1, -(-size // zarr_chunk))
+    return chunks
+
+
+def _write_region(ds: xr.Dataset, output: str, name: str, region: slice) -> None:
+    block = ds[[name]].isel(time=region)
+    block = block.drop_vars([v for v in block.variables if "time" not in block[v].dims])
+    block.to_zarr(output, region={"time": region}, consolidated=False)
+
+
+def default_zarr_format() -> int:
+    zarr = require_zarr()
+    return 2 if zarr.__version__.startswith("2.") else 3
+
+
+def require_zarr():
+    """Import zarr, which is an optional dependency, failing with a usable message if it is missing"""
+    try:
+        import zarr
+    except ImportError as e:
+        raise click.ClickException(
+            f"Zarr output requires the zarr package. Install it with pip install 'bris-adapt[zarr]': {e}"
+        )
+    return zarr
+
+
+def _store_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            size += os.path.getsize(os.path.join(root, f))
+    return size
@@ -0,0 +1,44 @@
+import sys
+
+import numpy as np
+import xarray as xr
+from click.testing import CliRunner
+
+from bris_adapt.process.grid import load_config, make_grid
+from bris_adapt.scripts.process.make_grid import make_grid as make_grid_command
+from bris_adapt.scripts.process.zarr_output import write_zarr
+
+
+def test_blocks_that_do_not_match_the_chunks(forecast_file, mkgrid_config, tmp_path):
+    config = load_config(mkgrid_config)
+    profile = config.encoding_profiles["timeseries"]
+    input = forecast_file(steps=8)
+    expected = make_grid(input, config, time_block=None)
+
+    # Blocks of 3 time steps, while each chunk has all 8 time steps and both levels
+    ds = make_grid(input, config, time_block=3)
+    write_zarr(ds, str(tmp_path / "grid.zarr"), "timeseries", profile, workers=4)
+
+    with xr.open_zarr(tmp_path / "grid.zarr") as result:
+        assert result["air_temperature_pl"].encoding["chunks"] == (8, 1, 2, 2)
+        for name in ("air_temperature_2m", "air_temperature_pl"):
+            assert np.array_equal(result[name].values, expected[name].values)
+
+
+def test_missing_zarr(forecast_file, mkgrid_config, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "zarr", None)  # makes import zarr fail
+
+    result = CliRunner().invoke(
+        make_grid_command,
+        [
+            "--config",
+            mkgrid_config,
+            "--output-format",
+            "zarr",
+            forecast_file(),
+            str(tmp_path / "grid.zarr"),
+        ],
+    )
+
+    assert result.exit_code == 1
+    assert "bris-adapt[zarr]" in result.output
@@ -0,0 +1,3 @@
+from .downscale_adiabatic_corrections import (
+    DownscaleAdiabaticCorrectionPreProcessor as DownscaleAdiabaticCorrectionPreProcessor,
+)
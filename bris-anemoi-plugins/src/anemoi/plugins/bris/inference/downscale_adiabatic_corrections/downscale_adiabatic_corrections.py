@@ -0,0 +1,238 @@
+from dataclasses import dataclass
+
+import earthkit.data as ekd
+import numpy as np
+import pint
+from anemoi.inference.context import Context
+from anemoi.inference.processor import Processor
+from anemoi.inference.types import State
+from earthkit.data.sources.array_list import ArrayField
+from metpy.units import units
+
+from anemoi.plugins.bris.inference.apply_adiabatic_corrections import adiabatic_correct
+
+
+class DownscaleAdiabaticCorrectionPreProcessor(Processor):
+    """Interpolate the input to the grid of the checkpoint, and correct it for the
+    real elevation.
+
+    This does the same as downscaling the input followed by apply_adiabatic_corrections,
+    but in a single pass over the fields.
+    """
+
+    def __init__(self, context: Context, **kwargs):
+        supporting_arrays = context.checkpoint.supporting_arrays
+        self._latitudes = supporting_arrays["lam_0/latitudes"]
+        self._longitudes = supporting_arrays["lam_0/longitudes"]
+
+        self._corrector = DownscalingAdiabaticCorrector(
+            self._latitudes,
+            self._longitudes,
+            supporting_arrays["lam_0/model_elevation"] * units.meters,
+            supporting_arrays["lam_0/correct_elevation"] * units.meters,
+        )
+        super().__init__(context, **kwargs)
+
+    def process(self, state: State) -> State:
+        state["fields"] = self._corrector.apply(state["fields"])
+        # The supporting arrays may be stored as 2D grids, while states have one value per point
+        state["latitudes"] = np.ravel(self._latitudes)
+        state["longitudes"] = np.ravel(self._longitudes)
+        return state
+
+
+@dataclass
+class BilinearWeights:
+    """Bilinear interpolation from a regular grid to a set of points"""
+
+    indices: np.ndarray  # (points, 4) indices into the flattened source grid
+    weights: np.ndarray  # (points, 4) NaN for points outside the source grid
+
+    @classmethod
+    def from_axes(
+        cls,
+        source_latitudes: np.ndarray,
+        source_longitudes: np.ndarray,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+    ) -> "BilinearWeights":
+        # Use the same longitude range as the source grid
+        longitudes = (
+            longitudes - source_longitudes.min()
+        ) % 360 + source_longitudes.min()
+
+        rows, row_weights = _axis_weights(source_latitudes, latitudes)
+        columns, column_weights = _axis_weights(source_longitudes, longitudes)
+        width = len(source_longitudes)
+        indices = np.column_stack(
+            (
+                rows[:, 0] * width + columns[:, 0],
+                rows[:, 0] * width + columns[:, 1],
+                rows[:, 1] * width + columns[:, 0],
+                rows[:, 1] * width + columns[:, 1],
+            )
+        )
+        weights = np.column_stack(
+            (
+                row_weights[:, 0] * column_weights[:, 0],
+                row_weights[:, 0] * column_weights[:, 1],
+                row_weights[:, 1] * column_weights[:, 0],
+                row_weights[:, 1] * column_weights[:, 1],
+            )
+        )
+        return BilinearWeights(indices=indices, weights=weights)
+
+    def __call__(self, values: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        return np.einsum(
+            "pk,pk->p", values.ravel()[self.indices], self.weights, out=out
+        )
+
+
+def _axis_weights(
+    axis: np.ndarray, values: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Indices and weights of the two neighbours of each value on a monotonic axis.
+
+    This is the linear case of bris_adapt.checkpoint.downscale._axis_matrix. The plugin is
+    installed where anemoi-inference runs, without bris-adapt and its graph and training
+    dependencies, so it keeps its own copy.
+    """
+    descending = axis[0] > axis[-1]
+    if descending:
+        axis = axis[::-1]
+    n = len(axis)
+    cell = np.clip(np.searchsorted(axis, values, side="right") - 1, 0, n - 2)
+    t = (values - axis[cell]) / (axis[cell + 1] - axis[cell])
+    outside = (t < -1e-6) | (t > 1 + 1e-6)
+    t = np.clip(t, 0, 1)
+
+    indices = np.column_stack((cell, cell + 1))
+    weights = np.column_stack((1 - t, t))
+    weights[outside] = np.nan
+    if descending:
+        indices = n - 1 - indices
+    return indices, weights
+
+
+class DownscalingAdiabaticCorrector:
+    def __init__(
+        self,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        model_elevation: pint.Quantity,
+        correct_elevation: pint.Quantity,
+    ):
+        self._latitudes = np.asarray(latitudes).ravel()
+        self._longitudes = np.asarray(longitudes).ravel()
+        altitude_difference = (correct_elevation - model_elevation).to("m")
+        self._altitude_difference = (
+            np.ravel(altitude_difference.magnitude) * units.meter
+        )
+        self._geopotential = np.ravel(
+            adiabatic_correct.convert_to_geopotential(correct_elevation).magnitude
+        )
+        self._weights: dict[str, BilinearWeights] = {}
+        self._metadata_overrides = _grid_metadata(self._latitudes, self._longitudes)
+
+    def apply(self, fields: ekd.FieldList) -> ekd.FieldList:
+        fields = list(fields)  # type: ignore
+        keys = [
+            field.metadata(["param", "levtype", "valid_datetime", "md5GridSection"])
+            for field in fields
+        ]
+
+        # Temperatures first, as correcting the dew point needs both the original and
+        # the corrected temperature
+        order = sorted(
+            range(len(fields)), key=lambda i: (keys[i][0], keys[i][1]) != ("2t", "sfc")
+        )
+
+        n_points = len(self._latitudes)
+        buffer = np.empty(n_points)
+        original_temperatures = {}
+        corrected_temperatures = {}
+        result = [None] * len(fields)
+        for i in order:
+            field = fields[i]
+            param, levtype, valid_time, grid = keys[i]
+            interpolate = self._weights_for(field, grid)
+
+            # Only correct surface fields
+            if levtype != "sfc" or param not in ("2t", "2d", "sp", "z"):
+                values = interpolate(field.to_numpy())
+            elif param == "2t":
+                original = interpolate(field.to_numpy()) * units.kelvin
+                corrected = adiabatic_correct.correct_temperature(
+                    original, self._altitude_difference
+                )
+                values = np.asarray(corrected.magnitude)
+                original_temperatures[valid_time] = original
+                corrected_temperatures[valid_time] = corrected
+            elif param == "2d":
+                dewpoint = interpolate(field.to_numpy(), out=buffer) * units.kelvin
+                corrected = adiabatic_correct.correct_dewpoint(
+                    original_dewpoint=dewpoint,
+                    original_temperature=original_temperatures[valid_time],
+                    corrected_temperature=corrected_temperatures[valid_time],
+                )
+                values = np.asarray(corrected.magnitude)
+            elif param == "sp":
+                original = pint.Quantity(
+                    interpolate(field.to_numpy(), out=buffer), field.metadata("units")
+                )
+                corrected = adiabatic_correct.correct_surface_pressure(
+                    original, self._altitude_difference
+                )
+                values = np.asarray(corrected.magnitude)
+            else:
+                values = self._geopotential.copy()
+
+            # The output is on the grid of the checkpoint, not that of the input field
+            metadata = field.metadata().override(**self._metadata_overrides)
+            result[i] = ArrayField(values, metadata)
+
+        return ekd.FieldList.from_fields(result)
+
+    def _weights_for(self, field, grid: str) -> BilinearWeights:
+        if grid not in self._weights:
+            latlon = field.to_latlon()
+            self._weights[grid] = BilinearWeights.from_axes(
+                latlon["lat"][:, 0],
+                latlon["lon"][0, :],
+                self._latitudes,
+                self._longitudes,
+            )
+        return self._weights[grid]
+
+
+def _grid_metadata(latitudes: np.ndarray, longitudes: np.ndarray) -> dict:
+    """GRIB keys describing a regular latitude/longitude grid, from the points in row order"""
+    n_points = len(latitudes)
+    columns = int(np.argmax(latitudes != latitudes[0])) or n_points
+    rows = n_points // columns
+    if (
+        rows * columns != n_points
+        or not np.all(latitudes.reshape(rows, columns) == latitudes[::columns, None])
+        or not np.all(longitudes.reshape(rows, columns) == longitudes[:columns])
+    ):
+        raise ValueError(
+            "downscaling with adiabatic corrections needs a regular latitude/longitude grid"
+        )
+    overrides = {
+        "Ni": columns,
+        "Nj": rows,
+        "latitudeOfFirstGridPointInDegrees": float(latitudes[0]),
+        "latitudeOfLastGridPointInDegrees": float(latitudes[-1]),
+        "longitudeOfFirstGridPointInDegrees": float(longitudes[0]),
+        "longitudeOfLastGridPointInDegrees": float(longitudes[columns - 1]),
+    }
+    # The increments of the input grid would otherwise be kept
+    if columns > 1:
+        overrides["iDirectionIncrementInDegrees"] = abs(
+            float(longitudes[1] - longitudes[0])
+        )
+    if rows > 1:
+        overrides["jDirectionIncrementInDegrees"] = abs(
+            float(latitudes[columns] - latitudes[0])
+        )
+    return overrides
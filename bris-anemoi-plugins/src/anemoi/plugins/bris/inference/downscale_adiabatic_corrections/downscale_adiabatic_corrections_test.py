@@ -0,0 +1,152 @@
+import os
+from types import SimpleNamespace
+
+import earthkit.data as ekd
+import metpy.calc
+import numpy as np
+from metpy.units import units
+
+from anemoi.plugins.bris.inference.apply_adiabatic_corrections.apply_adiabatic_corrections import (
+    AdiabaticCorrector,
+)
+from .downscale_adiabatic_corrections import (
+    BilinearWeights,
+    DownscaleAdiabaticCorrectionPreProcessor,
+    DownscalingAdiabaticCorrector,
+)
+
+TEST_DATA = os.path.join(
+    os.path.dirname(__file__), "..", "apply_adiabatic_corrections", "test_data"
+)
+
+
+class AbstractDownscalingAdiabaticCorrectorTest:
+    grib_file = "none.grib"  # Override in subclasses
+
+    def setup_method(self):
+        self.test_data = ekd.from_source(
+            "file", os.path.join(TEST_DATA, self.grib_file)
+        )
+        latlon = self.test_data[0].to_latlon()
+        self.latitudes = latlon["lat"].ravel()
+        self.longitudes = latlon["lon"].ravel()
+
+        self.model_elevation = np.zeros(self.latitudes.shape) * units.meter
+        self.correct_elevation = np.full(self.latitudes.shape, 1000) * units.meter
+
+
+class TestSameGrid(AbstractDownscalingAdiabaticCorrectorTest):
+    """On the input grid, the result is the same as from apply_adiabatic_corrections"""
+
+    grib_file = "1.grib"
+
+    def test_same_as_adiabatic_corrector(self):
+        shape = self.test_data[0].shape
+        expected = AdiabaticCorrector(
+            model_elevation=self.model_elevation.reshape(shape),
+            correct_elevation=self.correct_elevation.reshape(shape),
+        ).apply(
+            self.test_data
+        )  # type: ignore
+        corrected = DownscalingAdiabaticCorrector(
+            self.latitudes,
+            self.longitudes,
+            self.model_elevation,
+            self.correct_elevation,
+        ).apply(
+            self.test_data
+        )  # type: ignore
+
+        assert len(corrected) == len(expected)
+        for e, c in zip(expected, corrected):
+            assert e.metadata("param") == c.metadata("param")
+            assert np.allclose(c.to_numpy(flatten=True), e.to_numpy(flatten=True))
+
+
+class TestDownscaling(AbstractDownscalingAdiabaticCorrectorTest):
+    grib_file = "2.grib"
+
+    def test_cell_centres(self):
+        # points in the middle of the first two grid cells of the first row
+        latitudes = np.array([-12.25, -12.25])
+        longitudes = np.array([35.25, 35.75])
+        elevation = np.zeros(2) * units.meter
+        corrected = DownscalingAdiabaticCorrector(
+            latitudes, longitudes, elevation, elevation
+        ).apply(
+            self.test_data
+        )  # type: ignore
+
+        lsm = self.test_data.sel(param="lsm")[0].to_numpy()
+        expected = [lsm[:2, :2].mean(), lsm[:2, 1:3].mean()]
+        assert np.allclose(corrected.sel(param="lsm")[0].to_numpy(), expected)
+
+    def test_z(self):
+        corrected = DownscalingAdiabaticCorrector(
+            self.latitudes,
+            self.longitudes,
+            self.model_elevation,
+            self.correct_elevation,
+        ).apply(
+            self.test_data
+        )  # type: ignore
+        corrected_z = corrected.sel(param="z").to_numpy(flatten=True)
+        expected_z = metpy.calc.height_to_geopotential(self.correct_elevation).magnitude
+        assert np.allclose(corrected_z, expected_z)
+
+    def test_output_grid(self):
+        # every other point of the input grid
+        shape = self.test_data[0].shape
+        latitudes = self.latitudes.reshape(shape)[::2, ::2]
+        longitudes = self.longitudes.reshape(shape)[::2, ::2]
+        elevation = np.zeros(latitudes.size) * units.meter
+        corrected = DownscalingAdiabaticCorrector(
+            latitudes.ravel(), longitudes.ravel(), elevation, elevation
+        ).apply(
+            self.test_data
+        )  # type: ignore
+
+        for field in corrected:
+            assert field.shape == latitudes.shape
+            grid_latitudes, grid_longitudes = field.grid_points()
+            assert np.allclose(grid_latitudes, latitudes.ravel())
+            assert np.allclose(grid_longitudes, longitudes.ravel())
+
+    def test_pre_processor_state(self):
+        # The checkpoint stores the grid as 2D arrays
+        shape = self.test_data[0].shape
+        latitudes = self.latitudes.reshape(shape)[::2, ::2]
+        longitudes = self.longitudes.reshape(shape)[::2, ::2]
+        elevation = np.zeros(latitudes.shape)
+        context = SimpleNamespace(
+            checkpoint=SimpleNamespace(
+                supporting_arrays={
+                    "lam_0/latitudes": latitudes,
+                    "lam_0/longitudes": longitudes,
+                    "lam_0/model_elevation": elevation,
+                    "lam_0/correct_elevation": elevation,
+                }
+            )
+        )
+        processor = DownscaleAdiabaticCorrectionPreProcessor(context)  # type: ignore
+
+        state = processor.process({"fields": self.test_data})
+
+        assert state["latitudes"].shape == (latitudes.size,)
+        assert state["longitudes"].shape == (longitudes.size,)
+        assert np.array_equal(state["latitudes"], latitudes.ravel())
+        for field in state["fields"]:
+            assert len(field.to_numpy(flatten=True)) == len(state["latitudes"])
+
+
+def test_bilinear_outside():
+    weights = BilinearWeights.from_axes(
+        np.array([2.0, 1.0, 0.0]),
+        np.array([0.0, 1.0, 2.0]),
+        np.array([0.5, 3.0]),
+        np.array([360.5, 1.0]),
+    )
+    values = np.arange(9.0).reshape(3, 3)
+    result = weights(values)
+    assert np.isclose(result[0], 5.0)
+    assert np.isnan(result[1])